@@ -0,0 +1,29 @@
+"""Adiciona coalesced em search_results
+
+Revision ID: 0237e99228f8
+Revises: 309c13f17e07
+Create Date: 2026-10-19 13:26:36.481484
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0237e99228f8'
+down_revision: Union[str, None] = '309c13f17e07'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'search_results',
+        sa.Column('coalesced', sa.Boolean(), nullable=False, server_default=sa.false()),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('search_results', 'coalesced')
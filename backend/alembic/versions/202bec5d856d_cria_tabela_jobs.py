@@ -0,0 +1,49 @@
+"""Cria tabela jobs da fila de jobs no banco
+
+Revision ID: 202bec5d856d
+Revises: ecd2a37a09d9
+Create Date: 2026-10-19 13:12:10.234570
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '202bec5d856d'
+down_revision: Union[str, None] = 'ecd2a37a09d9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'jobs',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('type', sa.String(length=100), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('status', sa.Enum('QUEUED', 'RUNNING', 'FAILED', name='jobstatus'), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('max_attempts', sa.Integer(), nullable=False),
+        sa.Column('run_at', sa.DateTime(), nullable=False),
+        sa.Column('locked_by', sa.String(length=100), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('traceparent', sa.String(length=55), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_jobs_claimable',
+        'jobs',
+        ['type', 'run_at'],
+        unique=False,
+        postgresql_where=sa.text("status <> 'FAILED'"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_jobs_claimable', table_name='jobs')
+    op.drop_table('jobs')
+    sa.Enum(name='jobstatus').drop(op.get_bind(), checkfirst=True)
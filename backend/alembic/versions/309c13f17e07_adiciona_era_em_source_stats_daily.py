@@ -0,0 +1,67 @@
+"""Adiciona era em source_stats_daily
+
+Revision ID: 309c13f17e07
+Revises: 202bec5d856d
+Create Date: 2026-10-19 13:19:23.358027
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '309c13f17e07'
+down_revision: Union[str, None] = '202bec5d856d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'source_stats_daily',
+        sa.Column('era', sa.String(length=10), nullable=False, server_default=''),
+    )
+    op.drop_constraint('source_stats_daily_pkey', 'source_stats_daily', type_='primary')
+    op.create_primary_key(
+        'source_stats_daily_pkey', 'source_stats_daily', ['day', 'source_name', 'target_state', 'era', 'status']
+    )
+    # As linhas existentes ficam sem era; para distribuí-las por era execute
+    # ``python -m app.source_stats rebuild`` após a migração.
+
+
+def downgrade() -> None:
+    # Soma as eras de cada dia, fonte, estado e status antes de remover a coluna
+    op.execute(
+        """
+        UPDATE source_stats_daily AS s SET
+            result_count = t.result_count,
+            duration_ms_sum = t.duration_ms_sum,
+            duration_count = t.duration_count
+        FROM (
+            SELECT day, source_name, target_state, status, min(era) AS era,
+                   sum(result_count) AS result_count, sum(duration_ms_sum) AS duration_ms_sum,
+                   sum(duration_count) AS duration_count
+            FROM source_stats_daily
+            GROUP BY day, source_name, target_state, status
+        ) AS t
+        WHERE s.day = t.day AND s.source_name = t.source_name AND s.target_state = t.target_state
+          AND s.status = t.status AND s.era = t.era
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM source_stats_daily AS s
+        WHERE s.era <> (
+            SELECT min(era) FROM source_stats_daily AS o
+            WHERE o.day = s.day AND o.source_name = s.source_name
+              AND o.target_state = s.target_state AND o.status = s.status
+        )
+        """
+    )
+    op.drop_constraint('source_stats_daily_pkey', 'source_stats_daily', type_='primary')
+    op.drop_column('source_stats_daily', 'era')
+    op.create_primary_key(
+        'source_stats_daily_pkey', 'source_stats_daily', ['day', 'source_name', 'target_state', 'status']
+    )
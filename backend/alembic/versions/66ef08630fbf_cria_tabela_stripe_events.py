@@ -0,0 +1,45 @@
+"""Cria tabela stripe_events
+
+Revision ID: 66ef08630fbf
+Revises: e88269f4c267
+Create Date: 2026-10-19 12:21:39.370371
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '66ef08630fbf'
+down_revision: Union[str, None] = 'e88269f4c267'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'stripe_events',
+        sa.Column('id', sa.String(length=255), nullable=False),
+        sa.Column('type', sa.String(length=100), nullable=False),
+        sa.Column('order_id', sa.Integer(), nullable=True),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('stripe_created', sa.Integer(), nullable=False),
+        sa.Column('received_at', sa.DateTime(), nullable=False),
+        sa.Column('processed_at', sa.DateTime(), nullable=True),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_stripe_events_order_id'), 'stripe_events', ['order_id'], unique=False)
+    op.create_index(
+        'ix_stripe_events_pending', 'stripe_events', ['received_at'], unique=False,
+        postgresql_where=sa.text('processed_at IS NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_stripe_events_pending', table_name='stripe_events')
+    op.drop_index(op.f('ix_stripe_events_order_id'), table_name='stripe_events')
+    op.drop_table('stripe_events')
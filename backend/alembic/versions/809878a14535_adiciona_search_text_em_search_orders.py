@@ -0,0 +1,79 @@
+"""Adiciona search_text em search_orders com índice trigram
+
+Revision ID: 809878a14535
+Revises: e6936b95c22a
+Create Date: 2026-10-19 12:57:44.987656
+
+"""
+import unicodedata
+from typing import Optional, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '809878a14535'
+down_revision: Union[str, None] = 'e6936b95c22a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _search_text(*values: Optional[str]) -> str:
+    parts = []
+    for value in values:
+        folded = unicodedata.normalize('NFKD', value or '').encode('ascii', 'ignore').decode()
+        folded = ' '.join(folded.lower().split())
+        if folded:
+            parts.append(folded)
+    return ' '.join(parts)
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    op.add_column('search_orders', sa.Column('search_text', sa.Text(), nullable=True))
+    op.create_index('ix_search_orders_user_id_id', 'search_orders', ['user_id', 'id'], unique=False)
+
+    # Preenche search_text dos pedidos existentes em lotes, com a mesma
+    # normalização de app.utils.text.search_text (sem importar o app).
+    orders = sa.table(
+        'search_orders',
+        sa.column('id', sa.Integer),
+        sa.column('target_name', sa.String),
+        sa.column('target_city', sa.String),
+        sa.column('target_parents_names', sa.String),
+        sa.column('search_text', sa.Text),
+    )
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(orders.c.id, orders.c.target_name, orders.c.target_city, orders.c.target_parents_names)
+            .where(orders.c.id > last_id)
+            .order_by(orders.c.id)
+            .limit(5000)
+        ).all()
+        if not rows:
+            break
+        bind.execute(
+            orders.update().where(orders.c.id == sa.bindparam('order_id')).values(search_text=sa.bindparam('text')),
+            [{'order_id': row.id, 'text': _search_text(*row[1:])} for row in rows],
+        )
+        last_id = rows[-1].id
+
+    if bind.dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.create_index(
+            'ix_search_orders_search_text_trgm',
+            'search_orders',
+            ['search_text'],
+            unique=False,
+            postgresql_using='gin',
+            postgresql_ops={'search_text': 'gin_trgm_ops'},
+        )
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name == 'postgresql':
+        op.drop_index('ix_search_orders_search_text_trgm', table_name='search_orders')
+    op.drop_index('ix_search_orders_user_id_id', table_name='search_orders')
+    op.drop_column('search_orders', 'search_text')
@@ -0,0 +1,33 @@
+"""Adiciona NOT_APPLICABLE em resultstatus
+
+Revision ID: ac3b9513c7b6
+Revises: c7bc720b138b
+Create Date: 2026-10-19 12:43:18.740742
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ac3b9513c7b6'
+down_revision: Union[str, None] = 'c7bc720b138b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ALTER TYPE ... ADD VALUE não pode rodar dentro de uma transação em
+    # versões antigas do PostgreSQL.
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE resultstatus ADD VALUE IF NOT EXISTS 'NOT_APPLICABLE'")
+
+
+def downgrade() -> None:
+    # O PostgreSQL não remove valores de um enum; os resultados marcados
+    # como NOT_APPLICABLE passam a NOT_FOUND.  Rode
+    # ``python -m app.source_stats rebuild`` depois para recontá-los.
+    op.execute("UPDATE search_results SET status = 'NOT_FOUND' WHERE status = 'NOT_APPLICABLE'")
+    op.execute("DELETE FROM source_stats_daily WHERE status = 'NOT_APPLICABLE'")
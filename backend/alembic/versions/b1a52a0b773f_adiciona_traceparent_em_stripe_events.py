@@ -0,0 +1,26 @@
+"""Adiciona traceparent em stripe_events
+
+Revision ID: b1a52a0b773f
+Revises: 66ef08630fbf
+Create Date: 2026-10-19 12:28:52.493828
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b1a52a0b773f'
+down_revision: Union[str, None] = '66ef08630fbf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('stripe_events', sa.Column('traceparent', sa.String(length=55), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('stripe_events', 'traceparent')
@@ -0,0 +1,33 @@
+"""Adiciona SKIPPED em resultstatus
+
+Revision ID: bbe40d316225
+Revises: e9cbca7bbbd4
+Create Date: 2026-10-19 13:41:02.728398
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'bbe40d316225'
+down_revision: Union[str, None] = 'e9cbca7bbbd4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ALTER TYPE ... ADD VALUE não pode rodar dentro de uma transação em
+    # versões antigas do PostgreSQL.
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE resultstatus ADD VALUE IF NOT EXISTS 'SKIPPED'")
+
+
+def downgrade() -> None:
+    # O PostgreSQL não remove valores de um enum; as fontes cortadas pelo
+    # escalonador voltam a ser NOT_APPLICABLE.  Rode
+    # ``python -m app.source_stats rebuild`` depois para recontá-las.
+    op.execute("UPDATE search_results SET status = 'NOT_APPLICABLE' WHERE status = 'SKIPPED'")
+    op.execute("DELETE FROM source_stats_daily WHERE status = 'SKIPPED'")
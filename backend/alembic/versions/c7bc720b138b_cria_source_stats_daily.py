@@ -0,0 +1,55 @@
+"""Cria source_stats_daily e duration_ms em search_results
+
+Revision ID: c7bc720b138b
+Revises: b1a52a0b773f
+Create Date: 2026-10-19 12:36:05.617285
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7bc720b138b'
+down_revision: Union[str, None] = 'b1a52a0b773f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('search_results', sa.Column('duration_ms', sa.Integer(), nullable=True))
+    op.create_table(
+        'source_stats_daily',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('source_name', sa.String(length=255), nullable=False),
+        sa.Column('target_state', sa.String(length=100), nullable=False),
+        # Reaproveita o tipo enum já usado por search_results.status
+        sa.Column(
+            'status',
+            postgresql.ENUM('FOUND', 'NOT_FOUND', 'SOURCE_UNAVAILABLE', 'ERROR', name='resultstatus', create_type=False),
+            nullable=False,
+        ),
+        sa.Column('result_count', sa.Integer(), nullable=False),
+        sa.Column('duration_ms_sum', sa.BigInteger(), nullable=False),
+        sa.Column('duration_count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('day', 'source_name', 'target_state', 'status'),
+    )
+    # Reconstrói as estatísticas a partir do histórico existente
+    op.execute(
+        """
+        INSERT INTO source_stats_daily
+            (day, source_name, target_state, status, result_count, duration_ms_sum, duration_count)
+        SELECT date(r.timestamp), r.source_name, trim(coalesce(o.target_state, '')), r.status,
+               count(*), 0, 0
+        FROM search_results r JOIN search_orders o ON o.id = r.order_id
+        GROUP BY date(r.timestamp), r.source_name, trim(coalesce(o.target_state, '')), r.status
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('source_stats_daily')
+    op.drop_column('search_results', 'duration_ms')
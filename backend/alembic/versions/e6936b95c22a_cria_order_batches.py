@@ -0,0 +1,59 @@
+"""Cria order_batches e batch_id em search_orders e stripe_events
+
+Revision ID: e6936b95c22a
+Revises: ac3b9513c7b6
+Create Date: 2026-10-19 12:50:31.864199
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e6936b95c22a'
+down_revision: Union[str, None] = 'ac3b9513c7b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'order_batches',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column(
+            'status',
+            sa.Enum('PENDING_PAYMENT', 'PROCESSING', 'COMPLETED', name='batchstatus'),
+            nullable=False,
+        ),
+        sa.Column('order_count', sa.Integer(), nullable=False),
+        sa.Column('total_price', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('completed_at', sa.DateTime(), nullable=True),
+        sa.Column('stripe_session_id', sa.String(length=255), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id']),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_order_batches_id'), 'order_batches', ['id'], unique=False)
+    op.create_index(op.f('ix_order_batches_user_id'), 'order_batches', ['user_id'], unique=False)
+    op.add_column('search_orders', sa.Column('batch_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_search_orders_batch_id'), 'search_orders', ['batch_id'], unique=False)
+    op.create_foreign_key(
+        'fk_search_orders_batch_id_order_batches', 'search_orders', 'order_batches', ['batch_id'], ['id']
+    )
+    op.add_column('stripe_events', sa.Column('batch_id', sa.Integer(), nullable=True))
+    op.create_index(op.f('ix_stripe_events_batch_id'), 'stripe_events', ['batch_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_stripe_events_batch_id'), table_name='stripe_events')
+    op.drop_column('stripe_events', 'batch_id')
+    op.drop_constraint('fk_search_orders_batch_id_order_batches', 'search_orders', type_='foreignkey')
+    op.drop_index(op.f('ix_search_orders_batch_id'), table_name='search_orders')
+    op.drop_column('search_orders', 'batch_id')
+    op.drop_index(op.f('ix_order_batches_user_id'), table_name='order_batches')
+    op.drop_index(op.f('ix_order_batches_id'), table_name='order_batches')
+    op.drop_table('order_batches')
+    sa.Enum(name='batchstatus').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,26 @@
+"""Adiciona orders_version em users
+
+Revision ID: e88269f4c267
+Revises: 08b9708b416c
+Create Date: 2026-10-19 12:14:26.246914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e88269f4c267'
+down_revision: Union[str, None] = '08b9708b416c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('users', sa.Column('orders_version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'orders_version')
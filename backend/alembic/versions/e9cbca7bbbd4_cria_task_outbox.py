@@ -0,0 +1,38 @@
+"""Cria tabela task_outbox
+
+Revision ID: e9cbca7bbbd4
+Revises: 0237e99228f8
+Create Date: 2026-10-19 13:33:49.604941
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e9cbca7bbbd4'
+down_revision: Union[str, None] = '0237e99228f8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'task_outbox',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('task', sa.String(length=255), nullable=False),
+        sa.Column('payload', sa.Text(), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('available_at', sa.DateTime(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+        sa.Column('traceparent', sa.String(length=55), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_task_outbox_available_at'), 'task_outbox', ['available_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_task_outbox_available_at'), table_name='task_outbox')
+    op.drop_table('task_outbox')
@@ -0,0 +1,26 @@
+"""Adiciona version em search_orders
+
+Revision ID: ecd2a37a09d9
+Revises: 809878a14535
+Create Date: 2026-10-19 13:04:57.111113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ecd2a37a09d9'
+down_revision: Union[str, None] = '809878a14535'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('search_orders', sa.Column('version', sa.Integer(), server_default='0', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('search_orders', 'version')
@@ -0,0 +1,208 @@
+"""
+Admission control and load shedding per route class.
+
+Every request is assigned to a route class by its path prefix.  Each
+class has its own concurrency limit and bounded FIFO queue, so a burst
+of logins or large order listings cannot take capacity away from the
+Stripe webhook or the robots' internal endpoints, which get dedicated
+slots and longer latency budgets.
+
+A request that cannot start immediately is queued only if its estimated
+wait (queue position times the class's recent service time, divided by
+the concurrency) fits in the class's latency budget; otherwise, or if
+the queue is full, it is rejected at once with 503 and ``Retry-After``.
+Queued requests that still exceed the budget are rejected when it
+expires.  ``AdmissionController.snapshot`` exposes the current queue
+depths for monitoring.
+
+The streaming order export and ``/internal/profile`` run for seconds to
+a minute by design.  They form a class of their own with no queue, so
+they neither hold slots of the short requests next to them nor feed
+their durations into a service-time estimate.
+"""
+import asyncio
+import json
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Tuple
+
+from .config import Settings
+
+
+@dataclass(frozen=True)
+class RouteClass:
+    """Admission parameters for a group of routes."""
+
+    name: str
+    prefixes: Tuple[str, ...]
+    concurrency: int
+    queue_size: int
+    latency_budget: float
+    # Whether durations feed the service-time estimate; off for routes
+    # whose duration says nothing about load (streams, profiling).
+    track_service_time: bool = True
+
+
+class Rejected(Exception):
+    """Raised when a request is shed instead of admitted."""
+
+
+class _Limiter:
+    """FIFO concurrency limiter with a bounded queue for one route class."""
+
+    def __init__(self, route_class: RouteClass) -> None:
+        self.route_class = route_class
+        self.active = 0
+        self.rejected = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        # Exponentially weighted average of request service time, used to
+        # estimate queueing delay before admitting a request to the queue.
+        self._service_time = 0.05
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        rc = self.route_class
+        if self.active < rc.concurrency and not self._waiters:
+            self.active += 1
+            return
+        estimated_wait = (len(self._waiters) + 1) * self._service_time / rc.concurrency
+        if len(self._waiters) >= rc.queue_size or estimated_wait > rc.latency_budget:
+            self.rejected += 1
+            raise Rejected()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout=rc.latency_budget)
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as the budget expired
+                return
+            waiter.cancel()
+            self._remove(waiter)
+            self.rejected += 1
+            raise Rejected()
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(0.0)
+            else:
+                waiter.cancel()
+                self._remove(waiter)
+            raise
+
+    def release(self, elapsed: float) -> None:
+        if elapsed and self.route_class.track_service_time:
+            self._service_time = 0.9 * self._service_time + 0.1 * elapsed
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand the slot directly to the next queued request
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def _remove(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+
+class AdmissionController:
+    """Maps request paths to route classes and their limiters."""
+
+    def __init__(self, route_classes: List[RouteClass], default: RouteClass) -> None:
+        self._limiters: Dict[str, _Limiter] = {
+            rc.name: _Limiter(rc) for rc in [*route_classes, default]
+        }
+        self._routes = [(prefix, self._limiters[rc.name]) for rc in route_classes for prefix in rc.prefixes]
+        self._default = self._limiters[default.name]
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "AdmissionController":
+        queue = settings.admission_queue_size
+        budget = settings.admission_latency_budget_seconds
+        priority_budget = settings.admission_priority_latency_budget_seconds
+        return cls(
+            [
+                # Listed first: these prefixes lie within those of "orders" and "internal"
+                RouteClass(
+                    "long_running",
+                    ("/orders/export", "/internal/profile"),
+                    settings.admission_long_running_concurrency,
+                    0,
+                    budget,
+                    track_service_time=False,
+                ),
+                RouteClass("webhooks", ("/webhooks",), settings.admission_webhooks_concurrency, queue, priority_budget),
+                RouteClass("internal", ("/internal",), settings.admission_internal_concurrency, queue, priority_budget),
+                RouteClass("auth", ("/auth",), settings.admission_auth_concurrency, queue, budget),
+                RouteClass(
+                    "orders", ("/orders", "/users", "/checkout"), settings.admission_orders_concurrency, queue, budget
+                ),
+            ],
+            RouteClass("default", (), settings.admission_default_concurrency, queue, budget),
+        )
+
+    def limiter_for(self, path: str) -> _Limiter:
+        for prefix, limiter in self._routes:
+            if path.startswith(prefix):
+                return limiter
+        return self._default
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        """Return current load per route class."""
+        return {
+            name: {
+                "active": limiter.active,
+                "queued": limiter.queued,
+                "concurrency": limiter.route_class.concurrency,
+                "queue_size": limiter.route_class.queue_size,
+                "rejected_total": limiter.rejected,
+            }
+            for name, limiter in self._limiters.items()
+        }
+
+
+class AdmissionControlMiddleware:
+    """ASGI middleware applying an ``AdmissionController`` to HTTP requests."""
+
+    def __init__(self, app, controller: AdmissionController) -> None:
+        self.app = app
+        self.controller = controller
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        limiter = self.controller.limiter_for(scope["path"])
+        try:
+            await limiter.acquire()
+        except Rejected:
+            await _send_overloaded(send, limiter.route_class.name)
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - started)
+
+
+async def _send_overloaded(send, route_class: str) -> None:
+    body = json.dumps({"detail": "Servidor sobrecarregado, tente novamente em instantes"}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", b"1"),
+                (b"x-admission-class", route_class.encode()),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
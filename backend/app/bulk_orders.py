@@ -0,0 +1,224 @@
+"""
+Bulk import of search orders.
+
+``POST /orders/bulk`` accepts a CSV file (with a header row naming
+``SearchOrderCreate`` fields) or NDJSON (one JSON object per line) as
+the raw request body.  The body is decoded and split into records as it
+arrives, so an upload is never held in memory: each record is validated
+against ``schemas.SearchOrderCreate`` and valid rows are spooled to a
+temporary file (in memory up to ``SPOOL_MEMORY_BYTES``, on disk beyond).
+Only once the upload is complete are the rows inserted, in multi-row
+``INSERT`` statements of ``bulk_order_insert_batch_size`` rows, so the
+write transaction does not stay open for as long as a slow client takes
+to upload.
+
+All orders of an upload belong to one ``OrderBatch``, which is paid with
+a single Stripe checkout and processed by one
+``process_search_batch_task``.  Invalid rows are reported per line and
+skipped; the batch is only created if at least one row is valid.
+"""
+import codecs
+import csv
+import json
+import tempfile
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, schemas
+from .config import get_settings
+
+
+# Valid rows beyond this size are spooled to disk
+SPOOL_MEMORY_BYTES = 1 << 20
+# Longest record accepted; guards against unterminated lines and quotes
+MAX_RECORD_CHARS = 64 * 1024
+
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+    "application/x-jsonlines": "ndjson",
+}
+
+Record = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+
+class BulkImportError(Exception):
+    """Raised when an upload cannot be imported at all."""
+
+    def __init__(self, status_code: int, detail: str) -> None:
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class BulkImport:
+    """Outcome of an import."""
+
+    batch: Optional[models.OrderBatch] = None
+    accepted: int = 0
+    rejected: int = 0
+    total_price: float = 0.0
+    errors: List[dict] = field(default_factory=list)
+
+
+def format_for(content_type: Optional[str]) -> Optional[str]:
+    """Return ``"csv"`` or ``"ndjson"`` for a ``Content-Type`` header."""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return CONTENT_TYPES.get(media_type)
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode UTF-8 ``chunks`` (with or without BOM) into lines."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    try:
+        async for chunk in chunks:
+            pending += decoder.decode(chunk)
+            if "\n" not in pending:
+                if len(pending) > MAX_RECORD_CHARS:
+                    raise BulkImportError(400, "Linha muito longa no arquivo enviado.")
+                continue
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                yield line.rstrip("\r")
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise BulkImportError(400, "O arquivo deve estar codificado em UTF-8.")
+    if pending.rstrip("\r"):
+        yield pending.rstrip("\r")
+
+
+async def _csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Record]:
+    header: Optional[List[str]] = None
+    parts: List[str] = []
+    start = line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not parts:
+            start = line_number
+        parts.append(line)
+        text = "\n".join(parts)
+        # An odd number of quotes means a quoted field continues on the next line
+        if text.count('"') % 2:
+            if len(text) > MAX_RECORD_CHARS:
+                raise BulkImportError(400, f"Campo entre aspas não terminado na linha {start}.")
+            continue
+        parts.clear()
+        if not text.strip():
+            continue
+        row = next(csv.reader([text]))
+        if header is None:
+            header = [name.strip().lower() for name in row]
+            missing = {"target_name", "order_price"} - set(header)
+            if missing:
+                raise BulkImportError(400, f"Colunas obrigatórias ausentes: {', '.join(sorted(missing))}")
+            continue
+        if len(row) > len(header):
+            yield start, None, f"a linha tem {len(row)} colunas, o cabeçalho tem {len(header)}"
+            continue
+        # Empty cells are missing values, not empty strings
+        yield start, {name: value for name, value in zip(header, row) if value.strip()}, None
+    if parts:
+        yield start, None, "campo entre aspas não terminado"
+    if header is None:
+        raise BulkImportError(400, "O arquivo está vazio.")
+
+
+async def _ndjson_records(lines: AsyncIterator[str]) -> AsyncIterator[Record]:
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+        except ValueError as exc:
+            yield line_number, None, f"JSON inválido: {exc}"
+            continue
+        if not isinstance(data, dict):
+            yield line_number, None, "cada linha deve ser um objeto JSON"
+            continue
+        yield line_number, data, None
+
+
+def records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Record]:
+    """Yield ``(line, data, error)`` for each record of an upload."""
+    lines = iter_lines(chunks)
+    return _csv_records(lines) if fmt == "csv" else _ndjson_records(lines)
+
+
+def _describe(exc: ValidationError) -> List[str]:
+    return [
+        f"{'.'.join(str(part) for part in error['loc']) or 'linha'}: {error['msg']}" for error in exc.errors()
+    ]
+
+
+async def import_orders(
+    session: AsyncSession, user_id: int, chunks: AsyncIterator[bytes], fmt: str
+) -> BulkImport:
+    """Validate and insert the orders of an upload as one batch.  Does not commit.
+
+    Raises ``BulkImportError`` if the upload is malformed as a whole or
+    exceeds ``bulk_order_max_rows``.
+    """
+    settings = get_settings()
+    outcome = BulkImport()
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES, mode="w+b") as spool:
+        async for line, data, error in records(chunks, fmt):
+            if outcome.accepted + outcome.rejected >= settings.bulk_order_max_rows:
+                raise BulkImportError(413, f"O arquivo excede o limite de {settings.bulk_order_max_rows} pedidos.")
+            messages = [error] if error else []
+            if data is not None:
+                try:
+                    order = schemas.SearchOrderCreate.model_validate(data)
+                except ValidationError as exc:
+                    messages = _describe(exc)
+            if messages:
+                outcome.rejected += 1
+                if len(outcome.errors) < settings.bulk_order_max_errors:
+                    outcome.errors.append({"line": line, "errors": messages})
+                continue
+            outcome.accepted += 1
+            outcome.total_price += order.order_price
+            spool.write(order.model_dump_json().encode() + b"\n")
+
+        if not outcome.accepted:
+            return outcome
+        batch = models.OrderBatch(
+            user_id=user_id,
+            status=models.BatchStatus.PENDING_PAYMENT,
+            order_count=outcome.accepted,
+            total_price=round(outcome.total_price, 2),
+        )
+        session.add(batch)
+        await session.flush()
+
+        spool.seek(0)
+        now = datetime.utcnow()
+        rows: List[dict] = []
+        for raw in spool:
+            rows.append(
+                {
+                    **json.loads(raw),
+                    "user_id": user_id,
+                    "batch_id": batch.id,
+                    "status": models.OrderStatus.PENDING_PAYMENT,
+                    "created_at": now,
+                }
+            )
+            if len(rows) >= settings.bulk_order_insert_batch_size:
+                await session.execute(insert(models.SearchOrder), rows)
+                rows = []
+        if rows:
+            await session.execute(insert(models.SearchOrder), rows)
+    outcome.batch = batch
+    return outcome
@@ -9,7 +9,7 @@ provided for development convenience but should be overridden via a
 ``.env`` file or environment variables in production.
 """
 from functools import lru_cache
-from typing import Optional
+from typing import Dict, Literal, Optional
 
 from pydantic_settings import BaseSettings
 from pydantic import validator
@@ -21,6 +21,25 @@ class Settings(BaseSettings):
 
     # Database
     database_url: str = "postgresql+asyncpg://postgres:q7z9p1m3aGmT@db:5432/raizdigital"
+    # Connection pool of each engine (primary and every replica).  The
+    # statement cache size applies to asyncpg; set it to 0 behind a
+    # transaction-pooling PgBouncer.
+    database_pool_size: int = 5
+    database_max_overflow: int = 10
+    database_pool_timeout_seconds: float = 30.0
+    database_pool_recycle_seconds: int = 1_800
+    database_statement_cache_size: int = 100
+
+    # Read replicas (see ``app.replicas``): comma-separated URLs.  Read-only
+    # endpoints use them round-robin while their health check passes and
+    # their lag stays under ``database_replica_max_lag_seconds``; a user's
+    # reads go to the primary for ``database_read_your_writes_seconds``
+    # after that user writes.
+    database_replica_urls: str = ""
+    database_replica_health_check_seconds: float = 5.0
+    database_replica_health_timeout_seconds: float = 2.0
+    database_replica_max_lag_seconds: float = 5.0
+    database_read_your_writes_seconds: float = 10.0
 
     # Security
     secret_key: str = "CHANGE_ME"
@@ -31,12 +50,163 @@ class Settings(BaseSettings):
     stripe_api_key: str = ""
     stripe_webhook_secret: str = ""
     stripe_price_id: Optional[str] = None
+    # Override the Stripe API host, e.g. http://localhost:12111 when
+    # running ``app.stripe_stub`` for offline development.
+    stripe_api_base: Optional[str] = None
+    stripe_timeout_seconds: float = 10.0
+    stripe_max_network_retries: int = 2
+
+    # Password hashing.  bcrypt runs in a dedicated thread pool; calls
+    # beyond ``workers + max_pending`` are rejected with 503 instead of
+    # queueing behind a login burst.  Use ``python -m
+    # app.utils.calibrate_bcrypt`` to pick ``bcrypt_rounds``.
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 4
+    password_hash_max_pending: int = 16
+
+    # Admission control (see ``app.admission``).  Each route class gets
+    # its own concurrency limit; webhooks and internal endpoints have a
+    # longer latency budget so they are shed last.  Order exports and
+    # profiles share ``admission_long_running_concurrency`` slots and are
+    # rejected, not queued, when those are taken.
+    admission_control_enabled: bool = True
+    admission_webhooks_concurrency: int = 32
+    admission_internal_concurrency: int = 16
+    admission_auth_concurrency: int = 8
+    admission_orders_concurrency: int = 32
+    admission_default_concurrency: int = 16
+    admission_long_running_concurrency: int = 4
+    admission_queue_size: int = 64
+    admission_latency_budget_seconds: float = 1.5
+    admission_priority_latency_budget_seconds: float = 8.0
+
+    # Stripe webhook inbox consumer (see ``app.webhook_inbox``)
+    webhook_consumer_enabled: bool = True
+    webhook_inbox_batch_size: int = 100
+    webhook_inbox_poll_seconds: float = 5.0
+
+    # Metrics.  Set PROMETHEUS_MULTIPROC_DIR in the environment to
+    # aggregate samples across worker processes; a non-zero
+    # ``worker_metrics_port`` makes Celery workers serve /metrics too.
+    metrics_enabled: bool = True
+    worker_metrics_port: int = 0
+
+    # Tracing (see ``app.tracing``): "none", "stdout" or "file"
+    tracing_exporter: str = "none"
+    tracing_file: str = "traces.jsonl"
+
+    # Profiling.  A non-zero ``task_profile_slowest_percent`` samples every
+    # process_search_order_task run and keeps the collapsed stacks of the
+    # slowest N percent in ``task_profile_dir``.
+    profile_max_seconds: int = 60
+    task_profile_slowest_percent: float = 0.0
+    task_profile_dir: str = "profiles"
+    task_profile_interval_ms: int = 10
+
+    # Adaptive source scheduling (see ``app.robots.scheduler``).  Sources
+    # are ordered by hit probability per second of latency, estimated from
+    # the last ``source_scheduler_window_days`` of ``source_stats_daily``
+    # for the order's state and birth-year era; sources scoring under
+    # ``source_scheduler_min_hits_per_second``, or past the best
+    # ``source_scheduler_max_sources`` (0: no limit), are not queried.  A
+    # fraction ``source_scheduler_epsilon`` of orders queries every source
+    # in a random order to keep the estimates fresh.  With
+    # ``search_stop_on_first_hit`` the remaining sources are skipped once
+    # one finds the certificate.
+    source_scheduler_enabled: bool = True
+    source_scheduler_epsilon: float = 0.1
+    source_scheduler_window_days: int = 30
+    source_scheduler_min_samples: int = 20
+    source_scheduler_refresh_seconds: int = 300
+    source_scheduler_min_hits_per_second: float = 0.01
+    source_scheduler_max_sources: int = 0
+    search_stop_on_first_hit: bool = False
+
+    # Coalescing of identical concurrent source lookups (see
+    # ``app.robots.singleflight``).  The lock bounds how long followers
+    # wait for a leader before searching themselves.
+    singleflight_enabled: bool = True
+    singleflight_lock_seconds: int = 180
+    singleflight_result_ttl_seconds: int = 30
+
+    # Bulk order import (POST /orders/bulk, see ``app.bulk_orders``).
+    # Rows are inserted ``bulk_order_insert_batch_size`` at a time; paid
+    # batches run up to ``bulk_task_concurrency`` orders at once in one
+    # worker task.  A batch with failed orders is retried on Celery up to
+    # ``bulk_task_max_retries`` times (backoff doubling from
+    # ``bulk_task_retry_seconds``; the job queue uses its own settings),
+    # after which the failed orders are completed as not found.
+    bulk_order_max_rows: int = 5_000
+    bulk_order_insert_batch_size: int = 500
+    bulk_order_max_errors: int = 100
+    bulk_task_concurrency: int = 8
+    bulk_task_max_retries: int = 3
+    bulk_task_retry_seconds: float = 60.0
+
+    # Celery search tasks are acknowledged after they run, so a task whose
+    # worker dies is delivered again.  A failed search is retried up to
+    # ``search_task_max_retries`` times (backoff doubling from
+    # ``search_task_retry_seconds``) with the order version it claimed.
+    search_task_max_retries: int = 3
+    search_task_retry_seconds: float = 30.0
+
+    # Run search tasks on a virtual-time loop (see ``app.robots.clock``).
+    # Only meant for tests and simulations: source latencies take no time.
+    robots_virtual_time: bool = False
+
+    # Task publishing from the API (see ``app.task_publisher``).  Handlers
+    # wait once ``task_publisher_max_pending`` messages are queued; failed
+    # publishes are retried with a backoff doubling up to the maximum; on
+    # shutdown queued messages get up to the timeout to reach the broker.
+    task_publisher_max_pending: int = 1_000
+    task_publisher_batch_size: int = 100
+    task_publisher_retry_backoff_seconds: float = 0.5
+    task_publisher_retry_backoff_max_seconds: float = 30.0
+    task_publisher_shutdown_timeout_seconds: float = 10.0
+
+    # Task outbox (see ``app.task_outbox``): a relay holds the rows it is
+    # publishing for this long before another relay may take them.
+    task_outbox_lease_seconds: float = 60.0
+
+    # Task backend: "celery" (Redis broker and Celery workers) or
+    # "jobqueue" (jobs stored in the database, see ``app.jobqueue``).  With
+    # ``jobqueue_embedded`` every API process runs jobs too; otherwise run
+    # ``python -m app.jobqueue``.  Concurrency is per job type.  Failed jobs
+    # are retried with exponential backoff, and a running job whose worker
+    # stops renewing it is claimed again after the visibility timeout.  On
+    # shutdown running jobs get ``jobqueue_shutdown_timeout_seconds`` to
+    # finish before they are interrupted and queued again.
+    task_backend: Literal["celery", "jobqueue"] = "celery"
+    jobqueue_embedded: bool = True
+    jobqueue_concurrency: Dict[str, int] = {
+        "process_search_order_task": 8,
+        "process_search_batch_task": 2,
+        "send_email_task": 4,
+    }
+    jobqueue_max_attempts: int = 5
+    jobqueue_retry_backoff_seconds: float = 5.0
+    jobqueue_retry_backoff_max_seconds: float = 600.0
+    jobqueue_visibility_timeout_seconds: float = 60.0
+    jobqueue_poll_seconds: float = 5.0
+    jobqueue_shutdown_timeout_seconds: float = 30.0
 
     # Celery / Redis
     redis_url: str = "redis://redis:6379/0"
     celery_broker_url: Optional[str] = None
     celery_result_backend: Optional[str] = None
 
+    # Caching.  Redis is used as a shared second level behind small
+    # in-process caches; the timeout bounds how long a request may wait
+    # on Redis before falling back to the database.
+    redis_cache_timeout_seconds: float = 0.05
+    user_cache_ttl_seconds: int = 60
+    user_cache_max_entries: int = 10_000
+    token_cache_ttl_seconds: int = 300
+    token_cache_max_entries: int = 20_000
+    # Serialised order lists, keyed by ``User.orders_version``
+    orders_cache_ttl_seconds: int = 300
+    orders_cache_max_entries: int = 2_000
+
     # Internal API key for robot to submit results
     internal_api_key: str = "CHANGE_ME_INTERNAL"
 
@@ -7,14 +7,30 @@ function ``init_db`` can be called at startup to run asynchronous
 migrations or to create initial tables if using SQLAlchemy's
 ``metadata.create_all``.  In a production deployment, migrations
 should be handled via Alembic.
+
+PostgreSQL is the production database; SQLite (through ``aiosqlite``) is
+supported as a local stand-in for benchmarks and development.
+
+``replica_engines`` holds one engine per ``database_replica_urls``
+entry; ``replicas`` routes read-only sessions to them.  Sessions note in
+``session.info`` whether they wrote, and ``get_session`` records writes
+of the authenticated user (``info["user_id"]``, set by
+``get_current_user``) so that user's next reads stay on the primary.
 """
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict, List
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy import event, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
 from sqlalchemy.ext.asyncio import async_sessionmaker as _async_sessionmaker
-from sqlalchemy.orm import declarative_base
+from sqlalchemy.orm import ORMExecuteState, Session, declarative_base
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from .config import get_settings
+from .metrics import InstrumentedPool, instrument_pool
+from .tracing import instrument_engine
+from .utils.recent_writes import record_write
 
 
 settings = get_settings()
@@ -22,11 +38,54 @@ settings = get_settings()
 # Base class for our ORM models
 Base = declarative_base()
 
+
+def _engine_options(url: str, poolclass: type) -> Dict[str, Any]:
+    # In-memory SQLite needs its own single-connection pool
+    if ":memory:" in url:
+        return {}
+    options: Dict[str, Any] = {
+        "poolclass": poolclass,
+        "pool_size": settings.database_pool_size,
+        "max_overflow": settings.database_max_overflow,
+        "pool_timeout": settings.database_pool_timeout_seconds,
+        "pool_recycle": settings.database_pool_recycle_seconds,
+    }
+    if make_url(url).get_driver_name() == "asyncpg":
+        # SQLAlchemy's prepared statements and asyncpg's own cache
+        cache_size = settings.database_statement_cache_size
+        options["connect_args"] = {"prepared_statement_cache_size": cache_size, "statement_cache_size": cache_size}
+    return options
+
+
 # Create the asynchronous engine
-engine = create_async_engine(
-    settings.database_url,
-    echo=False,
-)
+engine = create_async_engine(settings.database_url, echo=False, **_engine_options(settings.database_url, InstrumentedPool))
+instrument_pool(engine.sync_engine)
+instrument_engine(engine.sync_engine)
+
+# Replicas keep the default pool so the pool metrics describe the primary
+replica_engines: List[AsyncEngine] = [
+    create_async_engine(url, echo=False, **_engine_options(url, AsyncAdaptedQueuePool))
+    for url in (url.strip() for url in settings.database_replica_urls.split(","))
+    if url
+]
+for _replica in replica_engines:
+    instrument_engine(_replica.sync_engine)
+
+if engine.dialect.name == "sqlite":
+    # Let SQLAlchemy, not the sqlite3 module, emit BEGIN so that
+    # SAVEPOINTs (``session.begin_nested``) behave as on PostgreSQL.
+    # IMMEDIATE transactions wait for the write lock up front instead of
+    # failing with "database is locked" when upgrading a read lock.
+    @event.listens_for(engine.sync_engine, "connect")
+    def _sqlite_connect(dbapi_connection, connection_record):  # type: ignore[no-untyped-def]
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _sqlite_begin(conn):  # type: ignore[no-untyped-def]
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
 
 # Create an asynchronous session factory
 async_session_maker = _async_sessionmaker(
@@ -36,18 +95,43 @@ async_session_maker = _async_sessionmaker(
 )
 
 
+
+@event.listens_for(Session, "after_flush")
+def _note_flush(session: Session, flush_context) -> None:  # type: ignore[no-untyped-def]
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _note_dml(state: ORMExecuteState) -> None:
+    if state.is_insert or state.is_update or state.is_delete:
+        state.session.info["wrote"] = True
+
+
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     """FastAPI dependency that yields a transactional SQLAlchemy session."""
     async with async_session_maker() as session:
         try:
             yield session
         finally:
+            user_id = session.info.get("user_id")
+            if replica_engines and user_id is not None and session.info.get("wrote"):
+                await record_write(user_id)
             await session.close()
 
 
+def dialect_insert(table):
+    """Return an ``INSERT`` supporting ``on_conflict_*`` for the current backend."""
+    if engine.dialect.name == "sqlite":
+        return sqlite.insert(table)
+    return postgresql.insert(table)
+
+
 async def init_db() -> None:
     """Initialise database (e.g. create tables) in an asynchronous context."""
     # In a real project, use Alembic for migrations. For development,
     # we can create all tables automatically.
     async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # Needed by the trigram index of search_orders.search_text
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
         await conn.run_sync(Base.metadata.create_all)
@@ -2,8 +2,16 @@
 FastAPI dependencies used across routers.
 
 This module provides helpers for retrieving the current authenticated
-user based on a JWT token passed in the ``Authorization`` header.
+user based on a JWT token passed in the ``Authorization`` header.  The
+user is served from ``utils.user_cache`` whenever possible so that most
+requests do not query the ``users`` table at all.
+
+Read-only handlers take ``get_read_session`` and
+``get_current_user_for_read`` instead, which use a read replica when one
+is available (see ``replicas``).
 """
+from typing import AsyncGenerator
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 
@@ -11,21 +19,15 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import models
 from .database import get_session
+from .replicas import read_session
 from .utils.security import verify_token
+from .utils.user_cache import UserSnapshot, current_generation, get_cached_user, store_user
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    session: AsyncSession = Depends(get_session),
-) -> models.User:
-    """Extract and return the currently authenticated user.
-
-    Raises an HTTP 401 error if the token is invalid or the user does
-    not exist.
-    """
+async def _authenticate(token: str, session: AsyncSession) -> UserSnapshot:
     user_id = verify_token(token)
     if user_id is None:
         raise HTTPException(
@@ -33,6 +35,10 @@ async def get_current_user(
             detail="Could not validate credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    cached = await get_cached_user(user_id)
+    if cached is not None:
+        return cached
+    generation = await current_generation(user_id)
     user = await session.get(models.User, user_id)
     if not user:
         raise HTTPException(
@@ -40,4 +46,34 @@ async def get_current_user(
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return await store_user(user, generation)
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = Depends(get_session),
+) -> UserSnapshot:
+    """Extract and return the currently authenticated user.
+
+    The returned ``UserSnapshot`` is detached from the session; handlers
+    that modify the user must load it with ``session.get``.  Raises an
+    HTTP 401 error if the token is invalid or the user does not exist.
+    """
+    user = await _authenticate(token, session)
+    # If the request writes, get_session keeps this user's reads on the primary
+    session.info["user_id"] = user.id
     return user
+
+
+async def get_read_session(token: str = Depends(oauth2_scheme)) -> AsyncGenerator[AsyncSession, None]:
+    """FastAPI dependency that yields a session for read-only handlers."""
+    async with read_session(verify_token(token)) as session:
+        yield session
+
+
+async def get_current_user_for_read(
+    token: str = Depends(oauth2_scheme),
+    session: AsyncSession = Depends(get_read_session),
+) -> UserSnapshot:
+    """Like ``get_current_user``, loading the user through ``get_read_session``."""
+    return await _authenticate(token, session)
@@ -0,0 +1,417 @@
+"""
+Database-backed job queue, an alternative to Celery and Redis.
+
+With ``task_backend = "jobqueue"`` the task publisher stores task calls
+as rows of ``jobs`` instead of sending them to the broker, and a
+``JobRunner`` runs them on its own event loop, without the
+``asyncio.run`` per task of the Celery workers.  The runner lives in
+every API process when ``jobqueue_embedded`` is set, or runs standalone
+with ``python -m app.jobqueue``.  Job types are the Celery task names;
+``tasks`` registers an async handler for each with ``register``.
+
+A runner claims runnable jobs of a type (``run_at`` in the past) with
+``FOR UPDATE SKIP LOCKED``, so concurrent runners never take the same
+job, marks them ``RUNNING`` and moves ``run_at`` to the end of the
+visibility timeout.  While a job runs, its runner keeps pushing
+``run_at`` forward; if the runner dies, the job is claimed again once
+``run_at`` passes.  Each runner runs at most
+``jobqueue_concurrency[type]`` jobs of a type at a time.
+
+A job that succeeds is deleted.  One that raises is queued again after
+an exponential backoff (``jobqueue_retry_backoff_seconds`` doubled per
+attempt, with jitter) until it has used ``max_attempts``, and is then
+kept as ``FAILED`` with its last error.  A handler can ``checkpoint``
+the arguments its retries get, in the transaction that records its
+progress, e.g. the order version a search claimed; ``last_attempt``
+tells it whether a failure is final.
+
+Code that starts jobs as part of a change, like the webhook inbox, calls
+``add`` to insert them in its own transaction.  On PostgreSQL ``add``
+and ``enqueue_many`` send ``NOTIFY jobs`` in the inserting transaction
+and runners ``LISTEN`` on a dedicated connection, so a job starts as
+soon as it is committed.  Runners also poll every
+``jobqueue_poll_seconds``; on SQLite that and wake-ups within the same
+process are all there is.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import signal
+import socket
+import time
+import uuid
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import tracing
+from .config import Settings, get_settings
+from .database import async_session_maker, engine
+from .metrics import JOB_DURATION, JOB_WAIT, JOBS_PROCESSED
+from .models import Job, JobStatus
+
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "jobs"
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+@dataclass(frozen=True)
+class JobType:
+    """A registered job type and how many of its jobs a runner runs at once."""
+
+    name: str
+    handler: Handler
+    concurrency: int
+    max_attempts: int
+
+
+@dataclass(frozen=True)
+class RunningJob:
+    """The job the current handler runs for, and the runner holding it."""
+
+    id: int
+    worker_id: str
+    attempts: int
+    max_attempts: int
+
+
+class JobLost(Exception):
+    """The running job was claimed by another runner meanwhile."""
+
+
+_registry: Dict[str, JobType] = {}
+_current: contextvars.ContextVar[Optional[RunningJob]] = contextvars.ContextVar("jobqueue_job", default=None)
+
+_wakeup = asyncio.Event()
+
+
+def notify() -> None:
+    """Wake the runner of this process, e.g. after jobs were committed."""
+    _wakeup.set()
+
+
+def register(
+    name: str, handler: Handler, *, concurrency: Optional[int] = None, max_attempts: Optional[int] = None
+) -> None:
+    """Run jobs of type ``name`` with ``handler(*args, **kwargs)``.
+
+    ``concurrency`` defaults to ``jobqueue_concurrency[name]`` (or 1) and
+    ``max_attempts`` to ``jobqueue_max_attempts``.
+    """
+    settings = get_settings()
+    _registry[name] = JobType(
+        name,
+        handler,
+        concurrency if concurrency is not None else settings.jobqueue_concurrency.get(name, 1),
+        max_attempts if max_attempts is not None else settings.jobqueue_max_attempts,
+    )
+
+
+def job_row(
+    name: str, args: Tuple[Any, ...] = (), kwargs: Optional[Dict[str, Any]] = None, traceparent: Optional[str] = None
+) -> Dict[str, Any]:
+    """Return the ``jobs`` column values for a call of job type ``name``.
+
+    ``args`` and ``kwargs`` must be JSON serialisable.
+    """
+    job_type = _registry.get(name)
+    return {
+        "type": name,
+        "payload": json.dumps({"args": list(args), "kwargs": kwargs or {}}),
+        "status": JobStatus.QUEUED,
+        "attempts": 0,
+        "max_attempts": job_type.max_attempts if job_type else get_settings().jobqueue_max_attempts,
+        "run_at": datetime.utcnow(),
+        "traceparent": traceparent,
+    }
+
+
+async def add(session: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """Insert jobs (``job_row`` values) in ``session``'s transaction.  Does not commit.
+
+    The jobs exist exactly when the caller's changes do; runners are
+    woken once the transaction commits.
+    """
+    if not rows:
+        return
+    await session.execute(insert(Job), rows)
+    if engine.dialect.name == "postgresql":
+        # Delivered to the listening runners when the insert commits
+        for name in {row["type"] for row in rows}:
+            await session.execute(select(func.pg_notify(CHANNEL, name)))
+    event.listen(session.sync_session, "after_commit", lambda _session: notify(), once=True)
+
+
+async def enqueue_many(rows: List[Dict[str, Any]]) -> None:
+    """Insert and commit jobs (``job_row`` values) and wake the runners."""
+    if not rows:
+        return
+    async with async_session_maker() as session:
+        await add(session, rows)
+        await session.commit()
+
+
+async def enqueue(name: str, *args: Any, **kwargs: Any) -> None:
+    """Queue one job of type ``name`` for ``handler(*args, **kwargs)``."""
+    await enqueue_many([job_row(name, args, kwargs, tracing.current_traceparent())])
+
+
+async def checkpoint(session: AsyncSession, *args: Any, **kwargs: Any) -> None:
+    """Replace the arguments the running job is retried with.  Does not commit.
+
+    Written in ``session``'s transaction, so the new arguments are kept
+    exactly when the handler's own changes are.  Raises ``JobLost`` if
+    another runner claimed the job after its visibility timeout.
+    """
+    job = _current.get()
+    if job is None:
+        raise RuntimeError("checkpoint() called outside a job")
+    result = await session.execute(
+        update(Job)
+        .where(Job.id == job.id, Job.locked_by == job.worker_id)
+        .values(payload=json.dumps({"args": list(args), "kwargs": kwargs}))
+    )
+    if result.rowcount == 0:
+        raise JobLost(f"job {job.id} is no longer held by {job.worker_id}")
+
+
+def last_attempt() -> bool:
+    """Whether the running job will not be retried if it fails."""
+    job = _current.get()
+    return job is None or job.attempts >= job.max_attempts
+
+
+def retry_delay(attempts: int, settings: Settings) -> float:
+    """Seconds to wait before the attempt after ``attempts`` failed ones."""
+    delay = min(
+        settings.jobqueue_retry_backoff_seconds * 2 ** (attempts - 1), settings.jobqueue_retry_backoff_max_seconds
+    )
+    return random.uniform(delay / 2, delay)
+
+
+class JobRunner:
+    """Claims and runs jobs of the registered types until cancelled."""
+
+    def __init__(self, settings: Settings, types: Optional[Iterable[str]] = None) -> None:
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._settings = settings
+        self._type_names = list(types) if types is not None else None
+        self._visibility = timedelta(seconds=settings.jobqueue_visibility_timeout_seconds)
+        self._running: Dict[int, asyncio.Task] = {}
+        self._active: Dict[str, int] = defaultdict(int)
+
+    def _types(self) -> List[JobType]:
+        if self._type_names is None:
+            return list(_registry.values())
+        return [_registry[name] for name in self._type_names]
+
+    async def run(self) -> None:
+        """Run jobs until cancelled, then let running jobs finish or release them."""
+        helpers = [asyncio.create_task(self._renew_running())]
+        if engine.dialect.driver == "asyncpg":
+            helpers.append(asyncio.create_task(self._listen()))
+        try:
+            while True:
+                _wakeup.clear()
+                try:
+                    for job_type in self._types():
+                        free = job_type.concurrency - self._active[job_type.name]
+                        if free > 0:
+                            for job in await self._claim(job_type, free):
+                                self._start(job_type, job)
+                except Exception:
+                    logger.exception("Job queue claim failed; retrying")
+                # Woken by NOTIFY, a local enqueue or a job finishing (a free slot)
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=self._settings.jobqueue_poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for helper in helpers:
+                helper.cancel()
+            await asyncio.gather(*helpers, return_exceptions=True)
+            await self._stop()
+
+    async def _claim(self, job_type: JobType, limit: int) -> List[Job]:
+        now = datetime.utcnow()
+        async with async_session_maker() as session:
+            jobs = (
+                await session.execute(
+                    select(Job)
+                    .where(Job.type == job_type.name, Job.status != JobStatus.FAILED, Job.run_at <= now)
+                    .order_by(Job.run_at)
+                    .limit(limit)
+                    .with_for_update(skip_locked=True)
+                )
+            ).scalars().all()
+            claimed: List[Job] = []
+            for job in jobs:
+                JOB_WAIT.labels(job.type).observe(max((now - job.run_at).total_seconds(), 0.0))
+                if job.status == JobStatus.RUNNING:
+                    logger.warning("Job %s (%s) was not renewed by %s; claiming it again", job.id, job.type, job.locked_by)
+                    if job.attempts >= job.max_attempts:
+                        job.status = JobStatus.FAILED
+                        job.locked_by = None
+                        job.last_error = "visibility timeout expired on the last attempt"
+                        JOBS_PROCESSED.labels(job.type, "failed").inc()
+                        continue
+                job.status = JobStatus.RUNNING
+                job.attempts += 1
+                job.locked_by = self.worker_id
+                job.run_at = now + self._visibility
+                claimed.append(job)
+            await session.commit()
+        return claimed
+
+    def _start(self, job_type: JobType, job: Job) -> None:
+        self._active[job_type.name] += 1
+        task = asyncio.create_task(self._execute(job_type, job))
+        self._running[job.id] = task
+
+        def _done(_task: asyncio.Task) -> None:
+            self._running.pop(job.id, None)
+            self._active[job_type.name] -= 1
+            _wakeup.set()
+
+        task.add_done_callback(_done)
+
+    async def _execute(self, job_type: JobType, job: Job) -> None:
+        payload = json.loads(job.payload)
+        _current.set(RunningJob(job.id, self.worker_id, job.attempts, job.max_attempts))
+        started = time.perf_counter()
+        try:
+            with tracing.span(f"job.{job.type}", job.traceparent, job_id=job.id, attempt=job.attempts):
+                await job_type.handler(*payload["args"], **payload["kwargs"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            logger.exception("Job %s (%s) failed on attempt %s", job.id, job.type, job.attempts)
+            outcome = "failed" if job.attempts >= job.max_attempts else "retried"
+            values: Dict[str, Any] = {"locked_by": None, "last_error": repr(exc)}
+            if outcome == "failed":
+                values["status"] = JobStatus.FAILED
+            else:
+                values["status"] = JobStatus.QUEUED
+                values["run_at"] = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts, self._settings))
+            statement = update(Job).values(**values)
+        else:
+            outcome = "succeeded"
+            statement = delete(Job)
+        finally:
+            JOB_DURATION.labels(job.type).observe(time.perf_counter() - started)
+        JOBS_PROCESSED.labels(job.type, outcome).inc()
+        try:
+            async with async_session_maker() as session:
+                # Only while still ours: a job that outlived its visibility
+                # timeout may have been claimed by another runner.
+                await session.execute(statement.where(Job.id == job.id, Job.locked_by == self.worker_id))
+                await session.commit()
+        except Exception:
+            logger.exception("Could not record the outcome of job %s; it will run again", job.id)
+
+    async def _renew_running(self) -> None:
+        """Keep pushing back the visibility timeout of the running jobs."""
+        while True:
+            await asyncio.sleep(self._visibility.total_seconds() / 3)
+            if not self._running:
+                continue
+            try:
+                async with async_session_maker() as session:
+                    await session.execute(
+                        update(Job)
+                        .where(Job.id.in_(list(self._running)), Job.locked_by == self.worker_id)
+                        .values(run_at=datetime.utcnow() + self._visibility)
+                    )
+                    await session.commit()
+            except Exception:
+                logger.exception("Could not renew the running jobs")
+
+    async def _listen(self) -> None:
+        """Wake the runner on ``NOTIFY jobs``; reconnects until cancelled."""
+        while True:
+            try:
+                async with engine.connect() as conn:
+                    driver_connection = (await conn.get_raw_connection()).driver_connection
+                    lost = asyncio.get_running_loop().create_future()
+
+                    def listener(*_args: Any) -> None:
+                        notify()
+
+                    def on_termination(_connection: Any) -> None:
+                        if not lost.done():
+                            lost.set_result(None)
+
+                    driver_connection.add_termination_listener(on_termination)
+                    await driver_connection.add_listener(CHANNEL, listener)
+                    try:
+                        # Jobs may have been committed while nobody listened
+                        notify()
+                        await lost
+                    finally:
+                        if not driver_connection.is_closed():
+                            await driver_connection.remove_listener(CHANNEL, listener)
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.warning("LISTEN %s falhou; usando apenas polling: %s", CHANNEL, exc)
+            await asyncio.sleep(self._settings.jobqueue_poll_seconds)
+
+    async def _stop(self) -> None:
+        """Give running jobs a grace period, then cancel and release them."""
+        if not self._running:
+            return
+        await asyncio.wait(list(self._running.values()), timeout=self._settings.jobqueue_shutdown_timeout_seconds)
+        unfinished = dict(self._running)
+        if not unfinished:
+            return
+        for task in unfinished.values():
+            task.cancel()
+        await asyncio.gather(*unfinished.values(), return_exceptions=True)
+        # The interrupted attempt does not count; another runner may start over
+        async with async_session_maker() as session:
+            await session.execute(
+                update(Job)
+                .where(Job.id.in_(list(unfinished)), Job.locked_by == self.worker_id)
+                .values(
+                    status=JobStatus.QUEUED, attempts=Job.attempts - 1, run_at=datetime.utcnow(), locked_by=None
+                )
+            )
+            await session.commit()
+        logger.info("%d jobs interrompidos e devolvidos à fila", len(unfinished))
+
+
+async def _main() -> None:
+    from . import tasks  # noqa: F401  (registers the job handlers)
+
+    current = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, current.cancel)
+    runner = JobRunner(get_settings())
+    logger.info("Job runner %s started for %s", runner.worker_id, ", ".join(sorted(_registry)))
+    try:
+        await runner.run()
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    """Run a standalone job runner until SIGINT or SIGTERM."""
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
@@ -2,15 +2,41 @@
 Entry point for the FastAPI application.
 
 Creates the FastAPI instance, includes routers, sets up CORS (if
-necessary) and runs database initialisation on startup.  This file is
+necessary) and runs database initialisation on startup.  Background
+helpers (cache invalidation listener, webhook inbox consumer, replica
+health checks and, with the ``jobqueue`` task backend, the job runner)
+are started with the application and cancelled on shutdown, after which
+the task publisher flushes the messages still queued.  This file is
 the target of the Uvicorn server when the container starts.
 """
-from fastapi import FastAPI
+import asyncio
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 
+from .admission import AdmissionControlMiddleware, AdmissionController
+from .metrics import MetricsMiddleware
+from .tracing import TracingMiddleware
 from .config import get_settings
-from .database import init_db
-from .routers import auth, orders, webhooks, internal, checkout, users
+from .database import init_db, replica_engines
+from .jobqueue import JobRunner
+from .payments import close_payment_gateway
+from .replicas import run_health_checks as run_replica_health_checks
+from .task_publisher import close_task_publisher
+from .routers import auth, orders, webhooks, internal, checkout, users, metrics
+from .utils.security import PasswordHasherBusy
+from .utils.user_cache import run_invalidation_listener
+from .webhook_inbox import run_consumer as run_webhook_consumer
+
+
+async def password_hasher_busy_handler(request: Request, exc: PasswordHasherBusy) -> JSONResponse:
+    """Shed password hashing work instead of queueing it indefinitely."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servidor ocupado, tente novamente em instantes"},
+        headers={"Retry-After": "1"},
+    )
 
 
 def create_app() -> FastAPI:
@@ -18,6 +44,16 @@ def create_app() -> FastAPI:
     app = FastAPI(title="RaizDigital API")
     # Configure CORS to allow the frontend to talk to the backend
     settings = get_settings()
+    # Admission control is added first so that it sits inside CORS and
+    # shed responses still carry CORS headers.
+    app.state.admission = None
+    if settings.admission_control_enabled:
+        app.state.admission = AdmissionController.from_settings(settings)
+        app.add_middleware(AdmissionControlMiddleware, controller=app.state.admission)
+    # Outside admission control so that shed requests are measured too
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware)
+    app.add_middleware(TracingMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],
@@ -25,6 +61,7 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    app.add_exception_handler(PasswordHasherBusy, password_hasher_busy_handler)
     # Include routers
     app.include_router(auth.router)
     app.include_router(orders.router)
@@ -32,13 +69,34 @@ def create_app() -> FastAPI:
     app.include_router(internal.router)
     app.include_router(checkout.router)
     app.include_router(users.router)
-    return app
+    if settings.metrics_enabled:
+        app.include_router(metrics.router)
 
+    app.state.background_tasks = []
 
-app = create_app()
+    async def on_startup() -> None:
+        """Initialize the database and background helpers on application startup."""
+        await init_db()
+        app.state.background_tasks.append(asyncio.create_task(run_invalidation_listener()))
+        if settings.webhook_consumer_enabled:
+            app.state.background_tasks.append(asyncio.create_task(run_webhook_consumer()))
+        if replica_engines:
+            app.state.background_tasks.append(asyncio.create_task(run_replica_health_checks()))
+        if settings.task_backend == "jobqueue" and settings.jobqueue_embedded:
+            app.state.background_tasks.append(asyncio.create_task(JobRunner(settings).run()))
+
+    async def on_shutdown() -> None:
+        """Stop background helpers started in ``on_startup``."""
+        for task in app.state.background_tasks:
+            task.cancel()
+        await asyncio.gather(*app.state.background_tasks, return_exceptions=True)
+        app.state.background_tasks.clear()
+        await close_task_publisher()
+        await close_payment_gateway()
 
+    app.add_event_handler("startup", on_startup)
+    app.add_event_handler("shutdown", on_shutdown)
+    return app
 
-@app.on_event("startup")
-async def on_startup() -> None:
-    """Initialize the database on application startup."""
-    await init_db()
+
+app = create_app()
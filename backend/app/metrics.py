@@ -0,0 +1,251 @@
+"""
+Prometheus metrics for the API, the database pool, robots and workers.
+
+Metrics are defined once here and updated from the code they describe:
+``MetricsMiddleware`` records per-route latency and in-flight requests,
+``InstrumentedPool`` measures how long sessions wait for a pooled
+connection, ``replicas`` reports where read-only sessions go and the
+health of each replica, ``robots.search_robot`` records per-source
+durations and outcomes, ``instrument_celery`` hooks task runtimes and
+``tasks_utils.send_email_task`` records email latency,
+``task_publisher`` counts published task messages and ``jobqueue``
+records job outcomes and timings.  ``render`` produces the exposition
+served at ``/metrics``.
+
+When ``PROMETHEUS_MULTIPROC_DIR`` is set (required for Celery's prefork
+workers and for several Uvicorn workers), every process writes its
+samples to that directory and ``render`` aggregates them, so one scrape
+covers all processes sharing the directory.  Workers on other hosts can
+expose the same aggregation with ``WORKER_METRICS_PORT``.
+"""
+import os
+import time
+from typing import Optional, Tuple
+
+from celery import signals
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+from redis.exceptions import RedisError
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from .utils.cache import get_redis, redis_suspended, suspend_redis
+
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "HTTP request latency by route template.",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight",
+    "HTTP requests currently being served.",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the SQLAlchemy pool.",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+DB_POOL_SIZE = Gauge("db_pool_size", "Configured size of the connection pool.", multiprocess_mode="livesum")
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Connections currently checked out of the pool.", multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_overflow", "Connections open beyond the configured pool size.", multiprocess_mode="livesum"
+)
+DB_READ_SESSIONS = Counter(
+    "db_read_sessions_total", "Read-only sessions by the database they were routed to.", ["target"]
+)
+DB_REPLICA_HEALTHY = Gauge(
+    "db_replica_healthy", "Whether a read replica is receiving reads (1) or not (0).", ["replica"],
+    multiprocess_mode="liveall",
+)
+DB_REPLICA_LAG = Gauge(
+    "db_replica_lag_seconds", "Replication lag measured by the last health check.", ["replica"],
+    multiprocess_mode="liveall",
+)
+
+SOURCE_SEARCH_DURATION = Histogram(
+    "search_source_duration_seconds",
+    "Duration of SearchSource.search calls.",
+    ["source", "status"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 120),
+)
+SOURCE_SEARCH_RESULTS = Counter(
+    "search_source_results_total", "Search results by source and status.", ["source", "status"]
+)
+SOURCE_SEARCH_COALESCED = Counter(
+    "search_source_coalesced_total",
+    "Source lookups answered by an identical in-flight lookup instead of the source.",
+    ["source", "scope"],
+)
+
+CELERY_TASK_DURATION = Histogram(
+    "celery_task_duration_seconds",
+    "Runtime of Celery tasks.",
+    ["task", "state"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+CELERY_QUEUE_LENGTH = Gauge(
+    "celery_queue_length", "Messages waiting in a Celery queue.", ["queue"], multiprocess_mode="max"
+)
+TASKS_PUBLISHED = Counter(
+    "celery_tasks_published_total", "Task messages published by the API's task publisher.", ["task", "outcome"]
+)
+TASK_PUBLISH_BATCH_SIZE = Histogram(
+    "celery_task_publish_batch_size",
+    "Messages published per broker batch by the API's task publisher.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250),
+)
+TASK_PUBLISH_QUEUE_FULL = Counter(
+    "celery_task_publish_queue_full_total", "Publishes that waited because the publisher queue was full."
+)
+JOBS_PROCESSED = Counter("jobqueue_jobs_total", "Jobs run by the job queue, by outcome.", ["type", "outcome"])
+JOB_DURATION = Histogram(
+    "jobqueue_job_duration_seconds",
+    "Runtime of job queue jobs.",
+    ["type"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+JOB_WAIT = Histogram(
+    "jobqueue_job_wait_seconds",
+    "Time from when a job became runnable until a worker claimed it.",
+    ["type"],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 60),
+)
+
+EMAIL_SEND_DURATION = Histogram(
+    "email_send_duration_seconds",
+    "Time spent delivering an email.",
+    ["outcome"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+
+
+def registry() -> CollectorRegistry:
+    """Return the registry to expose, aggregating processes when needed."""
+    if not MULTIPROCESS:
+        return REGISTRY
+    aggregated = CollectorRegistry()
+    multiprocess.MultiProcessCollector(aggregated)
+    return aggregated
+
+
+def render() -> Tuple[bytes, str]:
+    """Return the exposition body and its content type."""
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency per route template.
+
+    The route template (``/orders/{order_id}``) rather than the raw path
+    is used as label so that cardinality stays bounded.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status_code = 500
+
+        async def send_wrapper(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            HTTP_REQUEST_DURATION.labels(
+                method, getattr(route, "path", "unmatched"), str(status_code)
+            ).observe(time.perf_counter() - started)
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long checkouts wait for a connection."""
+
+    def _do_get(self):  # type: ignore[no-untyped-def]
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+def instrument_pool(sync_engine) -> None:
+    """Keep the pool gauges of ``sync_engine`` current."""
+    pool = sync_engine.pool
+    if not isinstance(pool, AsyncAdaptedQueuePool):
+        return
+    DB_POOL_SIZE.set(pool.size())
+
+    def _update(*_args) -> None:
+        DB_POOL_CHECKED_OUT.set(pool.checkedout())
+        DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+    event.listen(sync_engine, "checkout", _update)
+    event.listen(sync_engine, "checkin", _update)
+
+
+async def update_queue_lengths(queues: Tuple[str, ...] = ("celery",)) -> None:
+    """Refresh ``celery_queue_length`` from the Redis broker, if reachable."""
+    if redis_suspended():
+        return
+    try:
+        redis = get_redis()
+        for queue in queues:
+            CELERY_QUEUE_LENGTH.labels(queue).set(await redis.llen(queue))
+    except RedisError:
+        suspend_redis()
+
+
+def instrument_celery(worker_metrics_port: Optional[int] = None) -> None:
+    """Record task runtimes via Celery signals and optionally serve metrics."""
+    started: dict = {}
+
+    @signals.task_prerun.connect(weak=False)
+    def _task_prerun(task_id=None, **_kwargs) -> None:
+        started[task_id] = time.perf_counter()
+
+    @signals.task_postrun.connect(weak=False)
+    def _task_postrun(task_id=None, task=None, state=None, **_kwargs) -> None:
+        begin = started.pop(task_id, None)
+        if begin is not None:
+            CELERY_TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - begin)
+
+    @signals.worker_process_shutdown.connect(weak=False)
+    def _worker_process_shutdown(pid=None, **_kwargs) -> None:
+        if MULTIPROCESS:
+            multiprocess.mark_process_dead(pid or os.getpid())
+
+    if worker_metrics_port:
+
+        @signals.worker_ready.connect(weak=False)
+        def _serve_metrics(**_kwargs) -> None:
+            start_http_server(worker_metrics_port, registry=registry())
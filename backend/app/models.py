@@ -7,21 +7,28 @@ you need to alter the schema, consider creating a database migration
 instead of editing this file directly in production.
 """
 import enum
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Optional
 
 from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Date,
     Integer,
     String,
     DateTime,
     Enum,
     ForeignKey,
     Float,
+    Index,
     Text,
+    false,
+    text,
 )
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
 from .database import Base
+from .utils.text import search_text
 
 
 class OrderStatus(enum.Enum):
@@ -33,6 +40,22 @@ class OrderStatus(enum.Enum):
     COMPLETED_FAILURE = "COMPLETED_FAILURE"
 
 
+class BatchStatus(enum.Enum):
+    """Enumeration of possible states for a batch of orders."""
+
+    PENDING_PAYMENT = "PENDING_PAYMENT"
+    PROCESSING = "PROCESSING"
+    COMPLETED = "COMPLETED"
+
+
+class JobStatus(enum.Enum):
+    """Enumeration of possible states for a job of ``jobqueue``."""
+
+    QUEUED = "QUEUED"
+    RUNNING = "RUNNING"
+    FAILED = "FAILED"
+
+
 class ResultStatus(enum.Enum):
     """Enumeration of possible states for an individual search result."""
 
@@ -40,6 +63,12 @@ class ResultStatus(enum.Enum):
     NOT_FOUND = "NOT_FOUND"
     SOURCE_UNAVAILABLE = "SOURCE_UNAVAILABLE"
     ERROR = "ERROR"
+    # The source does not cover the order (state, period or missing data)
+    # and was not queried.
+    NOT_APPLICABLE = "NOT_APPLICABLE"
+    # The source covers the order but the scheduler left it out as
+    # unlikely to find the certificate.
+    SKIPPED = "SKIPPED"
 
 
 class User(Base):
@@ -52,16 +81,36 @@ class User(Base):
     password_hash: Mapped[str] = mapped_column(String(255), nullable=False)
     full_name: Mapped[Optional[str]] = mapped_column(String(255))
     created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
+    # Incremented whenever one of the user's orders or results changes;
+    # used as the validator for the order list (see utils.order_cache).
+    orders_version: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
 
     orders: Mapped[List["SearchOrder"]] = relationship(
         back_populates="user", cascade="all, delete-orphan"
     )
 
 
+def _order_search_text(context) -> str:
+    # Works for executemany inserts too: called once per parameter set
+    params = context.get_current_parameters()
+    return search_text(params.get("target_name"), params.get("target_city"), params.get("target_parents_names"))
+
+
 class SearchOrder(Base):
     """Represents a client's request to search for a civil certificate."""
 
     __tablename__ = "search_orders"
+    __table_args__ = (
+        # Keyset pagination of a user's orders
+        Index("ix_search_orders_user_id_id", "user_id", "id"),
+        # Trigram index for GET /orders/search (PostgreSQL with pg_trgm)
+        Index(
+            "ix_search_orders_search_text_trgm",
+            "search_text",
+            postgresql_using="gin",
+            postgresql_ops={"search_text": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True, index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False)
@@ -76,6 +125,12 @@ class SearchOrder(Base):
     created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
     completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
     stripe_session_id: Mapped[Optional[str]] = mapped_column(String(255))
+    # Incremented by every write (see ``order_state``)
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
+    # Set for orders imported through POST /orders/bulk
+    batch_id: Mapped[Optional[int]] = mapped_column(ForeignKey("order_batches.id"), index=True)
+    # Accent-folded target name, city and parents' names (``utils.text.search_text``)
+    search_text: Mapped[Optional[str]] = mapped_column(Text, default=_order_search_text)
 
     user: Mapped["User"] = relationship(back_populates="orders")
     results: Mapped[List["SearchResult"]] = relationship(
@@ -83,6 +138,21 @@ class SearchOrder(Base):
     )
 
 
+class OrderBatch(Base):
+    """A group of orders imported together and paid with one checkout."""
+
+    __tablename__ = "order_batches"
+
+    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=False, index=True)
+    status: Mapped[BatchStatus] = mapped_column(Enum(BatchStatus), default=BatchStatus.PENDING_PAYMENT, nullable=False)
+    order_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    total_price: Mapped[float] = mapped_column(Float, default=0.0, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
+    completed_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    stripe_session_id: Mapped[Optional[str]] = mapped_column(String(255))
+
+
 class SearchResult(Base):
     """Stores the outcome of searching a specific source for an order."""
 
@@ -96,10 +166,38 @@ class SearchResult(Base):
     found_data_json: Mapped[Optional[str]] = mapped_column(Text) # Use Optional[str] for Text column
     screenshot_path: Mapped[Optional[str]] = mapped_column(String(255))
     timestamp: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
+    # Time the source took to answer, when known
+    duration_ms: Mapped[Optional[int]] = mapped_column(Integer)
+    # Copied from another order's identical lookup (``robots.singleflight``)
+    # rather than answered by the source; left out of ``source_stats_daily``
+    coalesced: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false(), nullable=False)
 
     order: Mapped["SearchOrder"] = relationship(back_populates="results")
 
 
+class SourceStatsDaily(Base):
+    """Daily rollup of search results per source, target state, era and status.
+
+    Maintained incrementally by ``source_stats.record_results`` in the
+    same transaction as the results it counts.
+    """
+
+    __tablename__ = "source_stats_daily"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    source_name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    # Empty when the order has no target state
+    target_state: Mapped[str] = mapped_column(String(100), primary_key=True)
+    # First year of the order's birth-year era (``source_stats.era_key``),
+    # empty when the order has no approximate birth year
+    era: Mapped[str] = mapped_column(String(10), primary_key=True, default="")
+    status: Mapped[ResultStatus] = mapped_column(Enum(ResultStatus), primary_key=True)
+    result_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # Sum and number of the results that reported a duration
+    duration_ms_sum: Mapped[int] = mapped_column(BigInteger, default=0, nullable=False)
+    duration_count: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+
 class PasswordResetToken(Base):
     """Stores password reset tokens for users."""
 
@@ -111,4 +209,80 @@ class PasswordResetToken(Base):
     expires_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
     created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
 
-    user: Mapped["User"] = relationship()
\ No newline at end of file
+    user: Mapped["User"] = relationship()
+
+
+class StripeEvent(Base):
+    """Inbox of verified Stripe webhook events awaiting processing.
+
+    The webhook endpoint only inserts rows here; ``webhook_inbox``
+    processes them in the background.  The Stripe event ID is the
+    primary key, so redelivered events are deduplicated on insert.
+    """
+
+    __tablename__ = "stripe_events"
+    __table_args__ = (
+        Index("ix_stripe_events_pending", "received_at", postgresql_where=text("processed_at IS NULL")),
+    )
+
+    id: Mapped[str] = mapped_column(String(255), primary_key=True)
+    type: Mapped[str] = mapped_column(String(100), nullable=False)
+    order_id: Mapped[Optional[int]] = mapped_column(Integer, index=True)
+    batch_id: Mapped[Optional[int]] = mapped_column(Integer, index=True)
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    stripe_created: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    received_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
+    processed_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+    # Trace context of the webhook request, continued by the consumer
+    traceparent: Mapped[Optional[str]] = mapped_column(String(55))
+
+
+class TaskOutbox(Base):
+    """A task call committed with the change that requires it (see ``task_outbox``).
+
+    ``available_at`` is when the row may next be relayed: the retry time
+    after a failed publish, or the end of the lease of a relay in
+    progress.  Rows are deleted once the broker has accepted them.
+    """
+
+    __tablename__ = "task_outbox"
+
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    task: Mapped[str] = mapped_column(String(255), nullable=False)
+    # JSON object with the "args" and "kwargs" of the call
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    available_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False, index=True)
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
+    # Trace context of the code that stored the call
+    traceparent: Mapped[Optional[str]] = mapped_column(String(55))
+
+
+class Job(Base):
+    """A background task stored in the database (see ``jobqueue``).
+
+    ``run_at`` is when the job may next be claimed: the retry time of a
+    queued job, or the end of the visibility timeout of a running one.
+    Jobs are deleted when they succeed; failed jobs are kept.
+    """
+
+    __tablename__ = "jobs"
+    __table_args__ = (
+        Index("ix_jobs_claimable", "type", "run_at", postgresql_where=text("status <> 'FAILED'")),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    type: Mapped[str] = mapped_column(String(100), nullable=False)
+    # JSON object with the "args" and "kwargs" of the call
+    payload: Mapped[str] = mapped_column(Text, nullable=False)
+    status: Mapped[JobStatus] = mapped_column(Enum(JobStatus), default=JobStatus.QUEUED, nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    max_attempts: Mapped[int] = mapped_column(Integer, nullable=False)
+    run_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
+    locked_by: Mapped[Optional[str]] = mapped_column(String(100))
+    created_at: Mapped[datetime] = mapped_column(default=datetime.utcnow, nullable=False)
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+    # Trace context of the code that enqueued the job
+    traceparent: Mapped[Optional[str]] = mapped_column(String(55))
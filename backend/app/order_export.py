@@ -0,0 +1,235 @@
+"""
+Streaming export of a user's orders and their results.
+
+``GET /orders/export`` downloads a user's whole search history as CSV
+(one row per result, order columns repeated) or NDJSON (one object per
+order with its results nested).  Rows are read with ``session.stream``
+and ``yield_per``, i.e. a server-side cursor on PostgreSQL, selecting
+plain columns rather than ORM entities so nothing accumulates in the
+identity map.  Encoded rows are flushed to the client in chunks of about
+``CHUNK_BYTES``, optionally gzip-compressed on the fly, so memory use
+does not depend on the size of the history.
+
+The export opens its own session: the response is produced after the
+request's dependencies (and their session) have been cleaned up.
+"""
+import csv
+import enum
+import io
+import json
+import zlib
+from datetime import date, datetime, time, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from sqlalchemy import Select, select
+
+from . import models
+from .database import async_session_maker
+
+
+# Rows fetched from the cursor per round trip
+YIELD_PER = 1_000
+# Size of the chunks written to the response
+CHUNK_BYTES = 64 * 1024
+
+MEDIA_TYPES = {"csv": "text/csv; charset=utf-8", "ndjson": "application/x-ndjson"}
+
+ORDER_COLUMNS = (
+    "id",
+    "status",
+    "order_price",
+    "target_name",
+    "target_dob_approx",
+    "target_city",
+    "target_state",
+    "target_parents_names",
+    "additional_info",
+    "created_at",
+    "completed_at",
+)
+RESULT_COLUMNS = (
+    "source_name",
+    "status",
+    "details",
+    "found_data_json",
+    "screenshot_path",
+    "timestamp",
+    "duration_ms",
+)
+CSV_HEADER = ["order_id", *ORDER_COLUMNS[1:], *(f"result_{name}" for name in RESULT_COLUMNS)]
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether an ``Accept-Encoding`` header allows a gzip-encoded response.
+
+    Honours quality values, so ``gzip;q=0`` refuses gzip; a ``*`` entry
+    applies when gzip is not listed.  Malformed quality values count as 0.
+    """
+    qualities: Dict[str, float] = {}
+    for item in (accept_encoding or "").split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+def export_query(user_id: int, created_from: Optional[date] = None, created_to: Optional[date] = None) -> Select:
+    """Return the rows of the export: orders joined with their results.
+
+    ``created_to`` is inclusive.  Rows are ordered by order and result, so
+    all rows of an order are adjacent.
+    """
+    order = models.SearchOrder
+    result = models.SearchResult
+    query = (
+        select(
+            *(getattr(order, name) for name in ORDER_COLUMNS),
+            result.id,
+            *(getattr(result, name) for name in RESULT_COLUMNS),
+        )
+        .outerjoin(result, result.order_id == order.id)
+        .where(order.user_id == user_id)
+        .order_by(order.id, result.id)
+    )
+    if created_from is not None:
+        query = query.where(order.created_at >= datetime.combine(created_from, time.min))
+    if created_to is not None:
+        query = query.where(order.created_at < datetime.combine(created_to + timedelta(days=1), time.min))
+    return query
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    return value
+
+
+def _split(row: Tuple) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    values = [_plain(value) for value in row]
+    order = dict(zip(ORDER_COLUMNS, values))
+    result_id = values[len(ORDER_COLUMNS)]
+    if result_id is None:
+        return order, None
+    return order, dict(zip(RESULT_COLUMNS, values[len(ORDER_COLUMNS) + 1:]))
+
+
+class _CsvEncoder:
+    def __init__(self) -> None:
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._writer.writerow(CSV_HEADER)
+
+    def add(self, row: Tuple) -> None:
+        order, result = _split(row)
+        result = result or {}
+        self._writer.writerow(
+            ["" if order[name] is None else order[name] for name in ORDER_COLUMNS]
+            + ["" if result.get(name) is None else result[name] for name in RESULT_COLUMNS]
+        )
+
+    def finish(self) -> None:
+        pass
+
+    def take(self) -> str:
+        text = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return text
+
+
+class _NdjsonEncoder:
+    def __init__(self) -> None:
+        self._parts: List[str] = []
+        self._order: Optional[Dict[str, Any]] = None
+
+    def _flush_order(self) -> None:
+        if self._order is not None:
+            self._parts.append(json.dumps(self._order, ensure_ascii=False) + "\n")
+            self._order = None
+
+    def add(self, row: Tuple) -> None:
+        order, result = _split(row)
+        if self._order is None or self._order["id"] != order["id"]:
+            self._flush_order()
+            order["results"] = []
+            self._order = order
+        if result is not None:
+            self._order["results"].append(result)
+
+    def finish(self) -> None:
+        self._flush_order()
+
+    def take(self) -> str:
+        text = "".join(self._parts)
+        self._parts.clear()
+        return text
+
+
+class _Output:
+    """Accumulates encoded text and hands out (compressed) chunks."""
+
+    def __init__(self, gzip: bool) -> None:
+        # wbits=31 writes a gzip container rather than a raw zlib stream
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+        self._pending: List[bytes] = []
+        self._size = 0
+
+    def write(self, text: str) -> None:
+        if not text:
+            return
+        data = text.encode("utf-8")
+        if self._compressor is not None:
+            data = self._compressor.compress(data)
+        if data:
+            self._pending.append(data)
+            self._size += len(data)
+
+    @property
+    def full(self) -> bool:
+        return self._size >= CHUNK_BYTES
+
+    def take(self, final: bool = False) -> bytes:
+        if final and self._compressor is not None:
+            self._pending.append(self._compressor.flush())
+        chunk = b"".join(self._pending)
+        self._pending.clear()
+        self._size = 0
+        return chunk
+
+
+def _encoder(fmt: str):
+    return _CsvEncoder() if fmt == "csv" else _NdjsonEncoder()
+
+
+async def stream_export(
+    user_id: int, fmt: str, gzip: bool = False, created_from: Optional[date] = None, created_to: Optional[date] = None
+) -> AsyncIterator[bytes]:
+    """Yield the encoded export of ``user_id``'s orders in chunks."""
+    encoder, output = _encoder(fmt), _Output(gzip)
+    async with async_session_maker() as session:
+        rows = await session.stream(
+            export_query(user_id, created_from, created_to).execution_options(yield_per=YIELD_PER)
+        )
+        async for partition in rows.partitions():
+            for row in partition:
+                encoder.add(row)
+            output.write(encoder.take())
+            if output.full:
+                yield output.take()
+    encoder.finish()
+    output.write(encoder.take())
+    yield output.take(final=True)
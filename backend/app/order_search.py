@@ -0,0 +1,96 @@
+"""
+Search over a user's orders by target name, city and parents' names.
+
+``SearchOrder.search_text`` holds the accent-folded concatenation of
+those fields (``utils.text.search_text``), written when the order is
+inserted.  A query is folded the same way and matches orders whose
+text contains every word of it.  On PostgreSQL the column has a
+``pg_trgm`` GIN index, which serves both the ``LIKE '%word%'`` filters
+and a fuzzy ``<%`` (word similarity) match that tolerates typos; results
+are ranked by ``word_similarity``.  SQLite has no trigram support, so it
+only does the ``LIKE`` filters and ranks prefix matches first.
+
+Pages are keyset-paginated on ``(rank, id)``: the opaque cursor carries
+the last row's rank and ID, so later pages cost the same as the first
+and do not shift when new orders are created.
+"""
+import base64
+import json
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, case, func, literal, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from . import models
+from .database import engine
+from .utils.text import fold
+
+
+def _like_pattern(value: str, prefix: str = "%") -> str:
+    escaped = value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"{prefix}{escaped}%"
+
+
+def encode_cursor(rank: float, order_id: int) -> str:
+    """Return the opaque cursor for the page after ``(rank, order_id)``."""
+    return base64.urlsafe_b64encode(json.dumps([rank, order_id]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    """Return ``(rank, order_id)`` of a cursor.  Raises ``ValueError`` if invalid."""
+    try:
+        rank, order_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(rank), int(order_id)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("invalid cursor") from exc
+
+
+async def search_orders(
+    session: AsyncSession, user_id: int, query: str, limit: int = 20, cursor: Optional[str] = None
+) -> Tuple[List[models.SearchOrder], Optional[str]]:
+    """Return one page of ``user_id``'s orders matching ``query`` and the next cursor.
+
+    Raises ``ValueError`` for an invalid ``cursor``.
+    """
+    folded = fold(query)
+    if not folded:
+        return [], None
+    order = models.SearchOrder
+    text = order.search_text
+    words = [text.like(_like_pattern(word), escape="\\") for word in folded.split()]
+    if engine.dialect.name == "postgresql":
+        rank = func.word_similarity(folded, text)
+        condition = or_(and_(*words), literal(folded).op("<%")(text))
+    else:
+        rank = case(
+            (text.like(_like_pattern(folded, prefix=""), escape="\\"), 1.0),
+            (text.like(_like_pattern(folded, prefix="% "), escape="\\"), 0.75),
+            else_=0.5,
+        )
+        condition = and_(*words)
+
+    ranked = (
+        select(order.id, rank.label("rank"))
+        .where(order.user_id == user_id, condition)
+        .order_by(rank.desc(), order.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor is not None:
+        last_rank, last_id = decode_cursor(cursor)
+        ranked = ranked.where(or_(rank < last_rank, and_(rank == last_rank, order.id < last_id)))
+    rows = (await session.execute(ranked)).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].rank, rows[-1].id)
+    if not rows:
+        return [], None
+    orders = (
+        await session.execute(
+            select(order).options(selectinload(order.results)).where(order.id.in_([row.id for row in rows]))
+        )
+    ).scalars().all()
+    by_id = {item.id: item for item in orders}
+    return [by_id[row.id] for row in rows if row.id in by_id], next_cursor
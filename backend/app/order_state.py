@@ -0,0 +1,145 @@
+"""
+State machine of search orders.
+
+An order moves ``PENDING_PAYMENT`` → ``PROCESSING`` (paid) →
+``COMPLETED_SUCCESS`` or ``COMPLETED_FAILURE``; completed orders are
+final.  Every write goes through a conditional statement::
+
+    UPDATE search_orders SET status = :target, version = version + 1
+    WHERE id = :id AND status = :expected [AND version = :version]
+    RETURNING ...
+
+so concurrent writers never need row locks or a read beforehand: the
+first one wins and the others get ``None`` back and drop their change.
+Transitions the table below does not allow raise ``IllegalTransition``
+before touching the database.
+
+``SearchOrder.version`` grows with every write.  Besides guarding
+writes, it identifies one processing attempt: the webhook passes the
+version returned by the payment transition to the search task, and
+``claim`` only succeeds for that version, so a duplicated or replayed
+task message finds the order already claimed and does nothing.
+"""
+import logging
+from typing import Any, Dict, FrozenSet, Iterable, Optional
+
+from sqlalchemy import update
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import OrderStatus, SearchOrder
+
+
+logger = logging.getLogger(__name__)
+
+TRANSITIONS: Dict[OrderStatus, FrozenSet[OrderStatus]] = {
+    OrderStatus.PENDING_PAYMENT: frozenset({OrderStatus.PROCESSING}),
+    OrderStatus.PROCESSING: frozenset({OrderStatus.COMPLETED_SUCCESS, OrderStatus.COMPLETED_FAILURE}),
+    OrderStatus.COMPLETED_SUCCESS: frozenset(),
+    OrderStatus.COMPLETED_FAILURE: frozenset(),
+}
+
+
+class IllegalTransition(Exception):
+    """Raised for a status change the state machine does not allow."""
+
+    def __init__(self, current: OrderStatus, target: OrderStatus) -> None:
+        super().__init__(f"{current.value} -> {target.value}")
+        self.current = current
+        self.target = target
+
+
+def can_transition(current: OrderStatus, target: OrderStatus) -> bool:
+    """Whether an order in ``current`` may move to ``target``."""
+    return target in TRANSITIONS[current]
+
+
+def _conditional_update(
+    criteria: Iterable[Any],
+    expected: OrderStatus,
+    values: Dict[str, Any],
+    version: Optional[int],
+):
+    stmt = update(SearchOrder).where(*criteria, SearchOrder.status == expected)
+    if version is not None:
+        stmt = stmt.where(SearchOrder.version == version)
+    return stmt.values(version=SearchOrder.version + 1, **values)
+
+
+async def transition(
+    session: AsyncSession,
+    order_id: int,
+    expected: OrderStatus,
+    target: OrderStatus,
+    *,
+    version: Optional[int] = None,
+    values: Optional[Dict[str, Any]] = None,
+    returning: Iterable[Any] = (),
+    criteria: Iterable[Any] = (),
+) -> Optional[Row]:
+    """Move an order from ``expected`` to ``target``.  Does not commit.
+
+    Returns the new ``version`` followed by the ``returning`` columns, or
+    ``None`` if the order was not in ``expected`` (or not at ``version``,
+    or does not match the extra ``criteria``).  Raises
+    ``IllegalTransition`` if the change is not allowed.
+    """
+    if not can_transition(expected, target):
+        raise IllegalTransition(expected, target)
+    stmt = _conditional_update(
+        [SearchOrder.id == order_id, *criteria], expected, {"status": target, **(values or {})}, version
+    )
+    result = await session.execute(stmt.returning(SearchOrder.version, *returning))
+    row = result.one_or_none()
+    if row is None:
+        logger.info("Transição %s -> %s do pedido %s ignorada", expected.value, target.value, order_id)
+    return row
+
+
+async def transition_many(
+    session: AsyncSession,
+    criteria: Iterable[Any],
+    expected: OrderStatus,
+    target: OrderStatus,
+    *,
+    values: Optional[Dict[str, Any]] = None,
+) -> int:
+    """Move every order matching ``criteria`` and in ``expected`` to ``target``.
+
+    Returns the number of orders moved.  Does not commit.
+    """
+    if not can_transition(expected, target):
+        raise IllegalTransition(expected, target)
+    result = await session.execute(
+        _conditional_update(criteria, expected, {"status": target, **(values or {})}, None)
+    )
+    return result.rowcount
+
+
+async def update_in_state(
+    session: AsyncSession,
+    order_id: int,
+    expected: OrderStatus,
+    values: Dict[str, Any],
+    *,
+    version: Optional[int] = None,
+) -> bool:
+    """Write ``values`` only while the order is still in ``expected``.  Does not commit."""
+    result = await session.execute(
+        _conditional_update([SearchOrder.id == order_id], expected, values, version).returning(SearchOrder.id)
+    )
+    return result.one_or_none() is not None
+
+
+async def claim(session: AsyncSession, order_id: int, version: Optional[int] = None) -> Optional[SearchOrder]:
+    """Claim a paid order for one processing attempt.  Does not commit.
+
+    Bumps the version of a ``PROCESSING`` order (at ``version``, if
+    given) and returns it, loaded by the same statement; returns
+    ``None`` if the order is not waiting to be processed.
+    """
+    stmt = _conditional_update([SearchOrder.id == order_id], OrderStatus.PROCESSING, {}, version)
+    result = await session.execute(
+        stmt.returning(SearchOrder), execution_options={"synchronize_session": False}
+    )
+    return result.scalar_one_or_none()
@@ -0,0 +1,160 @@
+"""
+Asynchronous payment gateway backed by Stripe.
+
+``PaymentGateway`` wraps a ``stripe.StripeClient`` configured with the
+SDK's HTTPX transport, so checkout calls are natively async and share a
+pooled connection per process instead of blocking the event loop.  The
+API key is bound to the client rather than set globally on the
+``stripe`` module.
+
+Checkout creation is idempotent per order: an order that already has an
+open session gets it back, and new sessions are created with an
+idempotency key derived from the order, so concurrent client retries
+converge on a single session.  Batches of orders imported together are
+paid with one session whose metadata carries ``batch_id`` instead of
+``order_id``.  Point ``STRIPE_API_BASE`` at
+``app.stripe_stub`` to exercise the flow offline.
+"""
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+import stripe
+
+from .config import Settings, get_settings
+from .models import OrderBatch, SearchOrder
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class CheckoutSession:
+    """The parts of a Stripe Checkout session the API returns to clients."""
+
+    id: str
+    url: Optional[str]
+
+
+class PaymentGatewayNotConfigured(Exception):
+    """Raised when no valid Stripe API key is configured."""
+
+
+class PaymentGateway:
+    """Creates Stripe Checkout sessions without blocking the event loop."""
+
+    def __init__(self, settings: Settings) -> None:
+        if not settings.stripe_api_key or not settings.stripe_api_key.startswith("sk_"):
+            raise PaymentGatewayNotConfigured()
+        self._settings = settings
+        self._http_client = stripe.HTTPXClient(timeout=settings.stripe_timeout_seconds)
+        base_addresses = {"api": settings.stripe_api_base} if settings.stripe_api_base else {}
+        self._client = stripe.StripeClient(
+            settings.stripe_api_key,
+            http_client=self._http_client,
+            base_addresses=base_addresses,
+            max_network_retries=settings.stripe_max_network_retries,
+        )
+        # Parameters that do not depend on the order are built only once.
+        self._static_params: Dict[str, Any] = {"payment_method_types": ["card"], "mode": "payment"}
+        self._fixed_line_item: Optional[Dict[str, Any]] = None
+        # Verificamos se o stripe_price_id existe E se ele parece um ID válido.
+        # Se não, usamos a criação de preço dinâmica. Isso evita que comentários
+        # ou valores inválidos no .env quebrem a aplicação.
+        if settings.stripe_price_id and settings.stripe_price_id.startswith("price_"):
+            self._fixed_line_item = {"price": settings.stripe_price_id, "quantity": 1}
+
+    def line_item(self, order: SearchOrder) -> Dict[str, Any]:
+        """Return the Checkout line item for ``order``."""
+        if self._fixed_line_item is not None:
+            return dict(self._fixed_line_item)
+        return {
+            "price_data": {
+                "currency": "brl",
+                "product_data": {"name": f"Busca de Certidão ({order.target_name})"},
+                "unit_amount": int(round(order.order_price * 100)),
+            },
+            "quantity": 1,
+        }
+
+    def batch_line_item(self, batch: OrderBatch) -> Dict[str, Any]:
+        """Return the Checkout line item for all orders of ``batch``."""
+        if self._fixed_line_item is not None:
+            return {**self._fixed_line_item, "quantity": batch.order_count}
+        return {
+            "price_data": {
+                "currency": "brl",
+                "product_data": {"name": f"Busca de Certidões em lote ({batch.order_count} pedidos)"},
+                "unit_amount": int(round(batch.total_price * 100)),
+            },
+            "quantity": 1,
+        }
+
+    async def _open_or_create(
+        self, existing_session_id: Optional[str], params: Dict[str, Any], idempotency_key: str, label: str
+    ) -> CheckoutSession:
+        if existing_session_id:
+            existing = await self._client.checkout.sessions.retrieve_async(existing_session_id)
+            if existing.status == "open":
+                logger.info(f"Reutilizando sessão do Stripe {existing.id} para o {label}")
+                return CheckoutSession(id=existing.id, url=existing.url)
+        logger.info(f"Criando sessão no Stripe para o {label} com o item: {params['line_items'][0]}")
+        created = await self._client.checkout.sessions.create_async(
+            params=params, options={"idempotency_key": idempotency_key}
+        )
+        return CheckoutSession(id=created.id, url=created.url)
+
+    async def create_checkout_session(self, order: SearchOrder) -> CheckoutSession:
+        """Return an open Checkout session for ``order``, creating one if needed.
+
+        Raises ``stripe.error.StripeError`` on API or network failures.
+        """
+        settings = self._settings
+        params: Dict[str, Any] = {
+            **self._static_params,
+            "line_items": [self.line_item(order)],
+            "success_url": f"{settings.frontend_base_url}/app/dashboard?payment=success&order_id={order.id}",
+            "cancel_url": f"{settings.frontend_base_url}/checkout/{order.id}?payment=cancelled",
+            "metadata": {"order_id": str(order.id)},
+        }
+        # The key changes only once the previous session is no longer open,
+        # so retries of the same attempt reuse the session Stripe created.
+        idempotency_key = f"checkout-order-{order.id}-{order.stripe_session_id or 'first'}"
+        return await self._open_or_create(order.stripe_session_id, params, idempotency_key, f"pedido {order.id}")
+
+    async def create_batch_checkout_session(self, batch: OrderBatch) -> CheckoutSession:
+        """Return an open Checkout session paying every order of ``batch``.
+
+        Raises ``stripe.error.StripeError`` on API or network failures.
+        """
+        settings = self._settings
+        params: Dict[str, Any] = {
+            **self._static_params,
+            "line_items": [self.batch_line_item(batch)],
+            "success_url": f"{settings.frontend_base_url}/app/dashboard?payment=success&batch_id={batch.id}",
+            "cancel_url": f"{settings.frontend_base_url}/app/dashboard?payment=cancelled&batch_id={batch.id}",
+            "metadata": {"batch_id": str(batch.id)},
+        }
+        idempotency_key = f"checkout-batch-{batch.id}-{batch.stripe_session_id or 'first'}"
+        return await self._open_or_create(batch.stripe_session_id, params, idempotency_key, f"lote {batch.id}")
+
+    async def close(self) -> None:
+        """Release pooled HTTP connections."""
+        await self._http_client.close_async()
+
+
+@lru_cache()
+def get_payment_gateway() -> PaymentGateway:
+    """Return the process-wide ``PaymentGateway``.
+
+    Raises ``PaymentGatewayNotConfigured`` if Stripe is not configured.
+    """
+    return PaymentGateway(get_settings())
+
+
+async def close_payment_gateway() -> None:
+    """Close the gateway created by ``get_payment_gateway``, if any."""
+    if get_payment_gateway.cache_info().currsize:
+        await get_payment_gateway().close()
+        get_payment_gateway.cache_clear()
@@ -0,0 +1,156 @@
+"""
+Routing of read-only sessions to read replicas.
+
+Read-heavy endpoints take their session from ``read_session`` (through
+``dependencies.get_read_session``) instead of ``get_session``.  Each
+read session goes to the next healthy replica in round-robin order, or
+to the primary when:
+
+* no replica is configured or healthy, or
+* the user wrote within ``database_read_your_writes_seconds``
+  (see ``utils.recent_writes``), so they see their own changes.
+
+``run_health_checks`` runs with the API and queries every replica each
+``database_replica_health_check_seconds``: a replica that does not
+answer within ``database_replica_health_timeout_seconds``, or lags the
+primary by more than ``database_replica_max_lag_seconds``, stops
+receiving reads until a later check passes.  Replicas start out of
+rotation until their first check, and a connection error during a read
+takes a replica out immediately.
+"""
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from typing import AsyncIterator, List, Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.ext.asyncio import async_sessionmaker as _async_sessionmaker
+
+from .config import Settings, get_settings
+from .database import async_session_maker, replica_engines
+from .metrics import DB_READ_SESSIONS, DB_REPLICA_HEALTHY, DB_REPLICA_LAG
+from .utils.recent_writes import wrote_recently
+
+
+logger = logging.getLogger(__name__)
+
+# Seconds since the last replayed transaction, or 0 when the replica has
+# replayed everything it received (an idle primary writes nothing new).
+_PG_LAG = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0"
+    " ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+)
+_NO_LAG = text("SELECT 0")
+
+
+class Replica:
+    """A read replica engine and its health."""
+
+    def __init__(self, name: str, engine: AsyncEngine) -> None:
+        self.name = name
+        self.engine = engine
+        self.session_maker = _async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
+        self.healthy = False
+        DB_REPLICA_HEALTHY.labels(name).set(0)
+
+    def set_healthy(self, healthy: bool, reason: str = "") -> None:
+        if healthy != self.healthy:
+            if healthy:
+                logger.info("Réplica %s de volta à rotação", self.name)
+            else:
+                logger.warning("Réplica %s fora de rotação: %s", self.name, reason)
+        self.healthy = healthy
+        DB_REPLICA_HEALTHY.labels(self.name).set(int(healthy))
+
+
+class ReplicaSet:
+    """Round-robin choice among the healthy replicas."""
+
+    def __init__(self, engines: List[AsyncEngine], settings: Settings) -> None:
+        # Replicas are named by position so that URLs (and passwords) stay out of metrics and logs
+        self.replicas = [Replica(str(index), engine) for index, engine in enumerate(engines)]
+        self._settings = settings
+        self._next = 0
+
+    def pick(self) -> Optional[Replica]:
+        """Return the next healthy replica, or ``None`` if there is none."""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        self._next = (self._next + 1) % len(healthy)
+        return healthy[self._next]
+
+    async def _lag(self, replica: Replica) -> float:
+        query = _PG_LAG if replica.engine.dialect.name == "postgresql" else _NO_LAG
+        async with replica.engine.connect() as conn:
+            return float(await conn.scalar(query) or 0)
+
+    async def check(self, replica: Replica) -> None:
+        """Measure ``replica``'s lag and update whether it receives reads."""
+        try:
+            lag = await asyncio.wait_for(self._lag(replica), self._settings.database_replica_health_timeout_seconds)
+        except asyncio.TimeoutError:
+            replica.set_healthy(False, "health check timed out")
+            return
+        except (DBAPIError, OSError) as exc:
+            replica.set_healthy(False, str(exc))
+            return
+        DB_REPLICA_LAG.labels(replica.name).set(lag)
+        if lag > self._settings.database_replica_max_lag_seconds:
+            replica.set_healthy(False, f"lag of {lag:.1f}s")
+        else:
+            replica.set_healthy(True)
+
+    async def check_all(self) -> None:
+        """Check every replica concurrently."""
+        await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+
+
+@lru_cache()
+def get_replica_set() -> ReplicaSet:
+    """Return the process-wide ``ReplicaSet`` of ``database.replica_engines``."""
+    return ReplicaSet(replica_engines, get_settings())
+
+
+@asynccontextmanager
+async def read_session(user_id: Optional[int] = None) -> AsyncIterator[AsyncSession]:
+    """Yield a session for reads only, on a replica when possible.
+
+    ``user_id`` is the authenticated user, whose recent writes keep the
+    session on the primary.
+    """
+    replica: Optional[Replica] = None
+    if not replica_engines:
+        target = "primary"
+    elif user_id is not None and await wrote_recently(user_id):
+        target = "primary_sticky"
+    else:
+        replica = get_replica_set().pick()
+        target = "replica" if replica is not None else "primary_fallback"
+    DB_READ_SESSIONS.labels(target).inc()
+
+    session_maker = replica.session_maker if replica is not None else async_session_maker
+    async with session_maker() as session:
+        try:
+            yield session
+        except DBAPIError as exc:
+            if replica is not None and (exc.connection_invalidated or isinstance(exc, (OperationalError, InterfaceError))):
+                replica.set_healthy(False, str(exc))
+            raise
+
+
+async def run_health_checks() -> None:
+    """Keep the health of the replicas current; runs until cancelled."""
+    replica_set = get_replica_set()
+    interval = get_settings().database_replica_health_check_seconds
+    while True:
+        try:
+            await replica_set.check_all()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Replica health check failed")
+        await asyncio.sleep(interval)
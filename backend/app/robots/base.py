@@ -5,16 +5,78 @@ Each source must implement the ``search`` method which accepts a
 ``SearchOrder`` and returns a ``SearchResult`` instance reflecting
 whether the certificate was found.  Sources should handle their own
 errors internally and return an appropriate status.
+
+Sources also declare which orders they can answer: the Brazilian states
+they cover, the range of birth years their records span and the order
+fields they need.  ``not_applicable_reason`` checks an order against
+that coverage without any I/O, so the coordinator can skip a source
+before any browser, connection or rate-limit token is spent on it.
 """
 import abc
+import re
+import unicodedata
+from typing import FrozenSet, Optional, Tuple
+
 from .. import models
 
 
+# Full state names (accent-folded, upper case) to their UF codes
+_STATE_CODES = {
+    "ACRE": "AC", "ALAGOAS": "AL", "AMAPA": "AP", "AMAZONAS": "AM", "BAHIA": "BA",
+    "CEARA": "CE", "DISTRITO FEDERAL": "DF", "ESPIRITO SANTO": "ES", "GOIAS": "GO",
+    "MARANHAO": "MA", "MATO GROSSO": "MT", "MATO GROSSO DO SUL": "MS", "MINAS GERAIS": "MG",
+    "PARA": "PA", "PARAIBA": "PB", "PARANA": "PR", "PERNAMBUCO": "PE", "PIAUI": "PI",
+    "RIO DE JANEIRO": "RJ", "RIO GRANDE DO NORTE": "RN", "RIO GRANDE DO SUL": "RS",
+    "RONDONIA": "RO", "RORAIMA": "RR", "SANTA CATARINA": "SC", "SAO PAULO": "SP",
+    "SERGIPE": "SE", "TOCANTINS": "TO",
+}
+
+_YEAR = re.compile(r"\b(1[5-9]\d\d|20\d\d)\b")
+
+
+def normalize_state(value: Optional[str]) -> Optional[str]:
+    """Return the UF code for a state code or name, or ``None`` if unknown."""
+    if not value:
+        return None
+    folded = unicodedata.normalize("NFKD", value).encode("ascii", "ignore").decode().strip().upper()
+    if folded in _STATE_CODES.values():
+        return folded
+    return _STATE_CODES.get(folded)
+
+
+def approximate_year(value: Optional[str]) -> Optional[int]:
+    """Extract a year from a free-form approximate date such as "c. 1920"."""
+    match = _YEAR.search(value or "")
+    return int(match.group(1)) if match else None
+
+
 class SearchSource(abc.ABC):
     """Abstract base class for a search source."""
 
     name: str
 
+    # Coverage.  ``None`` means unrestricted; orders whose state or year
+    # cannot be determined are always considered covered.
+    states: Optional[FrozenSet[str]] = None
+    years: Optional[Tuple[Optional[int], Optional[int]]] = None
+    required_fields: Tuple[str, ...] = ()
+
+    def not_applicable_reason(self, order: models.SearchOrder) -> Optional[str]:
+        """Return why this source cannot answer ``order``, or ``None``."""
+        for field in self.required_fields:
+            if not getattr(order, field, None):
+                return f"Campo obrigatório não informado: {field}."
+        if self.states is not None:
+            state = normalize_state(order.target_state)
+            if state is not None and state not in self.states:
+                return f"Fonte não cobre o estado {state}."
+        if self.years is not None:
+            year = approximate_year(order.target_dob_approx)
+            first, last = self.years
+            if year is not None and ((first is not None and year < first) or (last is not None and year > last)):
+                return f"Fonte não cobre registros de {year}."
+        return None
+
     @abc.abstractmethod
     async def search(self, order: models.SearchOrder) -> models.SearchResult:
         """Search for the certificate corresponding to the given order.
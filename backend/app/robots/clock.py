@@ -0,0 +1,85 @@
+"""
+Time source for the search robots.
+
+Robots never read the wall clock or call ``asyncio.sleep`` directly;
+they use ``now`` and ``sleep`` from this module, which follow the time
+of the running event loop.  On a normal loop that is
+``time.monotonic``.  On ``VirtualTimeEventLoop`` time is simulated:
+whenever nothing but timers is left to run, the loop jumps straight to
+the next deadline instead of blocking.  Sleeps, timeouts, retries, rate
+limits and backoff therefore complete instantly but fire in the same
+order as in real time, which lets pipeline tests and simulations run
+thousands of orders in seconds.
+
+The loop cannot tell a task waiting for a timer from one waiting for a
+database driver thread, so before each jump it waits up to
+``idle_threshold`` real seconds for I/O; driver threads wake the loop
+through ``call_soon_threadsafe``, so work that would have completed
+before the next deadline still does.  The loop only wraps the selector
+it hands to ``SelectorEventLoop``.
+"""
+import asyncio
+import selectors
+import time
+from typing import Any, Coroutine, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def now() -> float:
+    """Return the current time of the running loop, in seconds."""
+    return asyncio.get_running_loop().time()
+
+
+async def sleep(seconds: float) -> None:
+    """Suspend the calling task for ``seconds`` of loop time."""
+    await asyncio.sleep(seconds)
+
+
+class _VirtualSelector:
+    """Selector wrapper that advances virtual time instead of blocking."""
+
+    def __init__(self, selector: selectors.BaseSelector, idle_threshold: float) -> None:
+        self._selector = selector
+        self._idle_threshold = idle_threshold
+        self.now = time.monotonic()
+
+    def select(self, timeout: Optional[float] = None):  # type: ignore[no-untyped-def]
+        # The loop passes a zero timeout while callbacks are ready, the
+        # delay to its next timer when only timers remain, and ``None``
+        # when nothing is scheduled and only real I/O can wake it.
+        if timeout is None or timeout <= 0:
+            return self._selector.select(timeout)
+        events = self._selector.select(min(timeout, self._idle_threshold))
+        if not events:
+            self.now += timeout
+        return events
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._selector, name)
+
+
+class VirtualTimeEventLoop(asyncio.SelectorEventLoop):
+    """Event loop whose clock advances only when the loop would be idle."""
+
+    def __init__(self, idle_threshold: float = 0.002) -> None:
+        self._virtual_selector = _VirtualSelector(selectors.DefaultSelector(), idle_threshold)
+        super().__init__(self._virtual_selector)  # type: ignore[arg-type]
+
+    def time(self) -> float:
+        return self._virtual_selector.now
+
+    def advance(self, seconds: float) -> None:
+        """Move the virtual clock forward by ``seconds``."""
+        self._virtual_selector.now += seconds
+
+
+def run_virtual(main: Coroutine[Any, Any, T], idle_threshold: float = 0.002) -> T:
+    """Run ``main`` to completion on a new ``VirtualTimeEventLoop``."""
+    with asyncio.Runner(loop_factory=lambda: VirtualTimeEventLoop(idle_threshold)) as runner:
+        return runner.run(main)
+
+
+def run(main: Coroutine[Any, Any, T], virtual: bool = False) -> T:
+    """Run ``main`` like ``asyncio.run``, in virtual time if ``virtual``."""
+    return run_virtual(main) if virtual else asyncio.run(main)
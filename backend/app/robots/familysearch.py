@@ -1,16 +1,18 @@
 """
 Implementation of the FamilySearch search source.
 """
-import asyncio
 
+from . import clock
 from .base import SearchSource
 from .. import models
 
 class FamilySearchSource(SearchSource):
     name = "FamilySearch.org"
+    # Acervo de imigração: registros de chegada entre 1850 e 1950
+    years = (1850, 1950)
 
     async def search(self, order: models.SearchOrder) -> models.SearchResult:
-        await asyncio.sleep(2)  # Simula uma busca mais demorada
+        await clock.sleep(2)  # Simula uma busca mais demorada
         
         # Simula a criação de um relatório detalhado e um caminho para a "prova"
         search_summary = (
@@ -7,19 +7,21 @@ Because scraping external sites is not possible in this environment, a
 placeholder implementation is provided which returns a simulated
 successful search for demonstration purposes.
 """
-import asyncio
 from typing import Optional
 
+from . import clock
 from .base import SearchSource
 from .. import models
 
 
 class RegistroCivilSource(SearchSource):
     name = "RegistroCivil.org.br"
+    # Civil registration became mandatory in Brazil in 1889
+    years = (1889, None)
 
     async def search(self, order: models.SearchOrder) -> models.SearchResult:
         # Simulate a network delay
-        await asyncio.sleep(1)
+        await clock.sleep(1)
         # Simulate a found result for demonstration
         found_data = {
             "cartorio": "Cartório Central",
@@ -0,0 +1,127 @@
+"""
+Adaptive ordering of search sources.
+
+``SourceScheduler.plan`` decides in which order the sources of an order
+are queried.  Each source is scored by its estimated probability of
+finding the certificate divided by its mean latency, so cheap sources
+that often succeed come first and the expected time to the first hit is
+minimised.  Estimates come from ``source_stats_daily`` for the order's
+``target_state`` and birth-year era (``source_stats.era_key``), falling
+back to the state alone, the era alone and finally the source's totals
+while a level has fewer than ``source_scheduler_min_samples`` results.
+All are smoothed towards an optimistic prior, so sources without
+history are tried early.
+
+Sources whose score is below ``source_scheduler_min_hits_per_second``
+are not queried, nor those past the best
+``source_scheduler_max_sources`` (0: no limit); the best source is
+always kept.  With probability ``source_scheduler_epsilon`` an order
+instead queries every source in a random order (exploration), which
+keeps estimates of currently unfavoured or cut sources fresh.  The
+rollup is read at most once per ``source_scheduler_refresh_seconds`` per
+process.
+"""
+import random
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from ..config import Settings, get_settings
+from ..database import async_session_maker
+from ..models import SearchOrder
+from ..source_stats import SourceTotals, TotalsKey, era_key, load_totals
+from .base import SearchSource
+
+
+# Prior used to smooth estimates: equivalent to PRIOR_WEIGHT results with
+# a PRIOR_HIT_PROBABILITY hit rate and PRIOR_COST_MS latency.
+PRIOR_WEIGHT = 2.0
+PRIOR_HIT_PROBABILITY = 0.5
+PRIOR_COST_MS = 1000.0
+
+
+@dataclass(frozen=True)
+class SourceEstimate:
+    """Estimated hit probability and latency of a source."""
+
+    hit_probability: float
+    cost_ms: float
+    samples: int
+
+    @property
+    def score(self) -> float:
+        """Expected hits per second of latency."""
+        return self.hit_probability * 1000 / max(self.cost_ms, 1.0)
+
+
+def estimate(totals: Optional[SourceTotals]) -> SourceEstimate:
+    """Return the smoothed estimate for ``totals`` (``None``: no history)."""
+    if totals is None:
+        return SourceEstimate(PRIOR_HIT_PROBABILITY, PRIOR_COST_MS, 0)
+    hit_probability = (totals.found + PRIOR_HIT_PROBABILITY * PRIOR_WEIGHT) / (totals.total + PRIOR_WEIGHT)
+    cost_ms = (totals.duration_ms_sum + PRIOR_COST_MS * PRIOR_WEIGHT) / (totals.duration_count + PRIOR_WEIGHT)
+    return SourceEstimate(hit_probability, cost_ms, totals.total)
+
+
+class SourceScheduler:
+    """Orders sources by estimated hit probability per unit of latency."""
+
+    def __init__(self, settings: Settings, rng: Optional[random.Random] = None) -> None:
+        self._settings = settings
+        self._rng = rng or random.Random()
+        self._totals: Dict[TotalsKey, SourceTotals] = {}
+        self._loaded_at: Optional[float] = None
+
+    async def _current_totals(self) -> Dict[TotalsKey, SourceTotals]:
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at >= self._settings.source_scheduler_refresh_seconds:
+            async with async_session_maker() as session:
+                self._totals = await load_totals(session, self._settings.source_scheduler_window_days)
+            self._loaded_at = now
+        return self._totals
+
+    def estimate_for(
+        self, totals: Dict[TotalsKey, SourceTotals], source_name: str, target_state: str, era: str = ""
+    ) -> SourceEstimate:
+        """Estimate ``source_name`` for ``target_state`` and ``era``, or more broadly."""
+        keys = [(source_name, target_state, era), (source_name, target_state, None)]
+        if era:
+            keys.append((source_name, None, era))
+        for key in keys:
+            found = totals.get(key)
+            if found is not None and found.total >= self._settings.source_scheduler_min_samples:
+                return estimate(found)
+        return estimate(totals.get((source_name, None, None)))
+
+    async def plan(self, order: SearchOrder, sources: List[SearchSource]) -> Tuple[List[SearchSource], bool]:
+        """Return the sources to query, in order, and whether the plan is exploratory.
+
+        Sources left out of the returned list are not worth querying.
+        """
+        if len(sources) < 2 or not self._settings.source_scheduler_enabled:
+            return sources, False
+        if self._rng.random() < self._settings.source_scheduler_epsilon:
+            explored = list(sources)
+            self._rng.shuffle(explored)
+            return explored, True
+        totals = await self._current_totals()
+        state = (order.target_state or "").strip()
+        era = era_key(order.target_dob_approx)
+        scores = {source.name: self.estimate_for(totals, source.name, state, era).score for source in sources}
+        # ``sorted`` is stable: ties keep the configured order.
+        ranked = sorted(sources, key=lambda source: -scores[source.name])
+        if self._settings.source_scheduler_max_sources > 0:
+            ranked = ranked[: self._settings.source_scheduler_max_sources]
+        minimum = self._settings.source_scheduler_min_hits_per_second
+        return ranked[:1] + [source for source in ranked[1:] if scores[source.name] >= minimum], False
+
+    def invalidate(self) -> None:
+        """Reload the rollup on the next ``plan``."""
+        self._loaded_at = None
+
+
+@lru_cache()
+def get_scheduler() -> SourceScheduler:
+    """Return the process-wide ``SourceScheduler``."""
+    return SourceScheduler(get_settings())
@@ -3,20 +3,55 @@ Coordinator for executing search robots.
 
 The ``run_search`` function instantiates each configured search source,
 invokes it for the given order, persists the results and returns the
-list of ``SearchResult`` instances.  The default implementation runs
-the sources sequentially, but you could extend it to run in
-parallel using asyncio.gather for improved performance.
+list of ``SearchResult`` instances.  The sources run sequentially, in
+the order chosen by the adaptive scheduler (``robots.scheduler``) so
+that likely, fast sources are queried first.
+
+The configured sources are kept in a small registry of factories.
+``register_sources`` replaces them, which lets benchmarks and
+simulations drive the real pipeline with fake sources;
+``reset_sources`` restores the defaults.
 """
-from typing import List
+from typing import Callable, List, Sequence
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .. import tracing
+from ..config import get_settings
 from ..database import async_session_maker
-from ..models import SearchOrder, SearchResult
+from ..metrics import SOURCE_SEARCH_DURATION, SOURCE_SEARCH_RESULTS
+from ..models import ResultStatus, SearchOrder, SearchResult
+from ..source_stats import record_results
+from ..utils.order_cache import bump_orders_version
 
+from . import clock, singleflight
 from .registrocivil import RegistroCivilSource
 from .familysearch import FamilySearchSource
 from .tjsp import TJSPortalSource
+from .base import SearchSource
+from .scheduler import get_scheduler
+
+
+SourceFactory = Callable[[], SearchSource]
+
+DEFAULT_SOURCES: Sequence[SourceFactory] = (RegistroCivilSource, FamilySearchSource, TJSPortalSource)
+
+_source_factories: List[SourceFactory] = list(DEFAULT_SOURCES)
+
+
+def register_sources(factories: Sequence[SourceFactory]) -> None:
+    """Use ``factories`` to build the sources of subsequent searches."""
+    _source_factories[:] = factories
+
+
+def reset_sources() -> None:
+    """Restore the default sources."""
+    register_sources(DEFAULT_SOURCES)
+
+
+def get_sources() -> List[SearchSource]:
+    """Instantiate the configured sources, in execution order."""
+    return [factory() for factory in _source_factories]
 
 
 async def run_search(order: SearchOrder) -> List[SearchResult]:
@@ -24,16 +59,61 @@ async def run_search(order: SearchOrder) -> List[SearchResult]:
 
     Instantiates each source, performs the search and stores the
     resulting ``SearchResult`` rows in the database.  Returns the list
-    of results so that the caller may inspect statuses.
+    of results so that the caller may inspect statuses.  Sources are
+    queried in the order chosen by ``scheduler.get_scheduler()``; with
+    ``search_stop_on_first_hit`` the search ends at the first FOUND.
+    Sources whose coverage excludes the order are not queried and get a
+    ``NOT_APPLICABLE`` result instead; those the scheduler leaves out as
+    unlikely to pay off get a ``SKIPPED`` one.
     """
-    sources = [RegistroCivilSource(), FamilySearchSource(), TJSPortalSource()]
     results: List[SearchResult] = []
+    applicable: List[SearchSource] = []
+
+    def not_queried(source: SearchSource, status: ResultStatus, reason: str) -> None:
+        results.append(
+            SearchResult(
+                order_id=order.id,
+                source_name=source.name,
+                status=status,
+                details=reason,
+            )
+        )
+        SOURCE_SEARCH_RESULTS.labels(source.name, status.value).inc()
+
+    for source in get_sources():
+        reason = source.not_applicable_reason(order)
+        if reason is None:
+            applicable.append(source)
+        else:
+            not_queried(source, ResultStatus.NOT_APPLICABLE, reason)
+    sources, exploring = await get_scheduler().plan(order, applicable)
+    for source in applicable:
+        if source not in sources:
+            not_queried(
+                source, ResultStatus.SKIPPED, "Fonte não consultada: baixa chance estimada de encontrar a certidão."
+            )
+    stop_on_first_hit = get_settings().search_stop_on_first_hit
     for source in sources:
-        res = await source.search(order)
+        started = clock.now()
+        with tracing.span(
+            "source.search", source=source.name, order_id=order.id, exploring=exploring
+        ) as source_span:
+            res = await singleflight.search(source, order)
+            if source_span:
+                source_span.set("result.status", res.status.value)
+        elapsed = clock.now() - started
+        if res.duration_ms is None:
+            res.duration_ms = int(elapsed * 1000)
+        SOURCE_SEARCH_DURATION.labels(source.name, res.status.value).observe(elapsed)
+        SOURCE_SEARCH_RESULTS.labels(source.name, res.status.value).inc()
         results.append(res)
+        if stop_on_first_hit and res.status == ResultStatus.FOUND:
+            break
     # Persist results
     async with async_session_maker() as session:  # type: AsyncSession
         for res in results:
             session.add(res)
+        await record_results(session, order, results)
+        await bump_orders_version(session, order.user_id)
         await session.commit()
     return results
@@ -0,0 +1,208 @@
+"""
+Single-flight coalescing of identical source lookups.
+
+When several orders search the same person at the same time (the same
+target bought by different customers, or a re-submitted order), only
+one lookup per ``(source, normalised target)`` actually reaches the
+source.  The others wait for it and receive a copy of its result for
+their own order, marked ``coalesced`` so that the statistics rollup only
+counts the lookup once.  Only conclusive results (``FOUND`` or
+``NOT_FOUND``) are shared: when the leader's source was unavailable or
+failed, each follower queries the source itself.
+
+Within a process, concurrent lookups share an ``asyncio.Future``.
+Across workers the leader is elected with a Redis lock (``SET NX`` with
+an expiry); when it finishes it stores the result under a short-lived
+key and publishes it on a per-key channel.  Followers subscribe, wait
+while the lock exists and fall back to querying the source themselves
+if the leader fails or the lock expires.  Without Redis, lookups are
+only coalesced within the process.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import secrets
+import weakref
+from typing import Any, Dict, Optional, Tuple
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from .. import models
+from ..config import get_settings
+from ..metrics import SOURCE_SEARCH_COALESCED
+from ..utils.cache import redis_suspended, suspend_redis
+from ..utils.text import fold
+from . import clock
+from .base import SearchSource, approximate_year, normalize_state
+
+
+logger = logging.getLogger(__name__)
+
+ResultData = Dict[str, Any]
+
+# Deletes the lock only if this leader still owns it
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_RESULT_FIELDS = ("status", "details", "found_data_json", "screenshot_path", "duration_ms")
+
+_CONCLUSIVE = frozenset({models.ResultStatus.FOUND.value, models.ResultStatus.NOT_FOUND.value})
+
+# In-flight lookups and Redis clients per event loop: Celery tasks each
+# run on their own loop, and neither can be shared between loops.
+_flights: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]" = (
+    weakref.WeakKeyDictionary()
+)
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aioredis.Redis]" = weakref.WeakKeyDictionary()
+
+
+def coalescing_key(source: SearchSource, order: models.SearchOrder) -> str:
+    """Return the key identifying lookups of the same target in ``source``."""
+    target = "|".join(
+        (
+            fold(order.target_name),
+            str(approximate_year(order.target_dob_approx) or fold(order.target_dob_approx)),
+            fold(order.target_city),
+            normalize_state(order.target_state) or fold(order.target_state),
+            fold(order.target_parents_names),
+        )
+    )
+    return hashlib.sha256(f"{source.name}\n{target}".encode()).hexdigest()
+
+
+def _dump(result: models.SearchResult) -> ResultData:
+    data = {field: getattr(result, field) for field in _RESULT_FIELDS}
+    data["status"] = result.status.value
+    return data
+
+
+def _shareable(data: Optional[ResultData]) -> bool:
+    return data is not None and data["status"] in _CONCLUSIVE
+
+
+def _copy(data: ResultData, source: SearchSource, order: models.SearchOrder) -> models.SearchResult:
+    values = dict(data)
+    values["status"] = models.ResultStatus(values["status"])
+    return models.SearchResult(order_id=order.id, source_name=source.name, coalesced=True, **values)
+
+
+def _redis() -> aioredis.Redis:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        # No socket timeout: followers block on the channel for a while.
+        client = aioredis.from_url(
+            get_settings().redis_url, socket_connect_timeout=get_settings().redis_cache_timeout_seconds
+        )
+        _clients[loop] = client
+    return client
+
+
+async def _search(source: SearchSource, order: models.SearchOrder) -> models.SearchResult:
+    started = clock.now()
+    result = await source.search(order)
+    if result.duration_ms is None:
+        result.duration_ms = int((clock.now() - started) * 1000)
+    return result
+
+
+async def _wait_for_leader(redis: aioredis.Redis, key: str) -> Optional[ResultData]:
+    """Return the leader's result, or ``None`` if it gave up without one."""
+    settings = get_settings()
+    pubsub = redis.pubsub()
+    try:
+        await pubsub.subscribe(f"singleflight:{key}")
+        deadline = clock.now() + settings.singleflight_lock_seconds
+        while clock.now() < deadline:
+            raw = await redis.get(f"singleflight:result:{key}")
+            if raw is not None:
+                return json.loads(raw)
+            if not await redis.exists(f"singleflight:lock:{key}"):
+                return None
+            message = await pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            if message is not None:
+                return json.loads(message["data"])
+        return None
+    finally:
+        await pubsub.aclose()
+
+
+async def _distributed(
+    source: SearchSource, order: models.SearchOrder, key: str
+) -> Tuple[ResultData, models.SearchResult]:
+    """Run the lookup once across workers; returns its data and this order's result."""
+    settings = get_settings()
+    if redis_suspended():
+        result = await _search(source, order)
+        return _dump(result), result
+    redis = _redis()
+    token = secrets.token_hex(8)
+    lock_key = f"singleflight:lock:{key}"
+    try:
+        leader = await redis.set(lock_key, token, nx=True, ex=settings.singleflight_lock_seconds)
+        if not leader:
+            data = await _wait_for_leader(redis, key)
+            if _shareable(data):
+                SOURCE_SEARCH_COALESCED.labels(source.name, "cluster").inc()
+                return data, _copy(data, source, order)
+    except RedisError as exc:
+        logger.debug("Single-flight lookup in Redis failed: %s", exc)
+        suspend_redis()
+        leader = False
+    if not leader:
+        result = await _search(source, order)
+        return _dump(result), result
+
+    try:
+        result = await _search(source, order)
+    except BaseException:
+        await _release(redis, lock_key, token)
+        raise
+    data = _dump(result)
+    try:
+        payload = json.dumps(data)
+        await redis.set(f"singleflight:result:{key}", payload, ex=settings.singleflight_result_ttl_seconds)
+        await redis.publish(f"singleflight:{key}", payload)
+    except RedisError as exc:
+        logger.debug("Could not publish single-flight result: %s", exc)
+    await _release(redis, lock_key, token)
+    return data, result
+
+
+async def _release(redis: aioredis.Redis, lock_key: str, token: str) -> None:
+    try:
+        await redis.eval(_RELEASE_SCRIPT, 1, lock_key, token)
+    except RedisError as exc:
+        logger.debug("Could not release single-flight lock: %s", exc)
+
+
+async def search(source: SearchSource, order: models.SearchOrder) -> models.SearchResult:
+    """Query ``source`` for ``order``, sharing identical concurrent lookups."""
+    if not get_settings().singleflight_enabled:
+        return await _search(source, order)
+    key = coalescing_key(source, order)
+    flights = _flights.setdefault(asyncio.get_running_loop(), {})
+    flight = flights.get(key)
+    if flight is not None:
+        data = await asyncio.shield(flight)
+        if _shareable(data):
+            SOURCE_SEARCH_COALESCED.labels(source.name, "process").inc()
+            return _copy(data, source, order)
+        # The leader failed or got no answer: search on our own.
+        return await _search(source, order)
+
+    flight = asyncio.get_running_loop().create_future()
+    flights[key] = flight
+    data: Optional[ResultData] = None
+    try:
+        data, result = await _distributed(source, order, key)
+        return result
+    finally:
+        del flights[key]
+        flight.set_result(data)
@@ -1,16 +1,18 @@
 """
 Implementation of the TJSPortal search source.
 """
-import asyncio
 
+from . import clock
 from .base import SearchSource
 from .. import models
 
 class TJSPortalSource(SearchSource):
     name = "TJSP Portal"
+    # O portal só tem processos do Tribunal de Justiça de São Paulo
+    states = frozenset({"SP"})
 
     async def search(self, order: models.SearchOrder) -> models.SearchResult:
-        await asyncio.sleep(1.5) # Simula busca
+        await clock.sleep(1.5) # Simula busca
         
         search_summary = (
             f"Consulta realizada no portal do Tribunal de Justiça de São Paulo "
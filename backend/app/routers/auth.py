@@ -4,6 +4,8 @@ Authentication endpoints for RaizDigital.
 This router implements user registration and login.  Passwords are
 hashed before storage, and successful logins return a JWT access
 token.  The login endpoint uses the standard OAuth2 password grant.
+Hashing runs off the event loop; when the hashing pool is saturated
+the request fails with 503 (see ``main.create_app``).
 """
 from datetime import timedelta
 
@@ -15,12 +17,13 @@ from datetime import datetime, timedelta
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .. import models, schemas
+from .. import models, schemas, task_publisher
 from ..database import get_session
 from ..utils import security
 from ..config import get_settings
 from ..tasks_utils import send_email_task
 from ..models import PasswordResetToken
+from ..utils.user_cache import invalidate_user
 
 
 router = APIRouter(prefix="/auth", tags=["auth"])
@@ -37,11 +40,13 @@ async def register_user(user_in: schemas.UserCreate, session: AsyncSession = Dep
     existing_user = result.scalar_one_or_none()
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    hashed_password = security.get_password_hash(user_in.password)
+    hashed_password = await security.get_password_hash_async(user_in.password)
     user = models.User(email=user_in.email, full_name=user_in.full_name, password_hash=hashed_password)
     session.add(user)
     await session.commit()
     await session.refresh(user)
+    # The new user's first reads must not hit a replica that lacks the row
+    session.info["user_id"] = user.id
     # Send welcome email asynchronously
     subject = "Bem-vindo ao RaizDigital"
     body = (
@@ -49,7 +54,7 @@ async def register_user(user_in: schemas.UserCreate, session: AsyncSession = Dep
         "Obrigado por se registrar no RaizDigital. Agora você pode iniciar suas buscas de certidões diretamente pelo seu painel.\n\n"
         "Atenciosamente,\nEquipe RaizDigital"
     )
-    send_email_task.delay(user.email, subject, body)
+    await task_publisher.publish(send_email_task, user.email, subject, body)
     return user
 
 
@@ -61,12 +66,19 @@ async def login_for_access_token(
     """Authenticate a user and return a JWT token on success."""
     result = await session.execute(select(models.User).where(models.User.email == form_data.username))
     user = result.scalar_one_or_none()
-    if not user or not security.verify_password(form_data.password, user.password_hash):
+    valid, new_hash = (False, None)
+    if user:
+        valid, new_hash = await security.verify_and_update_password_async(form_data.password, user.password_hash)
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    # Transparently upgrade hashes created with a different bcrypt cost
+    if new_hash:
+        user.password_hash = new_hash
+        await session.commit()
     # Create access and refresh tokens
     access_token = security.create_access_token(data={"user_id": user.id})
     refresh_token = security.create_refresh_token(data={"user_id": user.id})
@@ -97,7 +109,7 @@ async def forgot_password(request: schemas.ForgotPasswordRequest, session: Async
             "Se você não solicitou esta redefinição, ignore este e-mail.\n\n"
             "Atenciosamente,\nEquipe RaizDigital"
         )
-        send_email_task.delay(user.email, subject, body)
+        await task_publisher.publish(send_email_task, user.email, subject, body)
     return {"detail": "Se o e-mail estiver registrado, enviaremos instruções de redefinição"}
 
 
@@ -115,10 +127,11 @@ async def reset_password(request: schemas.ResetPasswordRequest, session: AsyncSe
     if not user:
         raise HTTPException(status_code=404, detail="Usuário não encontrado")
     # Update password
-    user.password_hash = security.get_password_hash(request.new_password)
+    user.password_hash = await security.get_password_hash_async(request.new_password)
     # Delete token
     await session.delete(token_row)
     await session.commit()
+    await invalidate_user(user.id)
     return {"detail": "Senha redefinida com sucesso"}
 
 
@@ -5,7 +5,10 @@ This router exposes an endpoint to create a Stripe Checkout session for
 a given order.  The price can be supplied either via a predefined
 Stripe price ID or dynamically using the order's price.  The session
 metadata stores the order ID so that the webhook can correlate the
-payment with the search order.
+payment with the search order; batches of orders imported through
+``POST /orders/bulk`` are paid with a single session carrying the batch
+ID instead, never order by order.  Calls to Stripe go through the async
+``payments.PaymentGateway`` and are idempotent per order.
 """
 import logging
 import stripe
@@ -13,9 +16,12 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from pydantic import BaseModel
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from ..config import get_settings
+from .. import order_state
 from ..database import get_session
-from ..models import SearchOrder
+from ..dependencies import get_current_user
+from ..models import BatchStatus, OrderBatch, OrderStatus, SearchOrder
+from ..payments import PaymentGateway, PaymentGatewayNotConfigured, get_payment_gateway
+from ..utils.user_cache import UserSnapshot
 
 # Configura o logger para este módulo
 logger = logging.getLogger(__name__)
@@ -25,32 +31,51 @@ class CheckoutSessionCreateRequest(BaseModel):
     order_id: int
 
 
+class BatchCheckoutSessionCreateRequest(BaseModel):
+    batch_id: int
+
+
 router = APIRouter(prefix="/checkout", tags=["checkout"])
 
 
+def _gateway() -> PaymentGateway:
+    try:
+        return get_payment_gateway()
+    except PaymentGatewayNotConfigured:
+        logger.error("A chave da API do Stripe (STRIPE_API_KEY) não está configurada ou é inválida.")
+        raise HTTPException(
+            status_code=500, detail="A integração com o sistema de pagamento não está configurada."
+        )
+
+
 @router.post("/create-session")
 async def create_checkout_session(
     body: CheckoutSessionCreateRequest,
     session: AsyncSession = Depends(get_session),
 ) -> dict:
-    """Create a Stripe Checkout session for the specified order."""
-    settings = get_settings()
-    stripe.api_key = settings.stripe_api_key
+    """Create a Stripe Checkout session for the specified order.
 
-    if not settings.stripe_api_key or not settings.stripe_api_key.startswith("sk_"):
-        logger.error("A chave da API do Stripe (STRIPE_API_KEY) não está configurada ou é inválida.")
-        raise HTTPException(
-            status_code=500, detail="A integração com o sistema de pagamento não está configurada."
-        )
+    Repeated calls for the same unpaid order return the session that is
+    still open instead of creating a new one.
+    """
+    gateway = _gateway()
 
     logger.info(f"Iniciando a criação de sessão de checkout para o pedido ID: {body.order_id}")
     order = await session.get(SearchOrder, body.order_id)
     if not order:
         logger.warning(f"Falha no checkout: Pedido com ID {body.order_id} não encontrado.")
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    # No authenticated user here: let ``get_session`` record the write
+    # against the owner so their next reads see the stored session ID.
+    session.info["user_id"] = order.user_id
 
-    from ..models import OrderStatus  # imported here to avoid circular import
-    if order.status != OrderStatus.PENDING_PAYMENT:
+    if order.batch_id is not None:
+        logger.warning(f"Falha no checkout: O pedido {order.id} pertence ao lote {order.batch_id}.")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Order belongs to a batch; pay the batch instead"
+        )
+
+    if not order_state.can_transition(order.status, OrderStatus.PROCESSING):
         logger.warning(
             f"Falha no checkout: O pedido {order.id} não está aguardando pagamento (status: {order.status})."
         )
@@ -58,40 +83,9 @@ async def create_checkout_session(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Order is not awaiting payment"
         )
 
-    line_item: dict[str, any]
-    # CORREÇÃO: Verificamos se o stripe_price_id existe E se ele parece um ID válido.
-    # Se não, usamos a criação de preço dinâmica. Isso evita que comentários
-    # ou valores inválidos no .env quebrem a aplicação.
-    if settings.stripe_price_id and settings.stripe_price_id.startswith("price_"):
-        line_item = {"price": settings.stripe_price_id, "quantity": 1}
-        logger.info(f"Usando Price ID fixo do .env: {settings.stripe_price_id}")
-    else:
-        line_item = {
-            "price_data": {
-                "currency": "brl",
-                "product_data": {"name": f"Busca de Certidão ({order.target_name})"},
-                "unit_amount": int(order.order_price * 100),
-            },
-            "quantity": 1,
-        }
-        logger.info("Usando 'price_data' para criar preço dinamicamente.")
-
     try:
-        logger.info(f"Criando sessão no Stripe para o pedido {order.id} com o item: {line_item}")
-        
-        success_url = f"{settings.frontend_base_url}/app/dashboard?payment=success&order_id={order.id}"
-        cancel_url = f"{settings.frontend_base_url}/checkout/{order.id}?payment=cancelled"
-
-        checkout_session = stripe.checkout.Session.create(
-            payment_method_types=["card"],
-            line_items=[line_item],
-            mode="payment",
-            success_url=success_url,
-            cancel_url=cancel_url,
-            metadata={"order_id": str(order.id)},
-        )
-        logger.info(f"Sessão do Stripe {checkout_session.id} criada com sucesso para o pedido {order.id}")
-
+        checkout_session = await gateway.create_checkout_session(order)
+        logger.info(f"Sessão do Stripe {checkout_session.id} pronta para o pedido {order.id}")
     except stripe.error.StripeError as e:
         logger.error(f"Erro da API Stripe para o pedido {order.id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
@@ -99,6 +93,52 @@ async def create_checkout_session(
         logger.error(f"Erro inesperado ao criar sessão Stripe para o pedido {order.id}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Ocorreu um erro ao iniciar o pagamento.")
 
-    order.stripe_session_id = checkout_session.id
-    await session.commit()
-    return {"id": checkout_session.id, "url": checkout_session.url}
\ No newline at end of file
+    if order.stripe_session_id != checkout_session.id:
+        # Only record the session while the order is still unpaid: a
+        # payment completed in the meantime must not be offered again.
+        stored = await order_state.update_in_state(
+            session, order.id, OrderStatus.PENDING_PAYMENT, {"stripe_session_id": checkout_session.id}
+        )
+        await session.commit()
+        if not stored:
+            logger.warning(f"Falha no checkout: O pedido {order.id} deixou de aguardar pagamento durante o checkout.")
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="Order is not awaiting payment"
+            )
+    return {"id": checkout_session.id, "url": checkout_session.url}
+
+
+@router.post("/create-batch-session")
+async def create_batch_checkout_session(
+    body: BatchCheckoutSessionCreateRequest,
+    current_user: UserSnapshot = Depends(get_current_user),
+    session: AsyncSession = Depends(get_session),
+) -> dict:
+    """Create one Stripe Checkout session paying every order of a batch."""
+    gateway = _gateway()
+
+    batch = await session.get(OrderBatch, body.batch_id)
+    if not batch or batch.user_id != current_user.id:
+        logger.warning(f"Falha no checkout: Lote com ID {body.batch_id} não encontrado.")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found")
+
+    if batch.status != BatchStatus.PENDING_PAYMENT:
+        logger.warning(f"Falha no checkout: O lote {batch.id} não está aguardando pagamento (status: {batch.status}).")
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Batch is not awaiting payment"
+        )
+
+    try:
+        checkout_session = await gateway.create_batch_checkout_session(batch)
+        logger.info(f"Sessão do Stripe {checkout_session.id} pronta para o lote {batch.id}")
+    except stripe.error.StripeError as e:
+        logger.error(f"Erro da API Stripe para o lote {batch.id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+    except Exception as e:
+        logger.error(f"Erro inesperado ao criar sessão Stripe para o lote {batch.id}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Ocorreu um erro ao iniciar o pagamento.")
+
+    if batch.stripe_session_id != checkout_session.id:
+        batch.stripe_session_id = checkout_session.id
+        await session.commit()
+    return {"id": checkout_session.id, "url": checkout_session.url}
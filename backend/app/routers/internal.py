@@ -5,16 +5,25 @@ These endpoints are intended for use by the automation robot to submit
 its search results.  Access is controlled via a static API key to
 ensure that only trusted processes can call these endpoints.
 """
-from fastapi import APIRouter, Depends, Header, HTTPException, status
+import asyncio
+import time
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models, schemas
 from ..config import get_settings
 from ..database import get_session
+from ..source_stats import load_stats, record_results
+from ..utils.order_cache import bump_orders_version
+from ..utils.profiler import SamplingProfiler
 
 
 router = APIRouter(prefix="/internal", tags=["internal"])
 
+_profile_lock = asyncio.Lock()
+
 
 @router.post("/search_results", status_code=201)
 async def submit_search_result(
@@ -41,7 +50,67 @@ async def submit_search_result(
         status=models.ResultStatus(result_in.status),
         found_data_json=result_in.found_data_json,
         screenshot_path=result_in.screenshot_path,
+        duration_ms=result_in.duration_ms,
     )
     session.add(result)
+    await record_results(session, order, [result])
+    await bump_orders_version(session, order.user_id)
     await session.commit()
     return {"detail": "Result saved"}
+
+
+@router.get("/admission")
+async def admission_status(request: Request, api_key: str = Header(None, alias="X-Api-Key")) -> dict:
+    """Report active requests and queue depth per admission route class."""
+    if api_key != get_settings().internal_api_key:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
+    controller = request.app.state.admission
+    return controller.snapshot() if controller else {}
+
+
+@router.get("/stats")
+async def source_stats(
+    days: int = Query(30, ge=1, le=366),
+    source_name: Optional[str] = None,
+    target_state: Optional[str] = None,
+    api_key: str = Header(None, alias="X-Api-Key"),
+    session: AsyncSession = Depends(get_session),
+) -> dict:
+    """Report hit, unavailability and error rates and mean latency per source.
+
+    Served from the ``source_stats_daily`` rollup, so the cost depends on
+    the number of sources, states and days rather than on the number of
+    results stored.
+    """
+    if api_key != get_settings().internal_api_key:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
+    stats = await load_stats(session, days=days, source_name=source_name, target_state=target_state)
+    return {"days": days, "sources": stats}
+
+
+@router.post("/profile")
+async def profile_process(
+    seconds: float = Query(10.0, gt=0),
+    interval_ms: float = Query(5.0, ge=1),
+    download: bool = False,
+    api_key: str = Header(None, alias="X-Api-Key"),
+) -> Response:
+    """Sample this API process for ``seconds`` and return collapsed stacks.
+
+    The output can be fed to flamegraph.pl or speedscope; with
+    ``download=true`` it is sent as a file attachment.  Only one profile
+    runs at a time per process.
+    """
+    settings = get_settings()
+    if api_key != settings.internal_api_key:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
+    if _profile_lock.locked():
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A profile is already running")
+    async with _profile_lock:
+        profiler = SamplingProfiler(interval=interval_ms / 1000)
+        # Sample from a worker thread so the event loop keeps serving requests
+        await asyncio.to_thread(profiler.run_for, min(seconds, settings.profile_max_seconds))
+    headers = {"X-Profile-Samples": str(profiler.samples)}
+    if download:
+        headers["Content-Disposition"] = f'attachment; filename="api-{int(time.time())}.collapsed"'
+    return Response(content=profiler.collapsed(), media_type="text/plain", headers=headers)
@@ -0,0 +1,22 @@
+"""
+Prometheus exposition endpoint.
+
+``GET /metrics`` returns every metric defined in ``app.metrics`` in the
+Prometheus text format, aggregated across processes when multiprocess
+mode is enabled.  The Celery queue depth is refreshed from the broker
+on each scrape.
+"""
+from fastapi import APIRouter, Response
+
+from .. import metrics
+
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint() -> Response:
+    """Expose metrics for Prometheus to scrape."""
+    await metrics.update_queue_lengths()
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
@@ -5,26 +5,51 @@ Users can create orders, view their existing orders, and retrieve
 details of a specific order including its search results.  The actual
 processing of orders is handled asynchronously after payment via
 Stripe and Celery; this router only manages the state stored in the
-database.
+database.  Read endpoints support conditional requests: a cheap
+validator query answers ``If-None-Match`` with 304 without loading
+orders or results (see ``utils.order_cache``).  ``POST /orders/bulk``
+imports many orders from a streamed CSV or NDJSON upload as one batch
+(see ``bulk_orders``) and ``GET /orders/export`` streams the whole
+history (see ``order_export``).  ``GET /orders/search`` finds orders by
+target name, city or parents' names (see ``order_search``).  The
+read-only endpoints use a read replica when one is configured (see
+``replicas``).
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import select
+from datetime import date
+from typing import List, Literal, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 # Importa selectinload para carregamento eager de relacionamentos
 from sqlalchemy.orm import selectinload
 
-from .. import models, schemas
+from .. import bulk_orders, models, order_export, order_search, schemas
 from ..database import get_session
-from ..dependencies import get_current_user
+from ..dependencies import get_current_user, get_current_user_for_read, get_read_session
+from ..utils.order_cache import (
+    CACHE_CONTROL_REVALIDATE,
+    bump_orders_version,
+    etag_matches,
+    get_cached_orders,
+    get_orders_version,
+    make_etag,
+    store_orders,
+)
+from ..utils.user_cache import UserSnapshot
 
 
 router = APIRouter(prefix="/orders", tags=["orders"])
 
+_order_list_adapter = TypeAdapter(List[schemas.SearchOrderOut])
+
 
 @router.post("/", response_model=schemas.SearchOrderOut, status_code=201)
 async def create_order(
     order_in: schemas.SearchOrderCreate,
-    current_user: models.User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
     """Create a new search order with status ``PENDING_PAYMENT``."""
@@ -40,6 +65,7 @@ async def create_order(
         additional_info=order_in.additional_info,
     )
     session.add(order)
+    await bump_orders_version(session, current_user.id)
     await session.commit()
     # CORREÇÃO: Após criar o pedido, fazemos o refresh da instância
     # carregando explicitamente o relacionamento 'results' (que estará vazio).
@@ -48,32 +74,178 @@ async def create_order(
     return order
 
 
-@router.get("/", response_model=list[schemas.SearchOrderOut])
-async def list_orders(
-    current_user: models.User = Depends(get_current_user),
+@router.post("/bulk", response_model=schemas.BulkOrderImportOut, status_code=201)
+async def create_orders_bulk(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = Query(None),
+    current_user: UserSnapshot = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ):
-    """List all search orders belonging to the authenticated user."""
-    # CORREÇÃO: Adicionado .options(selectinload(models.SearchOrder.results))
-    # para carregar os resultados de cada pedido de forma "eager",
-    # prevenindo o erro de lazy-loading.
-    result = await session.execute(
-        select(models.SearchOrder)
-        .options(selectinload(models.SearchOrder.results))
-        .where(models.SearchOrder.user_id == current_user.id)
-        .order_by(models.SearchOrder.created_at.desc())
+    """Create a batch of orders from a CSV or NDJSON request body.
+
+    The format comes from ``format`` or the ``Content-Type`` header.
+    Invalid lines are skipped and reported; the batch is paid with one
+    checkout (``POST /checkout/create-batch-session``).
+    """
+    fmt = format or bulk_orders.format_for(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Envie um arquivo CSV (text/csv) ou NDJSON (application/x-ndjson).",
+        )
+    try:
+        imported = await bulk_orders.import_orders(session, current_user.id, request.stream(), fmt)
+    except bulk_orders.BulkImportError as exc:
+        raise HTTPException(status_code=exc.status_code, detail=exc.detail)
+    if imported.batch is None:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail={"message": "Nenhum pedido válido no arquivo.", "errors": imported.errors},
+        )
+    await bump_orders_version(session, current_user.id)
+    await session.commit()
+    return schemas.BulkOrderImportOut(
+        batch_id=imported.batch.id,
+        accepted=imported.accepted,
+        rejected=imported.rejected,
+        total_price=imported.batch.total_price,
+        errors=imported.errors,
+    )
+
+
+@router.get("/export")
+async def export_orders(
+    format: Literal["csv", "ndjson"] = Query("csv"),
+    created_from: Optional[date] = Query(None),
+    created_to: Optional[date] = Query(None),
+    accept_encoding: Optional[str] = Header(None),
+    current_user: UserSnapshot = Depends(get_current_user),
+):
+    """Stream all of the user's orders and results as CSV or NDJSON.
+
+    ``created_from``/``created_to`` (inclusive) filter on the order's
+    creation date.  The body is gzip-compressed if the client accepts it.
+    """
+    if created_from and created_to and created_from > created_to:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="created_from is after created_to")
+    gzip = order_export.accepts_gzip(accept_encoding)
+    headers = {
+        "Content-Disposition": f'attachment; filename="pedidos-{date.today():%Y%m%d}.{format}"',
+        "Cache-Control": "no-store",
+        "Vary": "Accept-Encoding",
+    }
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        order_export.stream_export(current_user.id, format, gzip, created_from, created_to),
+        media_type=order_export.MEDIA_TYPES[format],
+        headers=headers,
     )
-    orders = result.scalars().all()
-    return orders
+
+
+@router.get("/search", response_model=schemas.OrderSearchPage)
+async def search_orders(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None),
+    current_user: UserSnapshot = Depends(get_current_user_for_read),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Search the user's orders, ranked by relevance and keyset-paginated.
+
+    Pass the returned ``next_cursor`` back as ``cursor`` for the next page.
+    """
+    try:
+        items, next_cursor = await order_search.search_orders(session, current_user.id, q, limit, cursor)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router.get("/batches/{batch_id}", response_model=schemas.OrderBatchOut)
+async def get_batch(
+    batch_id: int,
+    current_user: UserSnapshot = Depends(get_current_user_for_read),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Return a batch and how many of its orders are in each status."""
+    batch = await session.get(models.OrderBatch, batch_id)
+    if batch is None or batch.user_id != current_user.id:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Batch not found")
+    counts = await session.execute(
+        select(models.SearchOrder.status, func.count())
+        .where(models.SearchOrder.batch_id == batch_id)
+        .group_by(models.SearchOrder.status)
+    )
+    out = schemas.OrderBatchOut.model_validate(batch, from_attributes=True)
+    out.orders_by_status = {order_status.value: count for order_status, count in counts}
+    return out
+
+
+@router.get("/", response_model=list[schemas.SearchOrderOut])
+async def list_orders(
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserSnapshot = Depends(get_current_user_for_read),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """List all search orders belonging to the authenticated user.
+
+    The serialised list is cached per ``orders_version`` (see
+    ``utils.order_cache``), so repeated loads skip the order queries.
+    """
+    version = await get_orders_version(session, current_user.id)
+    etag = make_etag("orders", current_user.id, version)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL_REVALIDATE}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    body = await get_cached_orders(current_user.id, version)
+    if body is None:
+        # CORREÇÃO: Adicionado .options(selectinload(models.SearchOrder.results))
+        # para carregar os resultados de cada pedido de forma "eager",
+        # prevenindo o erro de lazy-loading.
+        result = await session.execute(
+            select(models.SearchOrder)
+            .options(selectinload(models.SearchOrder.results))
+            .where(models.SearchOrder.user_id == current_user.id)
+            .order_by(models.SearchOrder.created_at.desc())
+        )
+        orders = result.scalars().all()
+        body = _order_list_adapter.dump_json(_order_list_adapter.validate_python(orders, from_attributes=True))
+        await store_orders(current_user.id, version, body)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 
 @router.get("/{order_id}", response_model=schemas.SearchOrderOut)
 async def get_order_detail(
     order_id: int,
-    current_user: models.User = Depends(get_current_user),
-    session: AsyncSession = Depends(get_session),
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: UserSnapshot = Depends(get_current_user_for_read),
+    session: AsyncSession = Depends(get_read_session),
 ):
     """Retrieve detailed information about a specific order and its results."""
+    # Validator query: order state plus an aggregate over its results,
+    # without loading any result rows.
+    validator = await session.execute(
+        select(
+            models.SearchOrder.status,
+            models.SearchOrder.completed_at,
+            func.max(models.SearchResult.timestamp),
+            func.count(models.SearchResult.id),
+        )
+        .outerjoin(models.SearchResult, models.SearchResult.order_id == models.SearchOrder.id)
+        .where(models.SearchOrder.id == order_id, models.SearchOrder.user_id == current_user.id)
+        .group_by(models.SearchOrder.id, models.SearchOrder.status, models.SearchOrder.completed_at)
+    )
+    row = validator.one_or_none()
+    if row is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Order not found")
+    order_status, completed_at, latest_result, result_count = row
+    etag = make_etag("order", order_id, order_status.value, completed_at, latest_result, result_count)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL_REVALIDATE}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
     # CORREÇÃO: Substituído session.get() por uma query com selectinload
     # para carregar o pedido e seus resultados de uma só vez,
     # evitando o erro de lazy-loading.
@@ -11,15 +11,16 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models, schemas
 from ..database import get_session
-from ..dependencies import get_current_user
+from ..dependencies import get_current_user, get_current_user_for_read
 from ..utils import security
+from ..utils.user_cache import UserSnapshot, invalidate_user
 
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/me", response_model=schemas.UserOut)
-async def get_profile(current_user: models.User = Depends(get_current_user)) -> models.User:
+async def get_profile(current_user: UserSnapshot = Depends(get_current_user_for_read)) -> UserSnapshot:
     """Return the current authenticated user's profile."""
     return current_user
 
@@ -27,26 +28,32 @@ async def get_profile(current_user: models.User = Depends(get_current_user)) ->
 @router.put("/me", response_model=schemas.UserOut)
 async def update_profile(
     update: schemas.UserUpdate,
-    current_user: models.User = Depends(get_current_user),
+    current_user: UserSnapshot = Depends(get_current_user),
     session: AsyncSession = Depends(get_session),
 ) -> models.User:
     """Update the authenticated user's profile."""
+    # The cached snapshot is read-only; load the row we are going to change
+    user = await session.get(models.User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Usuário não encontrado")
     # Update name and email if provided
-    if update.email and update.email != current_user.email:
+    if update.email and update.email != user.email:
         # Check if new email already exists
         result = await session.execute(select(models.User).where(models.User.email == update.email))
         existing = result.scalar_one_or_none()
         if existing:
             raise HTTPException(status_code=400, detail="E-mail já está em uso")
-        current_user.email = update.email
+        user.email = update.email
     if update.full_name is not None:
-        current_user.full_name = update.full_name
+        user.full_name = update.full_name
     # Handle password change
     if update.new_password:
-        if not update.current_password or not security.verify_password(update.current_password, current_user.password_hash):
+        if not update.current_password or not await security.verify_password_async(
+            update.current_password, user.password_hash
+        ):
             raise HTTPException(status_code=400, detail="Senha atual incorreta")
-        current_user.password_hash = security.get_password_hash(update.new_password)
-    session.add(current_user)
+        user.password_hash = await security.get_password_hash_async(update.new_password)
     await session.commit()
-    await session.refresh(current_user)
-    return current_user
\ No newline at end of file
+    await invalidate_user(user.id)
+    await session.refresh(user)
+    return user
\ No newline at end of file
@@ -7,7 +7,7 @@ outgoing data is serialised in a predictable manner.
 """
 from datetime import datetime
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 from pydantic import BaseModel, EmailStr, Field
 
@@ -19,11 +19,19 @@ class OrderStatusEnum(str, Enum):
     COMPLETED_FAILURE = "COMPLETED_FAILURE"
 
 
+class BatchStatusEnum(str, Enum):
+    PENDING_PAYMENT = "PENDING_PAYMENT"
+    PROCESSING = "PROCESSING"
+    COMPLETED = "COMPLETED"
+
+
 class ResultStatusEnum(str, Enum):
     FOUND = "FOUND"
     NOT_FOUND = "NOT_FOUND"
     SOURCE_UNAVAILABLE = "SOURCE_UNAVAILABLE"
     ERROR = "ERROR"
+    NOT_APPLICABLE = "NOT_APPLICABLE"
+    SKIPPED = "SKIPPED"
 
 
 class UserCreate(BaseModel):
@@ -91,6 +99,7 @@ class SearchResultCreate(BaseModel):
     details: Optional[str] = None
     found_data_json: Optional[str] = None
     screenshot_path: Optional[str] = None
+    duration_ms: Optional[int] = Field(default=None, ge=0)
 
 
 class SearchResultOut(BaseModel):
@@ -138,3 +147,42 @@ class SearchOrderOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class OrderSearchPage(BaseModel):
+    """One page of ``GET /orders/search`` results, best matches first."""
+
+    items: List[SearchOrderOut]
+    next_cursor: Optional[str] = None
+
+
+class BulkOrderRowError(BaseModel):
+    """Validation errors of one line of a bulk upload."""
+
+    line: int
+    errors: List[str]
+
+
+class BulkOrderImportOut(BaseModel):
+    """Outcome of a bulk order upload."""
+
+    batch_id: Optional[int] = None
+    accepted: int
+    rejected: int
+    total_price: float
+    errors: List[BulkOrderRowError] = []
+
+
+class OrderBatchOut(BaseModel):
+    """Public representation of a batch of orders."""
+
+    id: int
+    status: BatchStatusEnum
+    order_count: int
+    total_price: float
+    created_at: datetime
+    completed_at: Optional[datetime]
+    orders_by_status: Dict[OrderStatusEnum, int] = {}
+
+    class Config:
+        orm_mode = True
@@ -0,0 +1,280 @@
+"""
+Per-source search statistics.
+
+``source_stats_daily`` holds one row per day, source, target state, era
+and result status with the number of results and the sum of their
+durations.  The era is the ``ERA_YEARS``-year period of the order's
+approximate birth year (``era_key``), since registries digitised for one
+period may have nothing for another.  Writers of ``search_results`` call
+``record_results`` in the same transaction as the insert, which adds
+their counts with an ``INSERT ... ON CONFLICT DO UPDATE``; the rollup
+therefore never drifts from the results it summarises and reading it
+costs the same however large ``search_results`` grows.
+
+``load_totals`` feeds the adaptive source scheduler
+(``robots.scheduler``).  ``rebuild`` recomputes the whole rollup from
+``search_results``, for the initial backfill or after manual data
+fixes::
+
+    python -m app.source_stats rebuild
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models
+from .database import async_session_maker, dialect_insert
+from .robots.base import approximate_year
+
+
+ERA_YEARS = 25
+
+
+def _state_key(state: Optional[str]) -> str:
+    return (state or "").strip()[:100]
+
+
+def era_key(dob_approx: Optional[str]) -> str:
+    """Return the first year of the era of ``dob_approx``, or "" if it has no year."""
+    year = approximate_year(dob_approx)
+    return str(year // ERA_YEARS * ERA_YEARS) if year is not None else ""
+
+
+async def record_results(
+    session: AsyncSession, order: models.SearchOrder, results: Iterable[models.SearchResult]
+) -> None:
+    """Add ``results`` of ``order`` to the rollup.  Does not commit.
+
+    Coalesced results are skipped: the lookup they copy is counted once,
+    for the order that made it.
+    """
+    totals: Dict[Tuple[date, str, models.ResultStatus], List[int]] = defaultdict(lambda: [0, 0, 0])
+    for result in results:
+        if result.coalesced:
+            continue
+        day = (result.timestamp or datetime.utcnow()).date()
+        entry = totals[(day, result.source_name, result.status)]
+        entry[0] += 1
+        if result.duration_ms is not None:
+            entry[1] += result.duration_ms
+            entry[2] += 1
+    if not totals:
+        return
+    state = _state_key(order.target_state)
+    era = era_key(order.target_dob_approx)
+    table = models.SourceStatsDaily.__table__
+    stmt = dialect_insert(table).values(
+        [
+            {
+                "day": day,
+                "source_name": source_name,
+                "target_state": state,
+                "era": era,
+                "status": status,
+                "result_count": count,
+                "duration_ms_sum": duration_sum,
+                "duration_count": duration_count,
+            }
+            # A consistent row order keeps concurrent upserts from deadlocking
+            for (day, source_name, status), (count, duration_sum, duration_count) in sorted(
+                totals.items(), key=lambda item: (item[0][0], item[0][1], item[0][2].value)
+            )
+        ]
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.day, table.c.source_name, table.c.target_state, table.c.era, table.c.status],
+        set_={
+            "result_count": table.c.result_count + stmt.excluded.result_count,
+            "duration_ms_sum": table.c.duration_ms_sum + stmt.excluded.duration_ms_sum,
+            "duration_count": table.c.duration_count + stmt.excluded.duration_count,
+        },
+    )
+    await session.execute(stmt)
+
+
+# Results of sources that were not queried
+NOT_SEARCHED = (models.ResultStatus.NOT_APPLICABLE, models.ResultStatus.SKIPPED)
+
+
+@dataclass
+class SourceTotals:
+    """Aggregated rollup counts for one source (and optionally one state and era)."""
+
+    total: int = 0
+    found: int = 0
+    duration_ms_sum: int = 0
+    duration_count: int = 0
+
+    def add(self, status: models.ResultStatus, count: int, duration_sum: int, duration_count: int) -> None:
+        # Sources that were not queried say nothing about hit rate or latency
+        if status in NOT_SEARCHED:
+            return
+        self.total += count
+        if status == models.ResultStatus.FOUND:
+            self.found += count
+        self.duration_ms_sum += duration_sum
+        self.duration_count += duration_count
+
+
+TotalsKey = Tuple[str, Optional[str], Optional[str]]
+
+
+async def load_totals(session: AsyncSession, days: int) -> Dict[TotalsKey, SourceTotals]:
+    """Return rollup totals of the last ``days`` days.
+
+    Keys are ``(source_name, target_state, era)``; ``None`` in place of
+    the state or era holds the totals over all states or eras.
+    """
+    table = models.SourceStatsDaily
+    rows = await session.execute(
+        select(
+            table.source_name,
+            table.target_state,
+            table.era,
+            table.status,
+            func.sum(table.result_count),
+            func.sum(table.duration_ms_sum),
+            func.sum(table.duration_count),
+        )
+        .where(table.day >= datetime.utcnow().date() - timedelta(days=days - 1))
+        .group_by(table.source_name, table.target_state, table.era, table.status)
+    )
+    totals: Dict[TotalsKey, SourceTotals] = defaultdict(SourceTotals)
+    for source, state, era, status, count, duration_sum, duration_count in rows:
+        for key in ((source, state, era), (source, state, None), (source, None, era), (source, None, None)):
+            totals[key].add(status, count, duration_sum or 0, duration_count or 0)
+    return dict(totals)
+
+
+async def load_stats(
+    session: AsyncSession, days: int = 30, source_name: Optional[str] = None, target_state: Optional[str] = None
+) -> List[dict]:
+    """Summarise the last ``days`` days per source and target state."""
+    table = models.SourceStatsDaily
+    query = (
+        select(
+            table.source_name,
+            table.target_state,
+            table.status,
+            func.sum(table.result_count),
+            func.sum(table.duration_ms_sum),
+            func.sum(table.duration_count),
+        )
+        .where(table.day >= datetime.utcnow().date() - timedelta(days=days - 1))
+        .group_by(table.source_name, table.target_state, table.status)
+    )
+    if source_name is not None:
+        query = query.where(table.source_name == source_name)
+    if target_state is not None:
+        query = query.where(table.target_state == _state_key(target_state))
+
+    summaries: Dict[Tuple[str, str], dict] = {}
+    for source, state, status, count, duration_sum, duration_count in await session.execute(query):
+        summary = summaries.setdefault(
+            (source, state),
+            {"source_name": source, "target_state": state or None, "total": 0, "by_status": {},
+             "duration_ms_sum": 0, "duration_count": 0},
+        )
+        summary["total"] += count
+        summary["by_status"][status.value] = count
+        summary["duration_ms_sum"] += duration_sum or 0
+        summary["duration_count"] += duration_count or 0
+
+    stats = []
+    for summary in summaries.values():
+        by_status = summary["by_status"]
+        # Rates are relative to the searches actually performed
+        searched = summary["total"] - sum(by_status.get(skipped.value, 0) for skipped in NOT_SEARCHED)
+        duration_count = summary.pop("duration_count")
+        duration_sum = summary.pop("duration_ms_sum")
+        for key, result_status in (
+            ("hit_rate", models.ResultStatus.FOUND),
+            ("unavailable_rate", models.ResultStatus.SOURCE_UNAVAILABLE),
+            ("error_rate", models.ResultStatus.ERROR),
+        ):
+            summary[key] = by_status.get(result_status.value, 0) / searched if searched else None
+        summary["avg_duration_ms"] = duration_sum / duration_count if duration_count else None
+        stats.append(summary)
+    stats.sort(key=lambda item: (item["source_name"], item["target_state"] or ""))
+    return stats
+
+
+async def rebuild(session: AsyncSession) -> int:
+    """Recompute the rollup from ``search_results``.  Does not commit.
+
+    Returns the number of rollup rows written.
+    """
+    result = models.SearchResult
+    order = models.SearchOrder
+    # ``date()`` rather than a cast: SQLite and PostgreSQL both return the
+    # calendar day, and SQLite stores ``Date`` columns in that format.
+    day = func.date(result.timestamp)
+    state = func.trim(func.coalesce(order.target_state, ""))
+    # Eras are parsed from the free-form birth date in Python, so the
+    # database groups by the raw value and the groups are merged here.
+    rows = await session.execute(
+        select(
+            day,
+            result.source_name,
+            state,
+            order.target_dob_approx,
+            result.status,
+            func.count(),
+            func.coalesce(func.sum(result.duration_ms), 0),
+            func.count(result.duration_ms),
+        )
+        .join(order, order.id == result.order_id)
+        .where(result.coalesced.is_(False))
+        .group_by(day, result.source_name, state, order.target_dob_approx, result.status)
+    )
+    totals: Dict[Tuple[str, str, str, str, models.ResultStatus], List[int]] = defaultdict(lambda: [0, 0, 0])
+    for row_day, source_name, row_state, dob_approx, status, count, duration_sum, duration_count in rows:
+        entry = totals[(str(row_day), source_name, row_state, era_key(dob_approx), status)]
+        entry[0] += count
+        entry[1] += duration_sum
+        entry[2] += duration_count
+    table = models.SourceStatsDaily.__table__
+    await session.execute(delete(table))
+    if totals:
+        await session.execute(
+            insert(table),
+            [
+                {
+                    "day": date.fromisoformat(row_day),
+                    "source_name": source_name,
+                    "target_state": row_state,
+                    "era": era,
+                    "status": status,
+                    "result_count": count,
+                    "duration_ms_sum": duration_sum,
+                    "duration_count": duration_count,
+                }
+                for (row_day, source_name, row_state, era, status), (count, duration_sum, duration_count)
+                in totals.items()
+            ],
+        )
+    return len(totals)
+
+
+async def _rebuild() -> None:
+    async with async_session_maker() as session:
+        rows = await rebuild(session)
+        await session.commit()
+    print(f"source_stats_daily reconstruída: {rows} linhas")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Maintain the per-source statistics rollup.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.parse_args()
+    asyncio.run(_rebuild())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Minimal local stand-in for the parts of the Stripe API used by the app.
+
+Run it with ``uvicorn app.stripe_stub:app --port 12111`` and set
+``STRIPE_API_BASE=http://localhost:12111`` (with any ``sk_test_`` key) to
+create checkout sessions without network access.  Sessions are kept in
+memory; ``Idempotency-Key`` is honoured like Stripe does, returning the
+original response for repeated keys.  ``POST
+/v1/checkout/sessions/{id}/expire`` closes a session so that the
+application's reuse logic can be exercised.
+"""
+import secrets
+import time
+from typing import Any, Dict, Optional
+
+from fastapi import FastAPI, Header, HTTPException, Request
+
+
+app = FastAPI(title="Stripe stub")
+
+_sessions: Dict[str, Dict[str, Any]] = {}
+_idempotent: Dict[str, str] = {}
+
+
+def _metadata(form: Dict[str, str]) -> Dict[str, str]:
+    """Decode Stripe's ``metadata[key]=value`` form encoding."""
+    return {key[len("metadata["):-1]: value for key, value in form.items() if key.startswith("metadata[")}
+
+
+@app.post("/v1/checkout/sessions")
+async def create_session(request: Request, idempotency_key: Optional[str] = Header(None)) -> Dict[str, Any]:
+    if idempotency_key and idempotency_key in _idempotent:
+        return _sessions[_idempotent[idempotency_key]]
+    form = dict(await request.form())
+    session_id = f"cs_test_{secrets.token_hex(12)}"
+    session = {
+        "id": session_id,
+        "object": "checkout.session",
+        "status": "open",
+        "mode": form.get("mode"),
+        "created": int(time.time()),
+        "url": f"{request.base_url}pay/{session_id}",
+        "success_url": form.get("success_url"),
+        "cancel_url": form.get("cancel_url"),
+        "metadata": _metadata(form),
+    }
+    _sessions[session_id] = session
+    if idempotency_key:
+        _idempotent[idempotency_key] = session_id
+    return session
+
+
+@app.get("/v1/checkout/sessions/{session_id}")
+async def retrieve_session(session_id: str) -> Dict[str, Any]:
+    if session_id not in _sessions:
+        raise HTTPException(
+            status_code=404,
+            detail={"error": {"type": "invalid_request_error", "message": f"No such checkout.session: '{session_id}'"}},
+        )
+    return _sessions[session_id]
+
+
+@app.post("/v1/checkout/sessions/{session_id}/expire")
+async def expire_session(session_id: str) -> Dict[str, Any]:
+    session = await retrieve_session(session_id)
+    session["status"] = "expired"
+    return session
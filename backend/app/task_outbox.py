@@ -0,0 +1,131 @@
+"""
+Transactional outbox for task messages.
+
+A change that must start tasks, such as a paid order that needs its
+search, cannot hand them to the in-memory task publisher once it has
+committed: a crash, a redeploy or a broker outage before the messages
+reach the broker would lose them while the change stays.  ``add``
+instead stores the calls as ``task_outbox`` rows in the caller's
+transaction, so they are committed exactly when the change is.
+
+``relay`` publishes committed rows and deletes them once the broker (or
+the ``jobs`` table) has accepted them.  It leases a batch with
+``FOR UPDATE SKIP LOCKED`` by moving ``available_at`` forward
+``task_outbox_lease_seconds`` and publishes outside the transaction, so
+concurrent relays never take the same rows and a relay that dies is
+replaced once the lease runs out.  Rows whose publish fails are retried
+after the task publisher's backoff.  The webhook consumer relays after
+every batch and on every poll (see ``webhook_inbox.run_consumer``).
+
+With ``task_backend = "jobqueue"`` there is no broker to reach: ``add``
+inserts the calls as ``jobs`` rows in the caller's transaction (see
+``jobqueue.add``), which are just as durable, and nothing is left for
+``relay``.
+
+Delivery is at least once: a crash between the publish and the delete
+publishes the row again, which the tasks tolerate (order claims are
+versioned).
+"""
+import contextvars
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import jobqueue, task_publisher, tracing
+from .config import get_settings
+from .database import async_session_maker
+from .models import TaskOutbox
+from .tasks import celery_app
+
+
+logger = logging.getLogger(__name__)
+
+
+async def add(session: AsyncSession, messages: Iterable[task_publisher.TaskMessage]) -> None:
+    """Store ``messages`` in ``session``'s transaction.  Does not commit."""
+    if get_settings().task_backend == "jobqueue":
+        rows = [
+            jobqueue.job_row(
+                task_message.task.name,
+                task_message.args,
+                task_message.kwargs,
+                task_message.context.run(tracing.current_traceparent),
+            )
+            for task_message in messages
+        ]
+        await jobqueue.add(session, rows)
+        return
+    session.add_all(
+        [
+            TaskOutbox(
+                task=task_message.task.name,
+                payload=json.dumps({"args": list(task_message.args), "kwargs": task_message.kwargs}),
+                traceparent=task_message.context.run(tracing.current_traceparent),
+            )
+            for task_message in messages
+        ]
+    )
+
+
+def _message(row: TaskOutbox, span: Optional[tracing.Span]) -> task_publisher.TaskMessage:
+    payload = json.loads(row.payload)
+    # Publish inside ``span``, which continues the trace that stored the call
+    context = contextvars.copy_context()
+    context.run(tracing.activate, span)
+    return task_publisher.TaskMessage(celery_app.tasks[row.task], tuple(payload["args"]), payload["kwargs"], context)
+
+
+async def relay(batch_size: int) -> int:
+    """Publish one batch of due rows and return how many were published."""
+    settings = get_settings()
+    now = datetime.utcnow()
+    async with async_session_maker() as session:
+        rows = (
+            await session.execute(
+                select(TaskOutbox)
+                .where(TaskOutbox.available_at <= now)
+                .order_by(TaskOutbox.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+        ).scalars().all()
+        if not rows:
+            return 0
+        for row in rows:
+            row.available_at = now + timedelta(seconds=settings.task_outbox_lease_seconds)
+        await session.commit()
+
+    spans = [tracing.start_span("task_outbox.relay", row.traceparent, task=row.task) for row in rows]
+    messages = [_message(row, span) for row, span in zip(rows, spans)]
+    failed = await task_publisher.get_task_publisher().publish_now(messages)
+    failed_ids = {id(task_message) for task_message in failed}
+    for span, task_message in zip(spans, messages):
+        if span is not None:
+            span.set("task_outbox.published", id(task_message) not in failed_ids)
+        tracing.finish(span)
+
+    published: List[int] = []
+    async with async_session_maker() as session:
+        for row, task_message in zip(rows, messages):
+            if id(task_message) not in failed_ids:
+                published.append(row.id)
+                continue
+            delay = min(
+                settings.task_publisher_retry_backoff_seconds * 2 ** row.attempts,
+                settings.task_publisher_retry_backoff_max_seconds,
+            )
+            await session.execute(
+                update(TaskOutbox)
+                .where(TaskOutbox.id == row.id)
+                .values(attempts=TaskOutbox.attempts + 1, available_at=datetime.utcnow() + timedelta(seconds=delay))
+            )
+        if published:
+            await session.execute(delete(TaskOutbox).where(TaskOutbox.id.in_(published)))
+        await session.commit()
+    if failed:
+        logger.warning("%d task outbox rows not published; retrying later", len(failed))
+    return len(published)
@@ -0,0 +1,214 @@
+"""
+Asynchronous, batched publishing of Celery tasks from the API.
+
+``Task.delay`` publishes synchronously: on the event loop it blocks
+every request while Redis answers, and under load each call may open a
+new producer connection.  Request handlers instead ``await
+publish(task, *args)``, which only puts the message on a bounded
+in-process queue.  A background task drains the queue, takes up to
+``task_publisher_batch_size`` messages at a time and publishes them in a
+worker thread through one producer from the Celery app's pool, so a
+burst of requests costs one connection checkout per batch.
+
+The queue is bounded by ``task_publisher_max_pending``: when the broker
+falls behind, ``publish`` waits for room instead of growing memory,
+which slows the affected requests (and lets admission control shed them)
+rather than losing messages.  Messages the broker (or the database)
+fails to take are published again after a backoff starting at
+``task_publisher_retry_backoff_seconds``, holding up the queue behind
+them, until they succeed or ``close`` gives up on them.  ``close``
+flushes what is queued on shutdown.  Each message carries the
+``contextvars`` context it was created in, so trace context still
+reaches the message headers.
+
+With ``task_backend = "jobqueue"`` a batch is inserted into the
+``jobs`` table instead (see ``jobqueue``), in one transaction.  Tasks
+that must start together with a database change do not go through the
+publisher at all but through ``task_outbox.add``.
+"""
+import asyncio
+import contextvars
+import logging
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from celery import Celery, Task
+
+from . import jobqueue, tracing
+from .config import Settings, get_settings
+from .metrics import TASK_PUBLISH_BATCH_SIZE, TASK_PUBLISH_QUEUE_FULL, TASKS_PUBLISHED
+from .tasks import celery_app
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TaskMessage:
+    """A task call to publish, bound to the context it was created in."""
+
+    task: Task
+    args: Tuple[Any, ...] = ()
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+    context: contextvars.Context = field(default_factory=contextvars.copy_context)
+
+
+def message(task: Task, *args: Any, **kwargs: Any) -> TaskMessage:
+    """Return a ``TaskMessage`` for ``task(*args, **kwargs)`` in the current context."""
+    return TaskMessage(task, args, kwargs)
+
+
+class TaskPublisher:
+    """Publishes task messages in batches from a background task."""
+
+    def __init__(self, app: Celery, settings: Settings) -> None:
+        self._app = app
+        self._max_pending = settings.task_publisher_max_pending
+        self._batch_size = settings.task_publisher_batch_size
+        self._backend = settings.task_backend
+        self._retry_backoff = settings.task_publisher_retry_backoff_seconds
+        self._retry_backoff_max = settings.task_publisher_retry_backoff_max_seconds
+        self._queue: Optional["asyncio.Queue[TaskMessage]"] = None
+        # Messages taken from the queue whose publishing failed
+        self._retry: List[TaskMessage] = []
+        self._runner: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def _ensure_running(self) -> "asyncio.Queue[TaskMessage]":
+        if self._queue is None:
+            self._queue = asyncio.Queue(self._max_pending)
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+        return self._queue
+
+    async def put(self, task_message: TaskMessage) -> None:
+        """Queue ``task_message``, waiting while the queue is full."""
+        if self._closing:
+            # Shutting down: nothing will drain the queue any more
+            if await self._publish([task_message]):
+                logger.error("Task %s could not be published during shutdown", task_message.task.name)
+            return
+        queue = self._ensure_running()
+        if queue.full():
+            TASK_PUBLISH_QUEUE_FULL.inc()
+        await queue.put(task_message)
+
+    async def publish(self, task: Task, *args: Any, **kwargs: Any) -> None:
+        """Queue ``task(*args, **kwargs)`` for publishing."""
+        await self.put(message(task, *args, **kwargs))
+
+    async def publish_now(self, batch: List[TaskMessage]) -> List[TaskMessage]:
+        """Publish ``batch`` right away, bypassing the queue, and return the messages that failed."""
+        return await self._publish(batch)
+
+    async def _run(self) -> None:
+        queue = self._queue
+        failures = 0
+        while True:
+            if self._retry:
+                delay = min(self._retry_backoff * 2 ** (failures - 1), self._retry_backoff_max)
+                await asyncio.sleep(delay)
+                batch, self._retry = self._retry, []
+            else:
+                batch = [await queue.get()]
+            while len(batch) < self._batch_size and not queue.empty():
+                batch.append(queue.get_nowait())
+            failed = await self._publish(batch)
+            if failed:
+                failures += 1
+                logger.warning("%d task messages not published; retrying (attempt %d)", len(failed), failures + 1)
+                self._retry = failed
+            else:
+                failures = 0
+            # Retried messages stay unfinished so that ``close`` waits for them
+            for _ in range(len(batch) - len(failed)):
+                queue.task_done()
+
+    async def _publish(self, batch: List[TaskMessage]) -> List[TaskMessage]:
+        """Publish ``batch`` and return the messages that failed."""
+        try:
+            if self._backend == "jobqueue":
+                await self._enqueue_batch(batch)
+                return []
+            # Broker publishes are blocking I/O; keep them off the event loop
+            return await asyncio.to_thread(self._publish_batch, batch)
+        except Exception:
+            logger.exception("Failed to publish a batch of %d task messages", len(batch))
+            return batch
+
+    async def _enqueue_batch(self, batch: List[TaskMessage]) -> None:
+        TASK_PUBLISH_BATCH_SIZE.observe(len(batch))
+        rows = [
+            jobqueue.job_row(
+                task_message.task.name,
+                task_message.args,
+                task_message.kwargs,
+                task_message.context.run(tracing.current_traceparent),
+            )
+            for task_message in batch
+        ]
+        try:
+            await jobqueue.enqueue_many(rows)
+        except Exception:
+            for task_message in batch:
+                TASKS_PUBLISHED.labels(task_message.task.name, "error").inc()
+            raise
+        for task_message in batch:
+            TASKS_PUBLISHED.labels(task_message.task.name, "published").inc()
+
+    def _publish_batch(self, batch: List[TaskMessage]) -> List[TaskMessage]:
+        TASK_PUBLISH_BATCH_SIZE.observe(len(batch))
+        failed: List[TaskMessage] = []
+        with self._app.producer_or_acquire() as producer:
+            for task_message in batch:
+                try:
+                    task_message.context.run(
+                        task_message.task.apply_async, task_message.args, task_message.kwargs, producer=producer
+                    )
+                except Exception:
+                    logger.exception("Failed to publish task %s", task_message.task.name)
+                    TASKS_PUBLISHED.labels(task_message.task.name, "error").inc()
+                    failed.append(task_message)
+                else:
+                    TASKS_PUBLISHED.labels(task_message.task.name, "published").inc()
+        return failed
+
+    async def close(self, timeout: float) -> None:
+        """Publish the queued messages (for up to ``timeout`` seconds) and stop."""
+        self._closing = True
+        try:
+            if self._queue is not None and self._runner is not None and not self._runner.done():
+                try:
+                    await asyncio.wait_for(self._queue.join(), timeout)
+                except asyncio.TimeoutError:
+                    logger.error(
+                        "Task publisher closed with %d messages unpublished",
+                        self._queue.qsize() + len(self._retry),
+                    )
+            if self._runner is not None:
+                self._runner.cancel()
+                await asyncio.gather(self._runner, return_exceptions=True)
+        finally:
+            # The queue belongs to this event loop; a later loop starts afresh
+            self._queue = None
+            self._runner = None
+            self._retry = []
+            self._closing = False
+
+
+@lru_cache()
+def get_task_publisher() -> TaskPublisher:
+    """Return the process-wide ``TaskPublisher``."""
+    return TaskPublisher(celery_app, get_settings())
+
+
+async def publish(task: Task, *args: Any, **kwargs: Any) -> None:
+    """Queue ``task(*args, **kwargs)`` on the process-wide publisher."""
+    await get_task_publisher().publish(task, *args, **kwargs)
+
+
+async def close_task_publisher() -> None:
+    """Flush and stop the process-wide publisher, if it was used."""
+    if get_task_publisher.cache_info().currsize:
+        await get_task_publisher().close(get_settings().task_publisher_shutdown_timeout_seconds)
@@ -6,19 +6,40 @@ search robots for a given order.  After the searches are completed it
 updates the order status accordingly.  The task is defined as a
 regular synchronous function but uses ``asyncio`` internally to call
 asynchronous database operations and robot routines.
+
+Orders imported together (``models.OrderBatch``) are processed by one
+``process_search_batch_task``, which runs up to
+``bulk_task_concurrency`` of them at once on a single event loop and
+sends one summary email instead of one per order.
+
+The same coroutines are registered as ``jobqueue`` handlers, which run
+them directly on the job runner's event loop when ``task_backend`` is
+``"jobqueue"``; emails sent from here then go through the job queue too.
 """
 import asyncio
+import logging
+import threading
+import time
 from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
 
 from celery import Celery
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from .config import get_settings
 from .database import async_session_maker
-from .models import OrderStatus, ResultStatus, SearchOrder
+from . import jobqueue, order_state, tracing
+from .metrics import instrument_celery
+from .models import BatchStatus, OrderBatch, OrderStatus, ResultStatus, SearchOrder, User
+from .robots import clock
 from .robots.search_robot import run_search
-from .tasks_utils import send_email_task
+from .tasks_utils import send_email, send_email_task
+from .utils.order_cache import bump_orders_version
+from .utils.profiler import SamplingProfiler, TaskProfileSampler, write_profile
+
 
+logger = logging.getLogger(__name__)
 
 settings = get_settings()
 
@@ -27,45 +48,283 @@ celery_app = Celery(
     broker=settings.celery_broker_url,
     backend=settings.celery_result_backend,
 )
+instrument_celery(settings.worker_metrics_port)
+tracing.instrument_celery()
+
+_task_profiles = TaskProfileSampler(settings.task_profile_slowest_percent)
+
+
+async def _send_email(to_email: str, subject: str, body: str) -> None:
+    """Send an email through the configured task backend."""
+    if settings.task_backend == "jobqueue":
+        await jobqueue.enqueue(send_email_task.name, to_email, subject, body)
+    else:
+        send_email_task.delay(to_email, subject, body)
 
 
-@celery_app.task(name="process_search_order_task")
-def process_search_order_task(order_id: int) -> None:
+@celery_app.task(
+    name="process_search_order_task",
+    bind=True,
+    acks_late=True,
+    reject_on_worker_lost=True,
+    max_retries=settings.search_task_max_retries,
+)
+def process_search_order_task(self, order_id: int, expected_version: Optional[int] = None) -> None:
     """Entry point for the Celery worker.
 
     This wrapper makes it possible to run asynchronous code inside a
     synchronous Celery task by scheduling it on an event loop.
+    ``expected_version`` is the order version the task was dispatched
+    for; a duplicate of an already claimed task does nothing.
+
+    The message is acknowledged after the run, so it is delivered again
+    if the worker dies; the redelivered task takes over the claim its
+    predecessor may have made.  A run that fails is retried with the
+    version it claimed.  When ``task_profile_slowest_percent`` is set
+    the run is sampled and the profile is kept if it was among the
+    slowest recent runs.
     """
-    asyncio.run(_process_search_order(order_id))
+    claimed: List[int] = []
+
+    async def remember_claim(session: AsyncSession, order: SearchOrder) -> None:
+        claimed.append(order.version)
+
+    def run() -> None:
+        clock.run(
+            _process_search_order(
+                order_id,
+                expected_version=expected_version,
+                on_claim=remember_claim,
+                reclaim=bool((self.request.delivery_info or {}).get("redelivered")),
+            ),
+            virtual=settings.robots_virtual_time,
+        )
+
+    try:
+        if settings.task_profile_slowest_percent:
+            _run_profiled(run, f"process_search_order_{order_id}")
+        else:
+            run()
+    except Exception as exc:
+        version = claimed[-1] if claimed else expected_version
+        raise self.retry(
+            exc=exc,
+            args=(order_id, version),
+            kwargs={},
+            countdown=settings.search_task_retry_seconds * 2**self.request.retries,
+        )
 
 
-async def _process_search_order(order_id: int) -> None:
-    """Perform the actual processing of a search order asynchronously."""
+def _run_profiled(run: Callable[[], None], name: str) -> None:
+    profiler = SamplingProfiler(
+        interval=settings.task_profile_interval_ms / 1000, thread_id=threading.get_ident()
+    ).start()
+    started = time.perf_counter()
+    try:
+        run()
+    finally:
+        profiler.stop()
+        elapsed = time.perf_counter() - started
+        if _task_profiles.should_keep(elapsed):
+            write_profile(settings.task_profile_dir, f"{name}_{int(elapsed * 1000)}ms_{int(time.time())}", profiler)
+
+
+class BatchIncomplete(Exception):
+    """Some orders of a batch failed and are still ``PROCESSING``."""
+
+
+@celery_app.task(name="process_search_batch_task", bind=True, max_retries=settings.bulk_task_max_retries)
+def process_search_batch_task(self, batch_id: int) -> None:
+    """Entry point for processing every paid order of a batch.
+
+    Retried while orders fail; the last attempt closes the batch anyway.
+    """
+    final = self.request.retries >= self.max_retries
+    try:
+        clock.run(_process_search_batch(batch_id, final=final), virtual=settings.robots_virtual_time)
+    except BatchIncomplete as exc:
+        raise self.retry(exc=exc, countdown=settings.bulk_task_retry_seconds * 2**self.request.retries)
+
+
+async def _process_search_batch(batch_id: int, final: bool = True) -> None:
+    """Process the paid orders of a batch and send the summary email.
+
+    If some orders fail, raises ``BatchIncomplete`` so that the task is
+    retried, unless ``final``: then they are completed as not found and
+    the batch is closed.
+    """
+    with tracing.span("process_search_batch", batch_id=batch_id):
+        async with async_session_maker() as session:
+            # Orders completed by an earlier, interrupted run are skipped
+            orders = (
+                await session.execute(
+                    select(SearchOrder.id, SearchOrder.version)
+                    .where(SearchOrder.batch_id == batch_id, SearchOrder.status == OrderStatus.PROCESSING)
+                    .order_by(SearchOrder.id)
+                )
+            ).all()
+        limit = asyncio.Semaphore(settings.bulk_task_concurrency)
+
+        async def process(order_id: int, version: int) -> Optional[bool]:
+            async with limit:
+                try:
+                    return await _process_search_order(order_id, notify=False, expected_version=version)
+                except Exception:
+                    logger.exception("Falha ao processar o pedido %s do lote %s", order_id, batch_id)
+                    return None
+
+        outcomes = await asyncio.gather(*(process(order_id, version) for order_id, version in orders))
+
+        async with async_session_maker() as session:
+            batch = await session.get(OrderBatch, batch_id)
+            if batch is None:
+                return
+            remaining = (
+                await session.execute(
+                    select(SearchOrder.id)
+                    .where(SearchOrder.batch_id == batch_id, SearchOrder.status == OrderStatus.PROCESSING)
+                    .limit(1)
+                )
+            ).first()
+            if remaining is not None:
+                if not final:
+                    # A retry claims the failed orders again at their current version
+                    raise BatchIncomplete(f"lote {batch_id} tem pedidos com falha")
+                failed = await order_state.transition_many(
+                    session,
+                    [SearchOrder.batch_id == batch_id],
+                    OrderStatus.PROCESSING,
+                    OrderStatus.COMPLETED_FAILURE,
+                    values={"completed_at": datetime.utcnow()},
+                )
+                await bump_orders_version(session, batch.user_id)
+                logger.warning("Lote %s: %s pedidos com falha concluídos sem resultado", batch_id, failed)
+            batch.status = BatchStatus.COMPLETED
+            batch.completed_at = datetime.utcnow()
+            found = (
+                await session.execute(
+                    select(func.count()).where(
+                        SearchOrder.batch_id == batch_id, SearchOrder.status == OrderStatus.COMPLETED_SUCCESS
+                    )
+                )
+            ).scalar_one()
+            user = await session.get(User, batch.user_id)
+            await session.commit()
+
+        logger.info("Lote %s concluído: %s pedidos processados nesta execução", batch_id, len(outcomes))
+        subject = "Resultado das suas buscas em lote"
+        body = (
+            f"Olá {user.full_name or user.email},\n\n"
+            f"As {batch.order_count} buscas do lote {batch_id} foram concluídas. "
+            f"Encontramos {found} certidões. Confira o relatório de cada busca no seu painel.\n\n"
+            "Atenciosamente,\nEquipe RaizDigital"
+        )
+        await _send_email(user.email, subject, body)
+
+
+OnClaim = Callable[[AsyncSession, SearchOrder], Awaitable[None]]
+
+
+async def _process_search_order(
+    order_id: int,
+    notify: bool = True,
+    expected_version: Optional[int] = None,
+    on_claim: Optional[OnClaim] = None,
+    reclaim: bool = False,
+) -> Optional[bool]:
+    """Perform the actual processing of a search order asynchronously.
+
+    Returns whether the certificate was found, or ``None`` if the order
+    was not processed (missing, not paid, or claimed by another run of
+    the task).  ``notify=False`` skips the result email.  ``on_claim``
+    runs in the transaction that claims the order.  With ``reclaim``
+    the order is also claimed at the version a previous run of the same
+    message left behind (one above ``expected_version``).
+    """
+    with tracing.span("process_search_order", order_id=order_id):
+        return await _process_search_order_traced(order_id, notify, expected_version, on_claim, reclaim)
+
+
+async def _process_search_order_traced(
+    order_id: int, notify: bool, expected_version: Optional[int], on_claim: Optional[OnClaim], reclaim: bool
+) -> Optional[bool]:
     async with async_session_maker() as session:
-        order: SearchOrder | None = await session.get(SearchOrder, order_id)
-        if not order:
-            return
+        order = await order_state.claim(session, order_id, expected_version)
+        if order is None and reclaim and expected_version is not None:
+            # The worker running this message before died after claiming
+            order = await order_state.claim(session, order_id, expected_version + 1)
+        if order is None:
+            logger.info("Pedido %s não está aguardando processamento; tarefa ignorada", order_id)
+            return None
+        if on_claim is not None:
+            await on_claim(session, order)
+        # End the transaction so that no connection sits idle in a
+        # transaction (or holds SQLite's write lock) while sources run.
+        await session.commit()
         # Perform searches using the robot
         results = await run_search(order)
         # Determine final status
         has_found = any(res.status == ResultStatus.FOUND for res in results)
-        order.status = OrderStatus.COMPLETED_SUCCESS if has_found else OrderStatus.COMPLETED_FAILURE
-        order.completed_at = datetime.utcnow()
+        completed = await order_state.transition(
+            session,
+            order.id,
+            OrderStatus.PROCESSING,
+            OrderStatus.COMPLETED_SUCCESS if has_found else OrderStatus.COMPLETED_FAILURE,
+            version=order.version,
+            values={"completed_at": datetime.utcnow()},
+        )
+        if completed is None:
+            # Another run claimed the order meanwhile; it reports the outcome.
+            await session.rollback()
+            return None
+        await bump_orders_version(session, order.user_id)
         await session.commit()
+        if not notify:
+            return has_found
+        user = await session.get(User, order.user_id)
+        # Give back the connection (and SQLite's write lock) before the
+        # email is queued, which may write to the job queue.
+        await session.close()
 
-        # Send notification email to user asynchronously via Celery
+        # Send notification email to user asynchronously via the task backend
         subject = "Resultado da sua busca de certidão"
         if has_found:
             body = (
-                f"Olá {order.user.full_name or order.user.email},\n\n"
+                f"Olá {user.full_name or user.email},\n\n"
                 f"Encontramos a certidão procurada para {order.target_name}. Faça login para ver os detalhes.\n\n"
                 "Atenciosamente,\nEquipe RaizDigital"
             )
         else:
             body = (
-                f"Olá {order.user.full_name or order.user.email},\n\n"
+                f"Olá {user.full_name or user.email},\n\n"
                 f"Infelizmente não encontramos a certidão procurada para {order.target_name}.\n"
                 "Confira o relatório de busca no seu painel.\n\n"
                 "Atenciosamente,\nEquipe RaizDigital"
             )
-        send_email_task.delay(order.user.email, subject, body)
+        await _send_email(user.email, subject, body)
+        return has_found
+
+
+async def _remember_claim(session: AsyncSession, order: SearchOrder) -> None:
+    # The claim bumped the version: a retry (or a reclaim after the
+    # visibility timeout) must expect the new one to claim the order again.
+    await jobqueue.checkpoint(session, order.id, order.version)
+
+
+async def _search_order_job(order_id: int, expected_version: Optional[int] = None) -> None:
+    await _process_search_order(order_id, expected_version=expected_version, on_claim=_remember_claim)
+
+
+async def _search_batch_job(batch_id: int) -> None:
+    await _process_search_batch(batch_id, final=jobqueue.last_attempt())
+
+
+async def _send_email_job(to_email: str, subject: str, body: str) -> None:
+    # smtplib blocks; keep it off the runner's event loop.  Unlike the
+    # Celery task, SMTP errors propagate so the job is retried.
+    await asyncio.to_thread(send_email, to_email, subject, body)
+
+
+jobqueue.register(process_search_order_task.name, _search_order_job)
+jobqueue.register(process_search_batch_task.name, _search_batch_job)
+jobqueue.register(send_email_task.name, _send_email_job)
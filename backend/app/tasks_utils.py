@@ -1,28 +1,32 @@
 """
 Utility tasks for sending email notifications.
 
-This module defines Celery tasks used to send emails.  If SMTP
-configuration is not provided, the email contents are logged to the
-console for development purposes.  In production, configure SMTP
-settings via environment variables to enable real email delivery.
+This module defines Celery tasks used to send emails, and the
+``send_email`` function behind them, which raises when delivery fails so
+that the job queue can retry it.  If SMTP configuration is not provided,
+the email contents are logged to the console for development purposes.
+In production, configure SMTP settings via environment variables to
+enable real email delivery.
 """
 import smtplib
+import time
 from email.mime.text import MIMEText
 from typing import Optional
 
 from .config import get_settings
+from .metrics import EMAIL_SEND_DURATION
 from celery import shared_task
 
 
-@shared_task(name="send_email_task")
-def send_email_task(to_email: str, subject: str, body: str) -> None:
+def send_email(to_email: str, subject: str, body: str) -> None:
     """
-    Celery task to send an email to the specified recipient.
+    Send an email to the specified recipient, raising on SMTP errors.
 
     Uses SMTP credentials provided in configuration. If SMTP is not
     configured, falls back to printing the email contents to stdout.
     """
     settings = get_settings()
+    started = time.perf_counter()
     # If SMTP isn't configured, just log the email to the console
     if not settings.smtp_server or not settings.smtp_username:
         print("=== EMAIL ===")
@@ -30,6 +34,7 @@ def send_email_task(to_email: str, subject: str, body: str) -> None:
         print(f"Subject: {subject}")
         print(body)
         print("=== END EMAIL ===")
+        EMAIL_SEND_DURATION.labels("logged").observe(time.perf_counter() - started)
         return
     # Construct MIME message
     msg = MIMEText(body)
@@ -42,6 +47,21 @@ def send_email_task(to_email: str, subject: str, body: str) -> None:
             server.starttls()
             server.login(settings.smtp_username, settings.smtp_password)
             server.send_message(msg)
+    except Exception:
+        EMAIL_SEND_DURATION.labels("failed").observe(time.perf_counter() - started)
+        raise
+    EMAIL_SEND_DURATION.labels("sent").observe(time.perf_counter() - started)
+
+
+@shared_task(name="send_email_task")
+def send_email_task(to_email: str, subject: str, body: str) -> None:
+    """
+    Celery task to send an email to the specified recipient.
+
+    Delivery failures are printed and not retried.
+    """
+    try:
+        send_email(to_email, subject, body)
     except Exception as exc:
         # In production, integrate with your logger
-        print(f"Failed to send email: {exc}")
\ No newline at end of file
+        print(f"Failed to send email: {exc}")
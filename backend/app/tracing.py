@@ -0,0 +1,230 @@
+"""
+Lightweight distributed tracing.
+
+Spans carry W3C ``traceparent`` identifiers and are tracked with
+``contextvars``, so they follow asyncio tasks and ``asyncio.to_thread``
+calls automatically.  The trace of an order is stitched together across
+processes by passing ``traceparent`` along: HTTP requests accept it as a
+header, the Stripe webhook stores it with the inbox event, and Celery
+tasks carry it in their message headers.  A paid order therefore shows
+up as a single trace covering the webhook, inbox processing, task
+publication, ``_process_search_order``, every ``SearchSource.search``
+call and the SQL statements issued along the way.
+
+Finished spans are written as JSON lines to stdout or to a file
+(``TRACING_EXPORTER`` = ``stdout`` or ``file``), which works offline
+and can be loaded into any trace viewer.  With the default ``none``
+exporter, spans are not even created.
+"""
+import contextvars
+import json
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional, TextIO, Tuple
+
+from celery import signals
+from sqlalchemy import event
+
+from .config import get_settings
+
+
+@dataclass
+class Span:
+    """A timed operation within a trace."""
+
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float = field(default_factory=time.time)
+    end: Optional[float] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("current_span", default=None)
+
+_settings = get_settings()
+_lock = threading.Lock()
+_output: Optional[TextIO] = None
+
+
+def enabled() -> bool:
+    return _settings.tracing_exporter in ("stdout", "file")
+
+
+def _export(span: Span) -> None:
+    global _output
+    record = {
+        "name": span.name,
+        "trace_id": span.trace_id,
+        "span_id": span.span_id,
+        "parent_id": span.parent_id,
+        "start": span.start,
+        "duration_ms": round(((span.end or span.start) - span.start) * 1000, 3),
+        "attributes": span.attributes,
+        "error": span.error,
+    }
+    line = json.dumps(record, default=str) + "\n"
+    with _lock:
+        if _output is None:
+            if _settings.tracing_exporter == "file":
+                _output = open(_settings.tracing_file, "a", buffering=1, encoding="utf-8")
+            else:
+                _output = sys.stdout
+        _output.write(line)
+
+
+def parse_traceparent(traceparent: Optional[str]) -> Optional[Tuple[str, str]]:
+    """Return ``(trace_id, parent_span_id)`` from a ``traceparent`` value."""
+    if not traceparent:
+        return None
+    parts = traceparent.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return parts[1], parts[2]
+
+
+def current_traceparent() -> Optional[str]:
+    """Return the ``traceparent`` of the active span, if any."""
+    span = _current.get()
+    return span.traceparent if span else None
+
+
+def start_span(name: str, traceparent: Optional[str] = None, **attributes: Any) -> Optional[Span]:
+    """Create a span without activating it; ``None`` when tracing is off.
+
+    The parent is the active span, or ``traceparent`` if given.
+    """
+    if not enabled():
+        return None
+    parent = parse_traceparent(traceparent)
+    if parent is None:
+        active = _current.get()
+        parent = (active.trace_id, active.span_id) if active else None
+    trace_id, parent_id = parent if parent else (secrets.token_hex(16), None)
+    return Span(name=name, trace_id=trace_id, span_id=secrets.token_hex(8), parent_id=parent_id, attributes=attributes)
+
+
+def activate(span: Optional[Span]) -> Optional[contextvars.Token]:
+    """Make ``span`` the active span; pass the token to ``finish``."""
+    return _current.set(span) if span else None
+
+
+def finish(span: Optional[Span], token: Optional[contextvars.Token] = None, error: Optional[BaseException] = None) -> None:
+    """End ``span``, restore the previous active span and export it."""
+    if span is None:
+        return
+    if token is not None:
+        _current.reset(token)
+    span.end = time.time()
+    if error is not None:
+        span.error = repr(error)
+    _export(span)
+
+
+@contextmanager
+def span(name: str, traceparent: Optional[str] = None, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Context manager running its body inside a new active span."""
+    new_span = start_span(name, traceparent, **attributes)
+    token = activate(new_span)
+    try:
+        yield new_span
+    except BaseException as exc:
+        finish(new_span, token, exc)
+        raise
+    finish(new_span, token)
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a span per HTTP request."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not enabled():
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        traceparent = headers.get(b"traceparent", b"").decode() or None
+        request_span = start_span(f"HTTP {scope['method']}", traceparent, **{"http.target": scope["path"]})
+        token = activate(request_span)
+
+        async def send_wrapper(message) -> None:
+            if message["type"] == "http.response.start":
+                request_span.set("http.status_code", message["status"])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as exc:
+            finish(request_span, token, exc)
+            raise
+        route = scope.get("route")
+        if route is not None:
+            request_span.name = f"HTTP {scope['method']} {route.path}"
+        finish(request_span, token)
+
+
+def instrument_engine(sync_engine) -> None:
+    """Record a span for every SQL statement executed by ``sync_engine``.
+
+    Statements are only traced inside an existing trace so that
+    background polling does not produce a trace per query.
+    """
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):  # type: ignore[no-untyped-def]
+        if enabled() and _current.get() is not None:
+            conn.info["tracing_span"] = start_span("db.statement", **{"db.statement": statement[:500]})
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):  # type: ignore[no-untyped-def]
+        finish(conn.info.pop("tracing_span", None))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(exception_context):  # type: ignore[no-untyped-def]
+        conn = exception_context.connection
+        if conn is not None:
+            finish(conn.info.pop("tracing_span", None), error=exception_context.original_exception)
+
+
+def instrument_celery() -> None:
+    """Propagate trace context through Celery message headers."""
+    running: Dict[str, Tuple[Span, contextvars.Token]] = {}
+
+    @signals.before_task_publish.connect(weak=False)
+    def _before_publish(sender=None, headers=None, **_kwargs) -> None:
+        if not enabled() or headers is None:
+            return
+        with span("celery.publish", **{"celery.task": sender}):
+            headers["traceparent"] = current_traceparent()
+
+    @signals.task_prerun.connect(weak=False)
+    def _task_prerun(task_id=None, task=None, **_kwargs) -> None:
+        if not enabled():
+            return
+        task_span = start_span(
+            f"celery.execute {task.name}", getattr(task.request, "traceparent", None), **{"celery.task_id": task_id}
+        )
+        running[task_id] = (task_span, activate(task_span))
+
+    @signals.task_postrun.connect(weak=False)
+    def _task_postrun(task_id=None, state=None, **_kwargs) -> None:
+        entry = running.pop(task_id, None)
+        if entry:
+            task_span, token = entry
+            task_span.set("celery.state", state)
+            finish(task_span, token)
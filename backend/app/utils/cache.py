@@ -0,0 +1,105 @@
+"""
+Small caching primitives shared across the application.
+
+``TTLCache`` is a bounded, in-process LRU mapping whose entries expire
+after a per-entry deadline.  It is intentionally tiny and lock-free: the
+API runs on a single event loop per process, so no synchronisation is
+needed between coroutines.  ``get_redis`` returns a lazily created,
+process-wide asynchronous Redis client used as the shared second cache
+level.  Redis is treated as an optimisation only; callers must degrade
+gracefully when it is unavailable.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Generic, Hashable, Optional, Tuple, TypeVar
+
+from redis import asyncio as aioredis
+
+from ..config import get_settings
+
+
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class TTLCache(Generic[V]):
+    """Bounded LRU cache with per-entry expiry.
+
+    ``maxsize`` caps the number of entries; the least recently used entry
+    is evicted when the cap is reached.  ``ttl`` is the default lifetime
+    in seconds, which ``set`` can shorten for individual entries.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, Tuple[float, V]]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Optional[V]:
+        """Return the cached value for ``key`` or ``default`` if absent/expired."""
+        entry = self._data.get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        expires_at, value = entry  # type: ignore[misc]
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None) -> None:
+        """Store ``value`` under ``key`` for ``ttl`` seconds (default: cache TTL)."""
+        lifetime = self.ttl if ttl is None else min(ttl, self.ttl)
+        if lifetime <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + lifetime, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """Remove ``key`` from the cache if present."""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+_redis_client: Optional[aioredis.Redis] = None
+_redis_suspended_until = 0.0
+
+
+def get_redis() -> aioredis.Redis:
+    """Return the shared asynchronous Redis client for this process.
+
+    Short socket timeouts keep a slow or unreachable Redis from adding
+    noticeable latency to the requests that consult it.
+    """
+    global _redis_client
+    if _redis_client is None:
+        settings = get_settings()
+        _redis_client = aioredis.from_url(
+            settings.redis_url,
+            socket_timeout=settings.redis_cache_timeout_seconds,
+            socket_connect_timeout=settings.redis_cache_timeout_seconds,
+        )
+    return _redis_client
+
+
+def redis_suspended() -> bool:
+    """Return ``True`` while Redis is considered unavailable.
+
+    After a failure callers skip Redis for a few seconds instead of
+    paying the connection timeout on every request.
+    """
+    return time.monotonic() < _redis_suspended_until
+
+
+def suspend_redis(seconds: float = 5.0) -> None:
+    """Mark Redis as unavailable for ``seconds``."""
+    global _redis_suspended_until
+    _redis_suspended_until = time.monotonic() + seconds
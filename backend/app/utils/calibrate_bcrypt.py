@@ -0,0 +1,55 @@
+"""
+Pick a bcrypt cost factor for a target hashing latency.
+
+Run on the production hardware::
+
+    python -m app.utils.calibrate_bcrypt --target-ms 250
+
+The command times bcrypt at increasing cost factors and prints the
+highest one whose median latency stays within the target, formatted as
+the ``BCRYPT_ROUNDS`` environment variable.  Existing hashes made with a
+different cost are rehashed transparently the next time a user logs in.
+"""
+import argparse
+import statistics
+import time
+
+from passlib.hash import bcrypt
+
+
+def measure(rounds: int, samples: int) -> float:
+    """Return the median time in milliseconds to hash at ``rounds``."""
+    hasher = bcrypt.using(rounds=rounds)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        hasher.hash("calibration-password")
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(target_ms: float, samples: int = 3, min_rounds: int = 10, max_rounds: int = 16) -> int:
+    """Return the highest cost within ``[min_rounds, max_rounds]`` meeting ``target_ms``."""
+    chosen = min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        elapsed = measure(rounds, samples)
+        print(f"rounds={rounds}: {elapsed:.1f} ms")
+        if elapsed > target_ms:
+            break
+        chosen = rounds
+    return chosen
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Pick a bcrypt cost for a target latency.")
+    parser.add_argument("--target-ms", type=float, default=250.0)
+    parser.add_argument("--samples", type=int, default=3)
+    parser.add_argument("--min-rounds", type=int, default=10)
+    parser.add_argument("--max-rounds", type=int, default=16)
+    args = parser.parse_args()
+    rounds = calibrate(args.target_ms, args.samples, args.min_rounds, args.max_rounds)
+    print(f"BCRYPT_ROUNDS={rounds}")
+
+
+if __name__ == "__main__":
+    main()
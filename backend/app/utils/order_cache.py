@@ -0,0 +1,113 @@
+"""
+HTTP caching helpers for order resources.
+
+Order detail responses are validated with a strong ETag derived from
+the order's status, ``completed_at`` and its latest result, which a
+single aggregate query can compute without loading the results.  The
+order list is validated with ``User.orders_version``, a per-user counter
+that every writer touching a user's orders must increment through
+``bump_orders_version`` in the same transaction as its change.
+
+The same counter keys a cache of serialised order lists, held in a
+per-process ``TTLCache`` backed by Redis.  Because every write to a
+user's orders bumps the version in the same transaction, a reader that
+sees version N can only be served a list cached for N: writes never
+need to delete entries, superseded versions simply stop being read and
+expire, and a stale list cannot be returned after a write commits.
+"""
+import hashlib
+import logging
+from typing import Any, Optional
+
+from redis.exceptions import RedisError
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .. import models
+from ..config import get_settings
+from .cache import TTLCache, get_redis, redis_suspended, suspend_redis
+
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+
+# Bump when the serialised representation of orders changes so that
+# clients do not revalidate against responses from an older release.
+REPRESENTATION_VERSION = "1"
+
+# Even completed orders still receive results from the robots
+# (``POST /internal/search_results``), so every response is revalidated.
+CACHE_CONTROL_REVALIDATE = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """Build a strong ETag from the given validator parts."""
+    raw = "|".join(str(part) for part in (REPRESENTATION_VERSION, *parts))
+    return '"' + hashlib.sha256(raw.encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Return ``True`` if an ``If-None-Match`` header matches ``etag``."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    # If-None-Match uses weak comparison, so ignore any W/ prefix
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+async def bump_orders_version(session: AsyncSession, user_id: int) -> None:
+    """Invalidate validators of ``user_id``'s order list.  Does not commit."""
+    await session.execute(
+        update(models.User)
+        .where(models.User.id == user_id)
+        .values(orders_version=models.User.orders_version + 1)
+    )
+
+
+async def get_orders_version(session: AsyncSession, user_id: int) -> Optional[int]:
+    """Return the current order-list version of ``user_id``."""
+    result = await session.execute(select(models.User.orders_version).where(models.User.id == user_id))
+    return result.scalar_one_or_none()
+
+
+_orders_local: TTLCache[bytes] = TTLCache(
+    maxsize=settings.orders_cache_max_entries, ttl=settings.orders_cache_ttl_seconds
+)
+
+
+def _orders_key(user_id: int, version: int) -> str:
+    return f"orders:{REPRESENTATION_VERSION}:{user_id}:{version}"
+
+
+async def get_cached_orders(user_id: int, version: int) -> Optional[bytes]:
+    """Return the serialised order list of ``user_id`` at ``version``, if cached."""
+    key = _orders_key(user_id, version)
+    body = _orders_local.get(key)
+    if body is not None or redis_suspended():
+        return body
+    try:
+        body = await get_redis().get(key)
+    except RedisError as exc:
+        logger.debug("Order list lookup in Redis failed: %s", exc)
+        suspend_redis()
+        return None
+    if body is not None:
+        _orders_local.set(key, body)
+    return body
+
+
+async def store_orders(user_id: int, version: int, body: bytes) -> None:
+    """Cache the serialised order list of ``user_id`` at ``version``."""
+    key = _orders_key(user_id, version)
+    _orders_local.set(key, body)
+    if redis_suspended():
+        return
+    try:
+        await get_redis().set(key, body, ex=settings.orders_cache_ttl_seconds)
+    except RedisError as exc:
+        logger.debug("Order list store in Redis failed: %s", exc)
+        suspend_redis()
@@ -0,0 +1,101 @@
+"""
+In-process statistical profiler.
+
+``SamplingProfiler`` runs in a background thread and periodically
+captures the stacks of the other threads with ``sys._current_frames``.
+Samples are aggregated as collapsed stacks (``frame;frame;frame
+count``), the input format of flamegraph.pl, speedscope and most other
+flame graph viewers.  Sampling never pauses the profiled threads, so it
+is safe to run against a live process; the cost is one stack walk per
+thread per interval.
+
+``TaskProfileSampler`` decides which task profiles to keep: it tracks a
+window of recent task durations and keeps a profile only when its task
+was among the slowest ``percent`` of that window.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Optional
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}"
+
+
+class SamplingProfiler:
+    """Samples thread stacks at a fixed interval until stopped."""
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None) -> None:
+        self.interval = interval
+        self.thread_id = thread_id
+        self.samples = 0
+        self._stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _sample(self) -> None:
+        own = threading.get_ident()
+        for ident, frame in sys._current_frames().items():
+            if ident == own or (self.thread_id is not None and ident != self.thread_id):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self._stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self) -> "SamplingProfiler":
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run_for(self, seconds: float) -> None:
+        """Sample from the calling thread for ``seconds`` (blocking)."""
+        deadline = time.monotonic() + seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            self._sample()
+
+    def collapsed(self) -> str:
+        """Return the samples in collapsed-stack format."""
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+class TaskProfileSampler:
+    """Keeps profiles of the slowest ``percent`` of recent task runs."""
+
+    def __init__(self, percent: float, window: int = 200, min_samples: int = 20) -> None:
+        self.percent = percent
+        self.min_samples = min_samples
+        self._durations: Deque[float] = deque(maxlen=window)
+
+    def should_keep(self, duration: float) -> bool:
+        """Record ``duration`` and return whether its profile should be kept."""
+        self._durations.append(duration)
+        if len(self._durations) < self.min_samples:
+            return False
+        ordered = sorted(self._durations)
+        threshold_index = min(len(ordered) - 1, int(len(ordered) * (1 - self.percent / 100)))
+        return duration >= ordered[threshold_index]
+
+
+def write_profile(directory: str, name: str, profiler: SamplingProfiler) -> str:
+    """Write ``profiler``'s collapsed stacks to ``directory`` and return the path."""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.collapsed")
+    with open(path, "w", encoding="utf-8") as fh:
+        fh.write(profiler.collapsed())
+    return path
@@ -0,0 +1,62 @@
+"""
+Users who wrote recently, for read-your-writes on read replicas.
+
+Replicas apply the primary's changes with some delay, so a user who has
+just created an order could list their orders on a replica and not see
+it.  ``database.get_session`` calls ``record_write`` when an
+authenticated request wrote through the primary, and read-only sessions
+(see ``replicas``) go to the primary for that user while
+``wrote_recently`` is true.  The window,
+``database_read_your_writes_seconds``, should exceed the replica lag
+tolerated by the health checks.
+
+Marks live in a per-process ``TTLCache`` and in Redis, so the request
+after a write is sticky whichever API process serves it.  When Redis is
+unavailable only the local marks are consulted.
+"""
+import logging
+import math
+
+from redis.exceptions import RedisError
+
+from ..config import get_settings
+from .cache import TTLCache, get_redis, redis_suspended, suspend_redis
+
+
+logger = logging.getLogger(__name__)
+
+settings = get_settings()
+
+_local: TTLCache[bool] = TTLCache(
+    maxsize=settings.user_cache_max_entries, ttl=settings.database_read_your_writes_seconds
+)
+
+
+def _key(user_id: int) -> str:
+    return f"recent-write:{user_id}"
+
+
+async def record_write(user_id: int) -> None:
+    """Route ``user_id``'s reads to the primary for the read-your-writes window."""
+    _local.set(user_id, True)
+    if redis_suspended():
+        return
+    try:
+        await get_redis().set(_key(user_id), b"1", ex=math.ceil(settings.database_read_your_writes_seconds))
+    except RedisError as exc:
+        logger.debug("Recent write store in Redis failed: %s", exc)
+        suspend_redis()
+
+
+async def wrote_recently(user_id: int) -> bool:
+    """Return ``True`` if ``user_id`` wrote within the read-your-writes window."""
+    if _local.get(user_id):
+        return True
+    if redis_suspended():
+        return False
+    try:
+        return bool(await get_redis().exists(_key(user_id)))
+    except RedisError as exc:
+        logger.debug("Recent write lookup in Redis failed: %s", exc)
+        suspend_redis()
+        return False
@@ -1,21 +1,52 @@
 """
 Security utilities for password hashing and JWT authentication.
 
-This module uses Passlib's ``CryptContext`` to hash and verify
-passwords securely.  JWT tokens are generated and verified using
-``python-jose``; tokens carry the user ID and expire after a
-configurable duration.
+This module uses Passlib's ``CryptContext`` to hash and verify passwords
+securely.  bcrypt is CPU bound and would block the event loop for
+hundreds of milliseconds, so request handlers use the ``*_async``
+variants which run it in a bounded thread pool and raise
+``PasswordHasherBusy`` when the pool is saturated.  JWT tokens are
+generated and verified using ``python-jose``; tokens carry the user ID
+and expire after a configurable duration.  Successfully verified tokens
+are remembered in a bounded cache keyed by their SHA-256 digest so that
+the signature is not recomputed on every request of a dashboard session.
 """
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Optional
+from typing import Any, Optional, Tuple
 
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
 from ..config import get_settings
+from .cache import TTLCache
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+_settings = get_settings()
+
+# Pinning min/max rounds to the configured cost makes ``verify_and_update``
+# report hashes created with a different cost so they are rehashed on login.
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=_settings.bcrypt_rounds,
+    bcrypt__min_rounds=_settings.bcrypt_rounds,
+    bcrypt__max_rounds=_settings.bcrypt_rounds,
+)
+
+_hash_executor = ThreadPoolExecutor(
+    max_workers=_settings.password_hash_workers, thread_name_prefix="bcrypt"
+)
+_hash_capacity = _settings.password_hash_workers + _settings.password_hash_max_pending
+_hash_in_flight = 0
+# Maps sha256(token) -> user ID.  Only valid tokens are stored, and each
+# entry expires no later than the token's own ``exp`` claim.
+_verified_tokens: TTLCache[int] = TTLCache(
+    maxsize=_settings.token_cache_max_entries, ttl=_settings.token_cache_ttl_seconds
+)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -28,6 +59,44 @@ def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
 
+class PasswordHasherBusy(Exception):
+    """Raised when the password hashing pool cannot accept more work."""
+
+
+async def _run_hasher(func, *args):
+    """Run ``func`` in the bcrypt pool, rejecting work beyond its capacity."""
+    global _hash_in_flight
+    if _hash_in_flight >= _hash_capacity:
+        raise PasswordHasherBusy()
+    _hash_in_flight += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_hash_executor, func, *args)
+    finally:
+        _hash_in_flight -= 1
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Non-blocking ``verify_password``."""
+    return await _run_hasher(verify_password, plain_password, hashed_password)
+
+
+async def verify_and_update_password_async(
+    plain_password: str, hashed_password: str
+) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a replacement hash if its cost is outdated.
+
+    Returns ``(valid, new_hash)`` where ``new_hash`` is ``None`` unless the
+    stored hash should be replaced.
+    """
+    return await _run_hasher(pwd_context.verify_and_update, plain_password, hashed_password)
+
+
+async def get_password_hash_async(password: str) -> str:
+    """Non-blocking ``get_password_hash``."""
+    return await _run_hasher(get_password_hash, password)
+
+
 def create_token(*, data: dict, expires_delta: timedelta) -> str:
     """Generate a JWT token with a specific expiration interval."""
     settings = get_settings()
@@ -50,15 +119,36 @@ def create_refresh_token(*, data: dict, expires_days: int = 7) -> str:
     return create_token(data=data, expires_delta=timedelta(days=expires_days))
 
 
-def verify_token(token: str) -> Optional[int]:
-    """Decode a JWT token and return the user ID if valid.
+def decode_token(token: str) -> Optional[dict[str, Any]]:
+    """Fully decode and validate a JWT, bypassing the verified-token cache.
 
-    Returns ``None`` if the token is invalid or expired.
+    Returns the payload, or ``None`` if the token is invalid or expired.
     """
     settings = get_settings()
     try:
-        payload: dict[str, Any] = jwt.decode(token, settings.secret_key, algorithms=[settings.jwt_algorithm])
-        user_id: int = int(payload.get("user_id"))
+        return jwt.decode(token, settings.secret_key, algorithms=[settings.jwt_algorithm])
+    except JWTError:
+        return None
+
+
+def verify_token(token: str) -> Optional[int]:
+    """Decode a JWT token and return the user ID if valid.
+
+    Returns ``None`` if the token is invalid or expired.  Valid tokens
+    are cached until ``exp`` (bounded by ``token_cache_ttl_seconds``).
+    """
+    digest = hashlib.sha256(token.encode()).digest()
+    user_id = _verified_tokens.get(digest)
+    if user_id is not None:
         return user_id
-    except (JWTError, ValueError, TypeError):
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    try:
+        user_id = int(payload.get("user_id"))
+    except (ValueError, TypeError):
         return None
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        _verified_tokens.set(digest, user_id, ttl=exp - time.time())
+    return user_id
@@ -0,0 +1,21 @@
+"""
+Text normalisation shared by search and deduplication.
+
+``fold`` reduces free-form names the way customers type them
+inconsistently: accents are stripped, case is lowered and runs of
+whitespace collapse to single spaces, so "JOSÉ  da Silva" and
+"jose da silva" compare equal.
+"""
+import unicodedata
+from typing import Optional
+
+
+def fold(value: Optional[str]) -> str:
+    """Return ``value`` accent-folded, lower case and whitespace-normalised."""
+    folded = unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode()
+    return " ".join(folded.lower().split())
+
+
+def search_text(*values: Optional[str]) -> str:
+    """Return the folded text searched by ``GET /orders/search``."""
+    return " ".join(part for part in (fold(value) for value in values) if part)
@@ -0,0 +1,229 @@
+"""
+Two-level cache of authenticated users.
+
+``get_current_user`` resolves a user on every authenticated request.
+Instead of querying ``users`` each time, a read-only ``UserSnapshot`` is
+kept in a per-process ``TTLCache`` backed by Redis.  Writers that change
+a user call ``invalidate_user`` after committing; the Redis copy is
+deleted and an invalidation message is published so that every API
+process drops its local copy immediately.  The TTL only bounds how long
+an entry may survive if an invalidation message is lost.
+
+A request that missed the cache loads the user from the database and
+then stores it; if another process invalidated the user in between, the
+store would put the stale row back.  ``invalidate_user`` therefore also
+increments a per-user generation in Redis, which callers read with
+``current_generation`` before loading the user, and ``store_user`` only
+writes to Redis (atomically, in a script) while that generation is
+unchanged.
+"""
+import asyncio
+import json
+import logging
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from redis import asyncio as aioredis
+from redis.exceptions import RedisError
+
+from .. import models
+from ..config import get_settings
+from .cache import TTLCache, get_redis, redis_suspended, suspend_redis
+
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "user-cache:invalidate"
+
+# Far longer than any database read between ``current_generation`` and
+# ``store_user``; an expired generation reads as "0" again.
+GENERATION_TTL_SECONDS = 24 * 3600
+
+# Stores the snapshot only if the user's generation is the one read
+# before it was loaded.
+_STORE_SCRIPT = """
+if (redis.call('get', KEYS[2]) or '0') == ARGV[1] then
+    redis.call('set', KEYS[1], ARGV[2], 'EX', ARGV[3])
+    return 1
+end
+return 0
+"""
+
+# Local and Redis invalidation generations; the latter is ``None`` when
+# Redis could not be read, and the snapshot then stays out of Redis.
+Generation = Tuple[int, Optional[bytes]]
+
+settings = get_settings()
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Detached, immutable view of a ``models.User`` row.
+
+    The password hash is deliberately left out so that credentials never
+    reach Redis; handlers that need it must load the ORM instance.
+    """
+
+    id: int
+    email: str
+    full_name: Optional[str]
+    created_at: datetime
+
+    @classmethod
+    def from_model(cls, user: models.User) -> "UserSnapshot":
+        return cls(id=user.id, email=user.email, full_name=user.full_name, created_at=user.created_at)
+
+    def to_json(self) -> str:
+        data = asdict(self)
+        data["created_at"] = self.created_at.isoformat()
+        return json.dumps(data)
+
+    @classmethod
+    def from_json(cls, raw: str) -> "UserSnapshot":
+        data = json.loads(raw)
+        data["created_at"] = datetime.fromisoformat(data["created_at"])
+        return cls(**data)
+
+
+_local: TTLCache[UserSnapshot] = TTLCache(
+    maxsize=settings.user_cache_max_entries, ttl=settings.user_cache_ttl_seconds
+)
+# The local level is only trusted while this process is subscribed to
+# invalidation messages; otherwise other processes could not reach it.
+_listening = False
+# Incremented on every invalidation so that a lookup which started
+# before the invalidation cannot re-populate the cache with stale data.
+_generations: Dict[int, int] = {}
+
+
+def _redis_key(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def _generation_key(user_id: int) -> str:
+    return f"user-generation:{user_id}"
+
+
+async def get_cached_user(user_id: int) -> Optional[UserSnapshot]:
+    """Return a cached snapshot from the local cache or Redis, if any."""
+    if _listening:
+        snapshot = _local.get(user_id)
+        if snapshot is not None:
+            return snapshot
+    if redis_suspended():
+        return None
+    generation = _generations.get(user_id, 0)
+    try:
+        raw = await get_redis().get(_redis_key(user_id))
+    except RedisError as exc:
+        logger.debug("User cache lookup in Redis failed: %s", exc)
+        suspend_redis()
+        return None
+    if raw is None:
+        return None
+    snapshot = UserSnapshot.from_json(raw)
+    if _listening and _generations.get(user_id, 0) == generation:
+        _local.set(user_id, snapshot)
+    return snapshot
+
+
+async def store_user(user: models.User, generation: Generation) -> UserSnapshot:
+    """Cache ``user`` unless it was invalidated since ``generation``."""
+    snapshot = UserSnapshot.from_model(user)
+    local_generation, shared_generation = generation
+    if _generations.get(user.id, 0) != local_generation:
+        return snapshot
+    if _listening:
+        _local.set(user.id, snapshot)
+    if shared_generation is None or redis_suspended():
+        return snapshot
+    try:
+        await get_redis().eval(
+            _STORE_SCRIPT,
+            2,
+            _redis_key(user.id),
+            _generation_key(user.id),
+            shared_generation,
+            snapshot.to_json(),
+            settings.user_cache_ttl_seconds,
+        )
+    except RedisError as exc:
+        logger.debug("User cache store in Redis failed: %s", exc)
+        suspend_redis()
+    return snapshot
+
+
+async def current_generation(user_id: int) -> Generation:
+    """Return the invalidation generation to pass to ``store_user``.
+
+    Must be read before the user is loaded from the database.
+    """
+    local_generation = _generations.get(user_id, 0)
+    if redis_suspended():
+        return local_generation, None
+    try:
+        shared_generation = await get_redis().get(_generation_key(user_id))
+    except RedisError as exc:
+        logger.debug("User cache generation lookup in Redis failed: %s", exc)
+        suspend_redis()
+        return local_generation, None
+    return local_generation, shared_generation or b"0"
+
+
+def _evict_local(user_id: int) -> None:
+    _generations[user_id] = _generations.get(user_id, 0) + 1
+    _local.pop(user_id)
+
+
+async def invalidate_user(user_id: int) -> None:
+    """Drop ``user_id`` from every cache level.  Call after committing."""
+    _evict_local(user_id)
+    try:
+        redis = get_redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.incr(_generation_key(user_id))
+            pipe.expire(_generation_key(user_id), GENERATION_TTL_SECONDS)
+            pipe.delete(_redis_key(user_id))
+            await pipe.execute()
+        await redis.publish(INVALIDATION_CHANNEL, str(user_id))
+    except RedisError as exc:
+        logger.warning("Could not propagate user cache invalidation for %s: %s", user_id, exc)
+
+
+async def run_invalidation_listener() -> None:
+    """Evict local entries when other processes invalidate a user.
+
+    Runs until cancelled, reconnecting with a short delay when Redis is
+    unavailable.  The local level is disabled while disconnected and
+    cleared on reconnect because messages may have been missed.
+    """
+    global _listening
+    # Subscriptions block indefinitely, so they need a client without the
+    # short socket timeout used for cache lookups.
+    client = aioredis.from_url(settings.redis_url)
+    while True:
+        pubsub = client.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            _local.clear()
+            _listening = True
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    _evict_local(int(message["data"]))
+                except (TypeError, ValueError):
+                    continue
+        except asyncio.CancelledError:
+            raise
+        except (RedisError, OSError) as exc:
+            logger.debug("User cache invalidation listener disconnected: %s", exc)
+            await asyncio.sleep(5)
+        finally:
+            _listening = False
+            _local.clear()
+            try:
+                await pubsub.aclose()
+            except (RedisError, OSError):
+                pass
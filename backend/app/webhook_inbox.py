@@ -0,0 +1,231 @@
+"""
+Background processing of the Stripe webhook inbox.
+
+``routers.webhooks`` persists each verified event to ``stripe_events``
+and acknowledges Stripe immediately.  ``run_consumer`` runs inside every
+API process, woken by ``notify`` after an insert and polling as a
+fallback.  Pending events are claimed in batches with
+``FOR UPDATE SKIP LOCKED`` so several processes never handle the same
+row, and are applied in Stripe creation order per order (or per batch of
+orders paid together).  Each event is
+applied in its own savepoint: a failure is recorded on the row and the
+event is retried up to ``MAX_ATTEMPTS`` times without affecting the rest
+of the batch.  The emails and tasks an event starts are written to the
+task outbox (or, with the job queue, to ``jobs``) in the transaction
+that marks it processed, and the consumer relays them to the broker
+after the commit (see ``task_outbox``), so a crash in between cannot
+lose them.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import models, order_state, task_outbox, task_publisher, tracing
+from .config import get_settings
+from .database import async_session_maker
+from .tasks import process_search_batch_task, process_search_order_task
+from .tasks_utils import send_email_task
+from .utils.order_cache import bump_orders_version
+
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+HANDLED_EVENT_TYPES = frozenset({"checkout.session.completed"})
+
+SideEffect = task_publisher.TaskMessage
+Handler = Callable[[AsyncSession, models.StripeEvent, List[SideEffect]], Awaitable[None]]
+
+_wakeup = asyncio.Event()
+
+
+def notify() -> None:
+    """Wake the consumer of this process after new events were stored."""
+    _wakeup.set()
+
+
+async def _handle_checkout_completed(
+    session: AsyncSession, event: models.StripeEvent, side_effects: List[SideEffect]
+) -> None:
+    """Move a paid order to ``PROCESSING`` and start its search."""
+    if event.batch_id is not None:
+        await _handle_batch_checkout_completed(session, event, side_effects)
+        return
+    # Conditional transition: redelivered or concurrent events for an
+    # order that has already left PENDING_PAYMENT change nothing.  Orders
+    # of a batch are only paid through the batch's session.
+    row = await order_state.transition(
+        session,
+        event.order_id,
+        models.OrderStatus.PENDING_PAYMENT,
+        models.OrderStatus.PROCESSING,
+        returning=(models.SearchOrder.user_id, models.SearchOrder.target_name),
+        criteria=[models.SearchOrder.batch_id.is_(None)],
+    )
+    if row is None:
+        logger.info("Stripe event %s for order %s changed nothing", event.id, event.order_id)
+        return
+    version, user_id, target_name = row
+    await bump_orders_version(session, user_id)
+    user = (
+        await session.execute(select(models.User.email, models.User.full_name).where(models.User.id == user_id))
+    ).one()
+
+    order_id = event.order_id
+    subject = "Sua busca foi iniciada"
+    body = (
+        f"Olá {user.full_name or user.email},\n\n"
+        f"Recebemos o seu pagamento para a busca da certidão de {target_name}."
+        "Nossa equipe e robôs estão iniciando a busca e enviaremos um e-mail quando estiver concluída.\n\n"
+        "Atenciosamente,\nEquipe RaizDigital"
+    )
+    side_effects.append(task_publisher.message(send_email_task, user.email, subject, body))
+    side_effects.append(task_publisher.message(process_search_order_task, order_id, version))
+
+
+async def _handle_batch_checkout_completed(
+    session: AsyncSession, event: models.StripeEvent, side_effects: List[SideEffect]
+) -> None:
+    """Move a paid batch and its orders to ``PROCESSING`` and start one batch task."""
+    result = await session.execute(
+        update(models.OrderBatch)
+        .where(
+            models.OrderBatch.id == event.batch_id,
+            models.OrderBatch.status == models.BatchStatus.PENDING_PAYMENT,
+        )
+        .values(status=models.BatchStatus.PROCESSING)
+        .returning(models.OrderBatch.user_id, models.OrderBatch.order_count)
+    )
+    row = result.one_or_none()
+    if row is None:
+        logger.info("Stripe event %s for batch %s changed nothing", event.id, event.batch_id)
+        return
+    user_id, order_count = row
+    await order_state.transition_many(
+        session,
+        [models.SearchOrder.batch_id == event.batch_id],
+        models.OrderStatus.PENDING_PAYMENT,
+        models.OrderStatus.PROCESSING,
+    )
+    await bump_orders_version(session, user_id)
+    user = (
+        await session.execute(select(models.User.email, models.User.full_name).where(models.User.id == user_id))
+    ).one()
+
+    batch_id = event.batch_id
+    subject = "Suas buscas foram iniciadas"
+    body = (
+        f"Olá {user.full_name or user.email},\n\n"
+        f"Recebemos o seu pagamento para as {order_count} buscas do lote {batch_id}. "
+        "Enviaremos um e-mail com o resumo quando todas estiverem concluídas.\n\n"
+        "Atenciosamente,\nEquipe RaizDigital"
+    )
+    side_effects.append(task_publisher.message(send_email_task, user.email, subject, body))
+    side_effects.append(task_publisher.message(process_search_batch_task, batch_id))
+
+
+HANDLERS: Dict[str, Handler] = {
+    "checkout.session.completed": _handle_checkout_completed,
+}
+
+
+async def process_pending(batch_size: int) -> int:
+    """Process one batch of pending events and return how many were claimed."""
+    side_effects: List[SideEffect] = []
+    async with async_session_maker() as session:
+        events = (
+            await session.execute(
+                select(models.StripeEvent)
+                .where(models.StripeEvent.processed_at.is_(None), models.StripeEvent.attempts < MAX_ATTEMPTS)
+                .order_by(models.StripeEvent.received_at)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+        ).scalars().all()
+        if not events:
+            return 0
+        by_order: Dict[object, List[models.StripeEvent]] = defaultdict(list)
+        for ev in events:
+            by_order[(ev.order_id, ev.batch_id)].append(ev)
+        for order_events in by_order.values():
+            order_events.sort(key=lambda ev: (ev.stripe_created, ev.received_at))
+            for ev in order_events:
+                pending_effects: List[SideEffect] = []
+                try:
+                    with tracing.span(
+                        "stripe_event.process", ev.traceparent, event_id=ev.id, order_id=ev.order_id, batch_id=ev.batch_id
+                    ):
+                        async with session.begin_nested():
+                            await HANDLERS[ev.type](session, ev, pending_effects)
+                except Exception as exc:
+                    logger.exception("Failed to process Stripe event %s", ev.id)
+                    ev.attempts += 1
+                    ev.last_error = repr(exc)
+                    continue
+                ev.attempts += 1
+                ev.processed_at = datetime.utcnow()
+                side_effects.extend(pending_effects)
+        await task_outbox.add(session, side_effects)
+        await session.commit()
+    return len(events)
+
+
+async def run_consumer() -> None:
+    """Process the inbox until cancelled."""
+    settings = get_settings()
+    while True:
+        _wakeup.clear()
+        try:
+            claimed = await process_pending(settings.webhook_inbox_batch_size)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Stripe webhook inbox consumer failed; retrying")
+            claimed = 0
+        try:
+            relayed = await task_outbox.relay(settings.task_publisher_batch_size)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Task outbox relay failed; retrying")
+            relayed = 0
+        if claimed >= settings.webhook_inbox_batch_size or relayed >= settings.task_publisher_batch_size:
+            continue
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=settings.webhook_inbox_poll_seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def inbox_row(event: dict, payload: str) -> dict:
+    """Return the ``stripe_events`` column values for a verified event.
+
+    Raises ``ValueError`` if a checkout event references neither an order
+    nor a batch.
+    """
+    order_id = batch_id = None
+    if event["type"] == "checkout.session.completed":
+        metadata = event["data"]["object"].get("metadata") or {}
+        if metadata.get("batch_id") is not None:
+            batch_id = int(metadata["batch_id"])
+        elif metadata.get("order_id") is not None:
+            order_id = int(metadata["order_id"])
+        else:
+            raise ValueError("Missing order_id in metadata")
+    return {
+        "id": event["id"],
+        "type": event["type"],
+        "order_id": order_id,
+        "batch_id": batch_id,
+        "payload": payload,
+        "stripe_created": int(event.get("created") or 0),
+        "received_at": datetime.utcnow(),
+        "attempts": 0,
+        "traceparent": tracing.current_traceparent(),
+    }
@@ -0,0 +1,44 @@
+"""
+Benchmarks for the RaizDigital backend.
+
+Each module in this package is a standalone script meant to be run
+from the ``backend`` directory, e.g. ``python -m benchmarks.auth_overhead``.
+Results are printed as JSON so they can be stored and compared between
+commits.  ``configure_environment`` points the application at local,
+dependency-free stand-ins (SQLite, in-memory Celery broker) unless the
+corresponding environment variables are already set; it must be called
+before any ``app`` module is imported.
+"""
+import os
+import statistics
+import tempfile
+from typing import Dict, List
+
+
+def configure_environment(database_path: str = "") -> str:
+    """Set offline defaults for the app settings and return the database URL."""
+    if not database_path:
+        database_path = os.path.join(tempfile.mkdtemp(prefix="raizdigital-bench-"), "bench.db")
+    os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{database_path}")
+    os.environ.setdefault("REDIS_URL", "redis://127.0.0.1:6379/15")
+    os.environ.setdefault("CELERY_BROKER_URL", "memory://")
+    os.environ.setdefault("CELERY_RESULT_BACKEND", "cache+memory://")
+    os.environ.setdefault("SECRET_KEY", "benchmark-secret")
+    return os.environ["DATABASE_URL"]
+
+
+def summarize(samples_ns: List[int]) -> Dict[str, float]:
+    """Return mean and percentile statistics in microseconds."""
+    ordered = sorted(samples_ns)
+
+    def pct(p: float) -> float:
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index] / 1000
+
+    return {
+        "count": len(ordered),
+        "mean_us": statistics.fmean(ordered) / 1000,
+        "p50_us": pct(50),
+        "p95_us": pct(95),
+        "p99_us": pct(99),
+    }
@@ -0,0 +1,73 @@
+"""
+Per-request overhead of the authentication dependency.
+
+Measures ``get_current_user`` the way it ran before request caching (a
+full JWT decode plus a ``users`` primary-key lookup) against the cached
+path (verified-token cache plus user snapshot cache), and the token
+verification step on its own.
+
+Usage::
+
+    python -m benchmarks.auth_overhead --iterations 5000
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from . import configure_environment, summarize
+
+
+async def _run(iterations: int) -> dict:
+    from app import models
+    from app.database import async_session_maker, init_db
+    from app.dependencies import get_current_user
+    from app.utils import security, user_cache
+
+    await init_db()
+    async with async_session_maker() as session:
+        user = models.User(email=f"bench-{time.time_ns()}@example.com", password_hash="x")
+        session.add(user)
+        await session.commit()
+        token = security.create_access_token(data={"user_id": user.id})
+
+        async def uncached() -> None:
+            payload = security.decode_token(token)
+            await session.get(models.User, int(payload["user_id"]))
+            session.expunge_all()
+
+        async def cached() -> None:
+            await get_current_user(token=token, session=session)
+
+        # Behave like an API process subscribed to cache invalidations.
+        user_cache._listening = True
+        results = {}
+        for name, func in (("uncached_dependency", uncached), ("cached_dependency", cached)):
+            await func()
+            samples = []
+            for _ in range(iterations):
+                start = time.perf_counter_ns()
+                await func()
+                samples.append(time.perf_counter_ns() - start)
+            results[name] = summarize(samples)
+
+    for name, func in (("jwt_decode", lambda: security.decode_token(token)), ("verify_token_cached", lambda: security.verify_token(token))):
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter_ns()
+            func()
+            samples.append(time.perf_counter_ns() - start)
+        results[name] = summarize(samples)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+    configure_environment()
+    print(json.dumps(asyncio.run(_run(args.iterations)), indent=2))
+
+
+if __name__ == "__main__":
+    main()
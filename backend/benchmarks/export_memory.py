@@ -0,0 +1,196 @@
+"""
+Memory use of the streaming order export.
+
+Seeds one user per requested size with ``results / results_per_order``
+orders and their results, then consumes
+``order_export.stream_export`` for each and reports the peak traced
+Python memory, bytes produced, rows per second and time to the first
+chunk.  A streaming export should show about the same peak for every
+size; ``--materialize`` adds the same measurement for loading the
+orders as ORM objects and serialising them in one piece, the way
+``GET /orders/`` does, for comparison.
+
+The script exits with status 1 if the streaming peak for the largest
+size exceeds ``--max-peak-mb`` (about 3 MB is typical for 100,000
+results), so it can guard against regressions that buffer the export.
+
+Usage::
+
+    python -m benchmarks.export_memory --results 10000,100000 --format csv --gzip
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Dict, List
+
+from . import configure_environment
+
+
+SEED_CHUNK = 5_000
+
+
+async def _seed(results: int, results_per_order: int) -> int:
+    from sqlalchemy import insert, select
+
+    from app import models
+    from app.database import async_session_maker
+
+    now = datetime.utcnow()
+    orders = max(1, results // results_per_order)
+    async with async_session_maker() as session:
+        user = models.User(email=f"export-{time.time_ns()}@example.com", password_hash="x")
+        session.add(user)
+        await session.flush()
+        for start in range(0, orders, SEED_CHUNK):
+            await session.execute(
+                insert(models.SearchOrder),
+                [
+                    {
+                        "user_id": user.id,
+                        "status": models.OrderStatus.COMPLETED_FAILURE,
+                        "order_price": 49.9,
+                        "target_name": f"Pessoa {number} da Silva",
+                        "target_city": "São Paulo",
+                        "target_state": "SP",
+                        "created_at": now,
+                        "completed_at": now,
+                    }
+                    for number in range(start, min(orders, start + SEED_CHUNK))
+                ],
+            )
+        order_ids = (
+            await session.execute(select(models.SearchOrder.id).where(models.SearchOrder.user_id == user.id))
+        ).scalars().all()
+        orders_per_chunk = max(1, SEED_CHUNK // results_per_order)
+        for start in range(0, len(order_ids), orders_per_chunk):
+            await session.execute(
+                insert(models.SearchResult),
+                [
+                    {
+                        "order_id": order_id,
+                        "source_name": f"Fonte {n}",
+                        "status": models.ResultStatus.NOT_FOUND,
+                        "details": "Nenhum registro correspondente encontrado.",
+                        "timestamp": now,
+                        "duration_ms": 120,
+                    }
+                    for order_id in order_ids[start : start + orders_per_chunk]
+                    for n in range(results_per_order)
+                ],
+            )
+        await session.commit()
+    return user.id
+
+
+async def _measure_stream(user_id: int, fmt: str, gzip: bool) -> Dict[str, float]:
+    from app.order_export import stream_export
+
+    tracemalloc.reset_peak()
+    baseline, _peak = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    first_chunk = None
+    produced = 0
+    async for chunk in stream_export(user_id, fmt, gzip):
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - started
+        produced += len(chunk)
+    elapsed = time.perf_counter() - started
+    _current, peak = tracemalloc.get_traced_memory()
+    return {
+        "peak_memory_mb": (peak - baseline) / 2**20,
+        "bytes": produced,
+        "seconds": elapsed,
+        "first_chunk_ms": (first_chunk or 0.0) * 1000,
+    }
+
+
+async def _measure_materialized(user_id: int) -> Dict[str, float]:
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from sqlalchemy.orm import selectinload
+
+    from app import models, schemas
+    from app.database import async_session_maker
+
+    adapter = TypeAdapter(List[schemas.SearchOrderOut])
+    tracemalloc.reset_peak()
+    baseline, _peak = tracemalloc.get_traced_memory()
+    started = time.perf_counter()
+    async with async_session_maker() as session:
+        orders = (
+            await session.execute(
+                select(models.SearchOrder)
+                .options(selectinload(models.SearchOrder.results))
+                .where(models.SearchOrder.user_id == user_id)
+            )
+        ).scalars().all()
+        body = adapter.dump_json(adapter.validate_python(orders, from_attributes=True))
+    elapsed = time.perf_counter() - started
+    _current, peak = tracemalloc.get_traced_memory()
+    return {"peak_memory_mb": (peak - baseline) / 2**20, "bytes": len(body), "seconds": elapsed}
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    from app import models  # noqa: F401  (registers the tables for init_db)
+    from app.database import engine, init_db
+
+    sizes = [int(size) for size in args.results.split(",")]
+    runs: List[dict] = []
+    try:
+        await init_db()
+        users = {size: await _seed(size, args.results_per_order) for size in sizes}
+        tracemalloc.start()
+        for size in sizes:
+            run: Dict[str, object] = {"results": size, "orders": max(1, size // args.results_per_order)}
+            stream = await _measure_stream(users[size], args.format, args.gzip)
+            stream["rows_per_s"] = size / stream["seconds"] if stream["seconds"] else 0.0
+            run["stream"] = stream
+            if args.materialize:
+                run["materialized"] = await _measure_materialized(users[size])
+            runs.append(run)
+        tracemalloc.stop()
+    finally:
+        # aiosqlite connection threads would otherwise keep the process alive
+        await engine.dispose()
+
+    peaks = [run["stream"]["peak_memory_mb"] for run in runs]
+    return {
+        "format": args.format,
+        "gzip": args.gzip,
+        "runs": runs,
+        # ~1.0 means the export's memory does not grow with the history
+        "peak_ratio_largest_to_smallest": peaks[-1] / peaks[0] if peaks[0] else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--results", default="10000,100000", help="comma-separated result counts, one user each")
+    parser.add_argument("--results-per-order", type=int, default=4)
+    parser.add_argument("--format", choices=["csv", "ndjson"], default="csv")
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--materialize", action="store_true", help="also measure loading everything at once")
+    parser.add_argument(
+        "--max-peak-mb", type=float, default=16.0, help="fail if the largest size's streaming peak exceeds this"
+    )
+    args = parser.parse_args()
+
+    configure_environment()
+    result = asyncio.run(_run(args))
+    print(json.dumps(result, indent=2))
+    largest = max(result["runs"], key=lambda run: run["results"])
+    peak = largest["stream"]["peak_memory_mb"]
+    if peak > args.max_peak_mb:
+        print(
+            f"Streaming peak of {peak:.1f} MB for {largest['results']} results exceeds {args.max_peak_mb} MB",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
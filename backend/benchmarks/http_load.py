@@ -0,0 +1,338 @@
+"""
+HTTP load benchmark for the FastAPI application.
+
+Seeds a database with users, orders and results, then drives
+``create_app()`` with concurrent requests for each scenario and reports
+latency percentiles and throughput as JSON.  By default requests go
+through ``httpx.ASGITransport`` in-process, which isolates application
+cost from networking; ``--socket`` instead starts Uvicorn in a
+subprocess and measures over a real TCP connection.
+
+The database defaults to a temporary SQLite file; pass
+``--database-url`` (or set ``DATABASE_URL``) to run against PostgreSQL.
+Scenarios:
+
+* ``register_login`` — register a new user, then log in (bcrypt bound)
+* ``list_orders`` — ``GET /orders/`` for the user with the large history
+* ``order_detail`` — ``GET /orders/{id}`` for random completed orders
+* ``order_detail_304`` — the same with a matching ``If-None-Match``
+* ``internal_results`` — ``POST /internal/search_results``
+* ``webhook_burst`` — signed ``checkout.session.completed`` events
+
+Usage::
+
+    python -m benchmarks.http_load --requests 500 --concurrency 32 --output bench.json
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from . import configure_environment, summarize
+
+
+INTERNAL_KEY = "benchmark-internal-key"
+WEBHOOK_SECRET = "whsec_benchmark"
+PASSWORD = "benchmark-password"
+
+Scenario = Callable[[httpx.AsyncClient, int], Awaitable[httpx.Response]]
+
+
+async def seed(users: int, heavy_orders: int, orders_per_user: int, results_per_order: int) -> Dict[str, Any]:
+    """Populate the database and return identifiers used by the scenarios."""
+    from sqlalchemy import insert, select
+
+    from app import models
+    from app.database import async_session_maker, init_db
+    from app.utils import security
+
+    await init_db()
+    password_hash = security.get_password_hash(PASSWORD)
+    run_tag = f"{int(time.time())}{random.randint(0, 9999)}"
+    async with async_session_maker() as session:
+        user_ids = []
+        for index in range(users):
+            user = models.User(email=f"bench-{run_tag}-{index}@example.com", password_hash=password_hash)
+            session.add(user)
+            await session.flush()
+            user_ids.append(user.id)
+        now = datetime.utcnow()
+        order_rows = []
+        for index, user_id in enumerate(user_ids):
+            count = heavy_orders if index == 0 else orders_per_user
+            for number in range(count):
+                order_rows.append(
+                    {
+                        "user_id": user_id,
+                        "status": models.OrderStatus.COMPLETED_FAILURE,
+                        "order_price": 49.9,
+                        "target_name": f"Pessoa {number} da Silva",
+                        "target_city": "São Paulo",
+                        "target_state": "SP",
+                        "target_dob_approx": "1920",
+                        "created_at": now,
+                        "completed_at": now,
+                    }
+                )
+        for start in range(0, len(order_rows), 1000):
+            await session.execute(insert(models.SearchOrder), order_rows[start : start + 1000])
+        order_ids = (
+            await session.execute(
+                select(models.SearchOrder.id).where(models.SearchOrder.user_id.in_(user_ids))
+            )
+        ).scalars().all()
+        result_rows = [
+            {
+                "order_id": order_id,
+                "source_name": f"Fonte {n}",
+                "status": models.ResultStatus.NOT_FOUND,
+                "details": "Nenhum registro correspondente encontrado.",
+                "timestamp": now,
+            }
+            for order_id in order_ids
+            for n in range(results_per_order)
+        ]
+        for start in range(0, len(result_rows), 1000):
+            await session.execute(insert(models.SearchResult), result_rows[start : start + 1000])
+        pending = models.SearchOrder(
+            user_id=user_ids[-1], order_price=49.9, target_name="Webhook Target", status=models.OrderStatus.PENDING_PAYMENT
+        )
+        session.add(pending)
+        await session.commit()
+        tokens = [security.create_access_token(data={"user_id": user_id}) for user_id in user_ids]
+    return {
+        "run_tag": run_tag,
+        "tokens": tokens,
+        "order_ids": list(order_ids),
+        "heavy_order_ids": [oid for oid in order_ids][:heavy_orders],
+        "webhook_order_id": pending.id,
+    }
+
+
+def _signed_webhook(event_id: str, order_id: int) -> Tuple[bytes, Dict[str, str]]:
+    event = {
+        "id": event_id,
+        "object": "event",
+        "type": "checkout.session.completed",
+        "created": int(time.time()),
+        "data": {"object": {"id": f"cs_{event_id}", "object": "checkout.session", "metadata": {"order_id": str(order_id)}}},
+    }
+    payload = json.dumps(event)
+    timestamp = int(time.time())
+    signature = hmac.new(WEBHOOK_SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    headers = {"Stripe-Signature": f"t={timestamp},v1={signature}", "Content-Type": "application/json"}
+    return payload.encode(), headers
+
+
+def build_scenarios(data: Dict[str, Any]) -> Dict[str, Scenario]:
+    heavy_auth = {"Authorization": f"Bearer {data['tokens'][0]}"}
+    detail_etags: Dict[int, str] = {}
+    new_users = itertools.count()
+    webhook_events = itertools.count()
+
+    async def register_login(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        email = f"new-{data['run_tag']}-{next(new_users)}@example.com"
+        response = await client.post("/auth/register", json={"email": email, "password": PASSWORD})
+        if response.status_code != 201:
+            return response
+        return await client.post("/auth/login", data={"username": email, "password": PASSWORD})
+
+    async def list_orders(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        return await client.get("/orders/", headers=heavy_auth)
+
+    async def order_detail(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        order_id = random.choice(data["heavy_order_ids"])
+        response = await client.get(f"/orders/{order_id}", headers=heavy_auth)
+        if "etag" in response.headers:
+            detail_etags[order_id] = response.headers["etag"]
+        return response
+
+    async def order_detail_304(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        order_id = random.choice(data["heavy_order_ids"])
+        headers = dict(heavy_auth)
+        if order_id in detail_etags:
+            headers["If-None-Match"] = detail_etags[order_id]
+        response = await client.get(f"/orders/{order_id}", headers=headers)
+        if "etag" in response.headers:
+            detail_etags[order_id] = response.headers["etag"]
+        return response
+
+    async def internal_results(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        return await client.post(
+            "/internal/search_results",
+            headers={"X-Api-Key": INTERNAL_KEY},
+            json={"order_id": random.choice(data["order_ids"]), "source_name": "Benchmark", "status": "NOT_FOUND"},
+        )
+
+    async def webhook_burst(client: httpx.AsyncClient, i: int) -> httpx.Response:
+        payload, headers = _signed_webhook(f"evt_{data['run_tag']}_{next(webhook_events)}", data["webhook_order_id"])
+        return await client.post("/webhooks/stripe", content=payload, headers=headers)
+
+    return {
+        "register_login": register_login,
+        "list_orders": list_orders,
+        "order_detail": order_detail,
+        "order_detail_304": order_detail_304,
+        "internal_results": internal_results,
+        "webhook_burst": webhook_burst,
+    }
+
+
+async def run_scenario(client: httpx.AsyncClient, scenario: Scenario, requests: int, concurrency: int) -> Dict[str, Any]:
+    """Issue ``requests`` calls with ``concurrency`` workers and summarise them."""
+    samples: List[int] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(requests))
+
+    async def worker() -> None:
+        for i in counter:
+            start = time.perf_counter_ns()
+            try:
+                response = await scenario(client, i)
+                key = str(response.status_code)
+            except httpx.HTTPError as exc:
+                key = type(exc).__name__
+            samples.append(time.perf_counter_ns() - start)
+            statuses[key] = statuses.get(key, 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stats = summarize(samples)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "elapsed_s": elapsed,
+        "rps": requests / elapsed if elapsed else 0.0,
+        "p50_ms": stats["p50_us"] / 1000,
+        "p95_ms": stats["p95_us"] / 1000,
+        "p99_ms": stats["p99_us"] / 1000,
+        "mean_ms": stats["mean_us"] / 1000,
+        "statuses": statuses,
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_for_server(base_url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError("Uvicorn exited before accepting connections")
+            try:
+                await client.get("/docs")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("Uvicorn did not start in time")
+
+
+async def _run(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.database import engine
+
+    data = await seed(args.users, args.heavy_orders, args.orders_per_user, args.results_per_order)
+    scenarios = build_scenarios(data)
+    selected = args.scenarios or list(scenarios)
+    process: Optional[subprocess.Popen] = None
+    app = None
+    if args.socket:
+        port = _free_port()
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+            env=dict(os.environ),
+        )
+        base_url = f"http://127.0.0.1:{port}"
+        await _wait_for_server(base_url, process)
+        client = httpx.AsyncClient(base_url=base_url, limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        from app.main import create_app
+
+        app = create_app()
+        await app.router.startup()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    results: Dict[str, Any] = {}
+    try:
+        async with client:
+            for name in selected:
+                # Warm up connections and caches before measuring
+                await run_scenario(client, scenarios[name], min(args.concurrency, args.requests), args.concurrency)
+                results[name] = await run_scenario(client, scenarios[name], args.requests, args.concurrency)
+    finally:
+        if app is not None:
+            await app.router.shutdown()
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        await engine.dispose()
+    return results
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--database-url", default="")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--heavy-orders", type=int, default=500, help="orders of the user used by list_orders")
+    parser.add_argument("--orders-per-user", type=int, default=10)
+    parser.add_argument("--results-per-order", type=int, default=3)
+    parser.add_argument("--requests", type=int, default=300, help="measured requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--scenarios", nargs="*", help="subset of scenarios to run")
+    parser.add_argument("--socket", action="store_true", help="benchmark a Uvicorn subprocess over TCP")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ["DATABASE_URL"] = args.database_url
+    configure_environment()
+    os.environ.setdefault("INTERNAL_API_KEY", INTERNAL_KEY)
+    os.environ.setdefault("STRIPE_WEBHOOK_SECRET", WEBHOOK_SECRET)
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+
+    results = asyncio.run(_run(args))
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "mode": "socket" if args.socket else "asgi",
+        "database": os.environ["DATABASE_URL"].split("://", 1)[0],
+        "parameters": {
+            key: getattr(args, key)
+            for key in ("users", "heavy_orders", "orders_per_user", "results_per_order", "requests", "concurrency", "bcrypt_rounds")
+        },
+        "scenarios": results,
+    }
+    output = json.dumps(report, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fh:
+            fh.write(output)
+
+
+if __name__ == "__main__":
+    main()
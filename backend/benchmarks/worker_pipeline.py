@@ -0,0 +1,335 @@
+"""
+Throughput of the search worker pipeline with simulated sources.
+
+Replaces the configured search sources with ``SimulatedSource``
+instances whose latency, failure and unavailability rates and rate
+limits are configurable, then pushes N paid orders through the real
+``tasks._process_search_order`` path (source calls, result persistence,
+order completion and email publication) against a local database.
+Orders run concurrently up to ``--concurrency``, like a worker pool.
+
+Reported per run: orders per second, per-order latency percentiles,
+database round trips per order (``before_cursor_execute`` events) and
+peak traced Python memory.  With ``--virtual-time`` the run uses
+``app.robots.clock.VirtualTimeEventLoop``: source latencies cost no
+real time, throughput and latencies are reported in simulated time and
+``wall_s`` shows how long the run actually took.
+
+Each ``--source`` is ``NAME[,key=value...]`` with the keys:
+
+* ``median_ms`` / ``p99_ms`` — log-normal latency (``p99_ms`` equal to
+  ``median_ms`` gives a constant latency)
+* ``found`` — probability of a FOUND result
+* ``states`` — ``|``-separated target states the source can find
+  certificates for (default: all)
+* ``fail`` — probability of an ERROR result
+* ``unavailable`` — probability of SOURCE_UNAVAILABLE
+* ``rate`` — requests per second allowed to the source (0: unlimited)
+* ``concurrency`` — simultaneous requests allowed (0: unlimited)
+
+Usage::
+
+    python -m benchmarks.worker_pipeline --orders 200 --concurrency 16 \\
+        --source "RegistroCivil,median_ms=100,p99_ms=800,found=0.3,rate=20" \\
+        --source "TJSP,median_ms=150,unavailable=0.2"
+
+Orders get a random target state from ``--states``.  Source calls per
+order and time to first hit show the effect of the source scheduler;
+compare runs with ``--no-scheduler`` and ``--stop-on-first-hit``.
+
+``--check-virtual-time`` runs the orders in virtual time against
+sources with production-like latencies and rate limits (seconds per
+call, minutes for the whole run) and exits with status 1 if any order
+fails, if the run takes more than ``--max-wall-seconds`` of real time
+or if simulated time did not run ahead of the wall clock, so it can
+guard ``VirtualTimeEventLoop`` against regressions::
+
+    python -m benchmarks.worker_pipeline --check-virtual-time --orders 200
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from . import configure_environment, summarize
+
+
+DEFAULT_SOURCES = (
+    "RegistroCivil.org.br,median_ms=100,p99_ms=400,found=0.3",
+    "FamilySearch.org,median_ms=200,p99_ms=1200,found=0.1,fail=0.02",
+    "TJSP Portal,median_ms=150,p99_ms=600,found=0.5,unavailable=0.2,states=SP",
+)
+
+# Latencies and limits close to the real sources, for --check-virtual-time
+REALISTIC_SOURCES = (
+    "RegistroCivil.org.br,median_ms=1000,p99_ms=8000,found=0.3,rate=2",
+    "FamilySearch.org,median_ms=2000,p99_ms=15000,found=0.1,fail=0.02,concurrency=4",
+    "TJSP Portal,median_ms=1500,p99_ms=6000,found=0.5,unavailable=0.2,states=SP",
+)
+
+# z-score of the 99th percentile of the standard normal distribution
+_Z99 = 2.326
+
+
+@dataclass
+class SourceSpec:
+    """Behaviour of one simulated source."""
+
+    name: str
+    median_ms: float = 100.0
+    p99_ms: Optional[float] = None
+    found: float = 0.0
+    fail: float = 0.0
+    unavailable: float = 0.0
+    rate: float = 0.0
+    concurrency: int = 0
+    states: Tuple[str, ...] = ()
+
+    @classmethod
+    def parse(cls, spec: str) -> "SourceSpec":
+        name, *options = [part.strip() for part in spec.split(",")]
+        values: Dict[str, object] = {}
+        for option in options:
+            key, _, value = option.partition("=")
+            if key not in cls.__dataclass_fields__ or key == "name":
+                raise ValueError(f"unknown source option {key!r} in {spec!r}")
+            if key == "states":
+                values[key] = tuple(value.split("|"))
+            else:
+                values[key] = int(value) if key == "concurrency" else float(value)
+        return cls(name=name, **values)
+
+    def latency(self, rng: random.Random) -> float:
+        """Draw a latency in seconds."""
+        median = self.median_ms / 1000
+        p99 = (self.p99_ms or self.median_ms) / 1000
+        if p99 <= median:
+            return median
+        sigma = math.log(p99 / median) / _Z99
+        return rng.lognormvariate(math.log(median), sigma)
+
+
+class _TokenBucket:
+    """Delays callers so that at most ``rate`` calls start per second."""
+
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate
+        self.next_slot = 0.0
+
+    async def acquire(self) -> None:
+        from app.robots import clock
+
+        now = clock.now()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+
+class Observations:
+    """Per-order measurements collected by the simulated sources."""
+
+    def __init__(self) -> None:
+        self.started: Dict[int, float] = {}
+        self.first_hit: Dict[int, float] = {}
+        self.calls = 0
+
+
+def make_source_factory(spec: SourceSpec, rng: random.Random, observations: Observations):
+    """Return a factory of ``SearchSource`` instances sharing rate limits."""
+    from app import models
+    from app.robots import clock
+    from app.robots.base import SearchSource
+
+    bucket = _TokenBucket(spec.rate) if spec.rate > 0 else None
+    slots = asyncio.Semaphore(spec.concurrency) if spec.concurrency > 0 else None
+
+    class SimulatedSource(SearchSource):
+        name = spec.name
+
+        async def search(self, order: models.SearchOrder) -> models.SearchResult:
+            observations.calls += 1
+            if slots is not None:
+                await slots.acquire()
+            try:
+                if bucket is not None:
+                    await bucket.acquire()
+                await clock.sleep(spec.latency(rng))
+            finally:
+                if slots is not None:
+                    slots.release()
+            draw = rng.random()
+            if draw < spec.fail:
+                status = models.ResultStatus.ERROR
+            elif draw < spec.fail + spec.unavailable:
+                status = models.ResultStatus.SOURCE_UNAVAILABLE
+            elif draw < spec.fail + spec.unavailable + spec.found and (
+                not spec.states or order.target_state in spec.states
+            ):
+                status = models.ResultStatus.FOUND
+                if order.id not in observations.first_hit:
+                    observations.first_hit[order.id] = clock.now() - observations.started[order.id]
+            else:
+                status = models.ResultStatus.NOT_FOUND
+            return models.SearchResult(
+                order_id=order.id,
+                source_name=self.name,
+                status=status,
+                details=f"Resultado simulado ({status.value}).",
+            )
+
+    return SimulatedSource
+
+
+async def _seed_orders(count: int, states: List[str], rng: random.Random) -> List[int]:
+    from sqlalchemy import insert, select
+
+    from app import models
+    from app.database import async_session_maker, init_db
+
+    await init_db()
+    async with async_session_maker() as session:
+        user = models.User(email=f"pipeline-{time.time_ns()}@example.com", password_hash="x")
+        session.add(user)
+        await session.flush()
+        rows = [
+            {
+                "user_id": user.id,
+                "status": models.OrderStatus.PROCESSING,
+                "order_price": 49.9,
+                "target_name": f"Pessoa {n}",
+                "target_state": rng.choice(states),
+            }
+            for n in range(count)
+        ]
+        await session.execute(insert(models.SearchOrder), rows)
+        order_ids = (
+            await session.execute(select(models.SearchOrder.id).where(models.SearchOrder.user_id == user.id))
+        ).scalars().all()
+        await session.commit()
+    return list(order_ids)
+
+
+async def _run(args: argparse.Namespace) -> dict:
+    from sqlalchemy import event
+
+    from app.database import engine
+    from app.robots import clock, search_robot
+    from app.tasks import _process_search_order
+
+    rng = random.Random(args.seed)
+    specs = [SourceSpec.parse(spec) for spec in (args.source or DEFAULT_SOURCES)]
+    observations = Observations()
+    search_robot.register_sources([make_source_factory(spec, rng, observations) for spec in specs])
+    order_ids = await _seed_orders(args.orders, args.states.split(","), rng)
+
+    round_trips = 0
+
+    def _count(*_args) -> None:
+        nonlocal round_trips
+        round_trips += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _count)
+    limit = asyncio.Semaphore(args.concurrency)
+    samples: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async def process(order_id: int) -> None:
+        async with limit:
+            start = observations.started[order_id] = clock.now()
+            try:
+                await _process_search_order(order_id)
+            except Exception as exc:
+                errors[type(exc).__name__] = errors.get(type(exc).__name__, 0) + 1
+            samples.append(clock.now() - start)
+
+    tracemalloc.start()
+    wall_started = time.perf_counter()
+    started = clock.now()
+    await asyncio.gather(*(process(order_id) for order_id in order_ids))
+    elapsed = clock.now() - started
+    wall = time.perf_counter() - wall_started
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    event.remove(engine.sync_engine, "before_cursor_execute", _count)
+    search_robot.reset_sources()
+    await engine.dispose()
+
+    stats = summarize([int(sample * 1e9) for sample in samples])
+    hits = sorted(observations.first_hit.values())
+    return {
+        "orders": args.orders,
+        "concurrency": args.concurrency,
+        "sources": [spec.__dict__ for spec in specs],
+        "virtual_time": args.virtual_time,
+        "elapsed_s": elapsed,
+        "wall_s": wall,
+        "orders_per_s": args.orders / elapsed if elapsed else 0.0,
+        "latency_ms": {key.replace("_us", ""): value / 1000 for key, value in stats.items() if key.endswith("_us")},
+        "source_calls_per_order": observations.calls / args.orders if args.orders else 0.0,
+        "orders_with_hit": len(hits),
+        "time_to_first_hit_ms": {
+            "mean": sum(hits) / len(hits) * 1000 if hits else None,
+            "p50": hits[len(hits) // 2] * 1000 if hits else None,
+        },
+        "db_round_trips_per_order": round_trips / args.orders if args.orders else 0.0,
+        "peak_memory_mb": peak / 2**20,
+        "errors": errors,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16, help="orders processed at the same time")
+    parser.add_argument("--source", action="append", help="simulated source spec (repeatable)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--virtual-time", action="store_true", help="simulate source latencies in virtual time")
+    parser.add_argument("--states", default="SP,RJ,MG,PR,RS", help="comma-separated target states of the orders")
+    parser.add_argument("--no-scheduler", action="store_true", help="query sources in the configured order")
+    parser.add_argument("--stop-on-first-hit", action="store_true")
+    parser.add_argument("--scheduler-refresh", type=int, default=1, help="seconds between rollup reloads")
+    parser.add_argument(
+        "--check-virtual-time", action="store_true", help="check that realistic sources run fast in virtual time"
+    )
+    parser.add_argument("--max-wall-seconds", type=float, default=60.0, help="real-time limit of the check")
+    args = parser.parse_args()
+    if args.check_virtual_time:
+        args.virtual_time = True
+        args.source = args.source or list(REALISTIC_SOURCES)
+
+    os.environ["SOURCE_SCHEDULER_ENABLED"] = "0" if args.no_scheduler else "1"
+    os.environ["SEARCH_STOP_ON_FIRST_HIT"] = "1" if args.stop_on_first_hit else "0"
+    os.environ["SOURCE_SCHEDULER_REFRESH_SECONDS"] = str(args.scheduler_refresh)
+
+    configure_environment()
+    from app.robots import clock
+
+    result = clock.run(_run(args), virtual=args.virtual_time)
+    print(json.dumps(result, indent=2))
+    if not args.check_virtual_time:
+        return
+    problems = []
+    if result["errors"]:
+        problems.append(f"orders failed: {result['errors']}")
+    if result["wall_s"] > args.max_wall_seconds:
+        problems.append(f"took {result['wall_s']:.1f} s of real time, more than {args.max_wall_seconds} s")
+    if result["elapsed_s"] <= result["wall_s"]:
+        problems.append(
+            f"simulated {result['elapsed_s']:.1f} s in {result['wall_s']:.1f} s of real time; virtual time did not advance"
+        )
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
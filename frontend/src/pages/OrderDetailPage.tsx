@@ -62,6 +62,14 @@ const StatusChip = ({ status }: { status: string }) => {
       color = 'error';
       label = 'Erro na Busca';
       break;
+    case 'NOT_APPLICABLE':
+      color = 'default';
+      label = 'Não Aplicável';
+      break;
+    case 'SKIPPED':
+      color = 'default';
+      label = 'Não Consultada';
+      break;
   }
 
   return <Chip label={label} color={color} size="small" />;